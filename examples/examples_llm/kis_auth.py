@@ -4,6 +4,7 @@
 
 import asyncio
 import copy
+import functools
 import json
 import logging
 import os
@@ -12,7 +13,6 @@ from base64 import b64decode
 from collections import namedtuple
 from collections.abc import Callable
 from datetime import datetime
-from io import StringIO
 import pandas as pd
 import requests
 import websockets
@@ -590,12 +590,22 @@ def system_resp(data):
     return nt2(**d)
 
 
+@functools.lru_cache(maxsize=64)
+def _ecb_cipher(key, iv):
+    # tr_id 별 key / iv 는 구독 응답 이후 변하지 않으므로 한 번만 인코딩하고 cipher 를 재사용 (ECB 는 체이닝 상태가 없음)
+    return AES.new(key.encode("utf-8"), AES.MODE_ECB), iv.encode("utf-8")
+
+
 def aes_cbc_base64_dec(key, iv, cipher_text):
     if key is None or iv is None:
         raise AttributeError("key and iv cannot be None")
 
-    cipher = AES.new(key.encode("utf-8"), AES.MODE_CBC, iv.encode("utf-8"))
-    return bytes.decode(unpad(cipher.decrypt(b64decode(cipher_text)), AES.block_size))
+    # CBC 복호화 = ECB 복호화 xor (iv + 이전 암호 블록)
+    ecb, iv_bytes = _ecb_cipher(key, iv)
+    ct = b64decode(cipher_text)
+    pt = ecb.decrypt(ct)
+    pt = (int.from_bytes(pt, "big") ^ int.from_bytes(iv_bytes + ct[:-AES.block_size], "big")).to_bytes(len(pt), "big")
+    return bytes.decode(unpad(pt, AES.block_size))
 
 
 #####
@@ -647,12 +657,27 @@ def add_data_map(
         data_map[tr_id]["iv"] = iv
 
 
+def parse_records(d: str, columns: list) -> list[tuple]:
+    """'^' 로 구분된 실시간 데이터를 레코드(tuple) 리스트로 변환 (여러 건인 경우 columns 개수 단위로 분할)"""
+    fields = d.split("^")
+    n = len(columns)
+    if not n or len(fields) % n:
+        raise ValueError(f"columns mismatch: {len(fields)} fields, {n} columns")
+    if len(fields) == n:
+        return [tuple(fields)]
+    return [tuple(fields[i:i + n]) for i in range(0, len(fields), n)]
+
+
 class KISWebSocket:
     api_url: str = ""
     on_result: Callable[
         [websockets.ClientConnection, str, pd.DataFrame, dict], None
     ] = None
     result_all_data: bool = False
+    # "df": pd.DataFrame / "records": list[tuple] (DataFrame 생성 없음, 컬럼 순서는 data_map[tr_id]["columns"])
+    result_format: str = "df"
+    # "df" 인 경우 tr_id 별로 batch_size 건의 메시지를 모아 하나의 DataFrame 으로 전달
+    batch_size: int = 1
 
     retry_count: int = 0
     amx_retries: int = 0
@@ -661,17 +686,18 @@ class KISWebSocket:
     def __init__(self, api_url: str, max_retries: int = 3):
         self.api_url = api_url
         self.max_retries = max_retries
+        self._batches: dict[str, list] = {}
 
     # private
     async def __subscriber(self, ws: websockets.ClientConnection):
         async for raw in ws:
-            logging.info("received message >> %s" % raw)
+            logging.info("received message >> %s", raw)
             show_result = False
 
-            df = pd.DataFrame()
+            records = []
 
             if raw[0] in ["0", "1"]:
-                d1 = raw.split("|")
+                d1 = raw.split("|", 3)
                 if len(d1) < 4:
                     raise ValueError("data not found...")
 
@@ -685,10 +711,7 @@ class KISWebSocket:
                 if raw[0] == "1":
                     d = aes_cbc_base64_dec(dm["key"], dm["iv"], d)
 
-                df = pd.read_csv(
-                    StringIO(d), header=None, sep="^", names=dm["columns"], dtype=object,
-                    on_bad_lines='error'   # raise if columns mismatch
-                )
+                records = parse_records(d, dm["columns"])  # raise if columns mismatch
 
                 show_result = True
 
@@ -709,7 +732,24 @@ class KISWebSocket:
                     show_result = True
 
             if show_result is True and self.on_result is not None:
-                self.on_result(ws, tr_id, df, data_map[tr_id])
+                self.__emit(ws, tr_id, records)
+
+    def __emit(self, ws: websockets.ClientConnection, tr_id: str, records: list[tuple]):
+        dm = data_map[tr_id]
+        if self.result_format == "records":
+            self.on_result(ws, tr_id, records, dm)
+            return
+
+        if records and self.batch_size > 1:
+            batch = self._batches.setdefault(tr_id, [])
+            batch.append(records)
+            if len(batch) < self.batch_size:
+                return
+            records = [r for msg in batch for r in msg]
+            batch.clear()
+
+        df = pd.DataFrame(records, columns=dm["columns"], dtype=object) if records else pd.DataFrame()
+        self.on_result(ws, tr_id, df, dm)
 
     async def __runner(self):
         if len(open_map.keys()) > 40:
@@ -795,9 +835,15 @@ class KISWebSocket:
                 [websockets.ClientConnection, str, pd.DataFrame, dict], None
             ],
             result_all_data: bool = False,
+            result_format: str = "df",
+            batch_size: int = 1,
     ):
+        if result_format not in ("df", "records"):
+            raise ValueError("result_format must be 'df' or 'records'")
         self.on_result = on_result
         self.result_all_data = result_all_data
+        self.result_format = result_format
+        self.batch_size = batch_size
         try:
             asyncio.run(self.__runner())
         except KeyboardInterrupt:
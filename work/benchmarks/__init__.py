@@ -0,0 +1,2 @@
+# benchmarks and checks of core modules, not imported by core or app
+# run from work/: python -m benchmarks.<module>
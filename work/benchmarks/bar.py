@@ -0,0 +1,101 @@
+# raw bar store check: python -m benchmarks.bar (from work/)
+import random
+import time
+from datetime import datetime, timedelta
+
+from core.model.bar import RawBars, BarBuilder, BarList, BarEngine
+
+
+if __name__ == "__main__":
+    N = 12*3600 # a whole day of seconds
+    t0 = datetime(2026, 1, 5, 8, 0, 0)
+    ticks = []
+    price = 70000
+    for i in range(N):
+        price += random.choice((-100, 0, 100))
+        ticks.append((price, random.randint(1, 50), t0 + timedelta(seconds=i, microseconds=1000)))
+
+    for retention in (N, N//4):
+        raw_bars = RawBars(retention=retention)
+        builder = BarBuilder(raw_bars)
+        start = time.perf_counter()
+        for p, q, t in ticks:
+            raw_bars.update(p, q, t)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        builder.reset(20)
+        reset = time.perf_counter() - start
+        print(f"retention {retention:>6}: update {elapsed / N * 1e6:.2f} us/tick, kept {len(raw_bars)}, dropped {raw_bars.dropped}, "
+              f"{raw_bars.data.nbytes / 1e6:.1f} MB, BarBuilder.reset {reset * 1000:.1f} ms ({len(builder.bars)} bars)")
+
+    # the same bars as built on the fly
+    raw_bars = RawBars()
+    live = BarBuilder(raw_bars)
+    for p, q, t in ticks:
+        raw_bars.update(p, q, t)
+    rebuilt = BarBuilder(raw_bars)
+    rebuilt.reset(BarBuilder.BAR_BUILD_DELTA_SEC)
+    assert live.bars == rebuilt.bars and len(live.bars) == N // BarBuilder.BAR_BUILD_DELTA_SEC - 1
+    assert raw_bars.view('volume').sum() + raw_bars._cur_volume == sum(q for _, q, _ in ticks)
+
+
+    # agents A1 (bar_delta 1) and A2 (bar_delta 5) on one code: a chain per strategy vs a shared engine
+    ticks = [(p, q, t + timedelta(milliseconds=k*300)) for p, q, t in ticks[:3600] for k in range(3)]
+    def per_strategy():
+        chains = []
+        for bar_delta in (1, 5):
+            raw_bars = RawBars()
+            builder = BarBuilder(raw_bars)
+            builder.reset(bar_delta)
+            chains.append((raw_bars, BarList(builder)))
+        for p, q, t in ticks:
+            for raw_bars, _ in chains: # every agent gets the tick
+                raw_bars.update(p, q, t)
+        return [barlist.bar_builder.bars for _, barlist in chains]
+
+    def shared():
+        BarEngine._engines.clear()
+        engine = BarEngine.get('005930')
+        barlists = []
+        for agent_id, bar_delta in (('A1', 1), ('A2', 5)):
+            engine.attach(agent_id)
+            barlists.append(BarList(engine.builder(bar_delta)))
+        for p, q, t in ticks:
+            for agent_id in ('A1', 'A2'):
+                engine.update(agent_id, p, q, t)
+        return [barlist.bar_builder.bars for barlist in barlists]
+
+    for name, fn in (("bar chain per strategy", per_strategy), ("shared BarEngine", shared)):
+        start = time.perf_counter()
+        bars = fn()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<24} {elapsed / len(ticks) * 1e6:.2f} us/tick (2 agents), bars {[len(b) for b in bars]}")
+    assert per_strategy() == shared()
+
+    # the feeder stalls (A1 gets nothing for a while, then its backlog), then detaches: the bars are the same
+    BarEngine._engines.clear()
+    engine = BarEngine.get('005930')
+    for agent_id in ('A1', 'A2'):
+        engine.attach(agent_id)
+    barlist = BarList(engine.builder(5))
+    stall = range(len(ticks)//3, len(ticks)//2)
+    for i, (p, q, t) in enumerate(ticks):
+        if i == stall.stop:
+            for k in stall: # backlog delivered late
+                engine.update('A1', *ticks[k])
+        if i not in stall:
+            engine.update('A1', p, q, t)
+        engine.update('A2', p, q, t)
+        if i == 2*len(ticks)//3:
+            engine.detach('A1')
+    assert barlist.bar_builder.bars == shared()[1]
+
+    # marks are kept per BarList on shared bars
+    class Event:
+        def __init__(self, name):
+            self.price_event = self.volume_event = self.barlist_event = name
+    barlists = [BarList(engine.builder(5)) for _ in range(2)]
+    for i, bl in enumerate(barlists):
+        bl.mark_on_barlist(Event(f"A{i+1}"), status=f"A{i+1}")
+    assert [bl.marked_barlist[-1].barlist_event for bl in barlists] == ['A1', 'A2'] and barlist.barlist[-1].barlist_event is None
+    print("feeder handover / per BarList marks: ok")
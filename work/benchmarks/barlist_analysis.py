@@ -0,0 +1,40 @@
+# rolling stats check: python -m benchmarks.barlist_analysis (from work/)
+import random
+import time
+from datetime import datetime, timedelta
+
+from core.model.bar import RawBars, BarBuilder, BarList
+from core.model.barlist_analysis import BarListAnalysis, AnalysisTarget
+
+
+if __name__ == "__main__":
+    N = 20000 # bar closes
+    t0 = datetime(2026, 1, 5, 8, 0, 0)
+    price = 70000
+    ticks = []
+    for i in range(N + 1):
+        price += random.choice((-100, 0, 100))
+        ticks.append((price, random.randint(0, 50), t0 + timedelta(seconds=i)))
+
+    def analyze(bars):
+        return [f(bars, attr) for f in (BarListAnalysis.get_last_to_avg, BarListAnalysis.get_shifted_trend) for attr in AnalysisTarget]
+
+    for num_bar in (50, 100, 1000, 5000):
+        results = {}
+        for name in ('list[Bar]', 'BarList'):
+            builder = BarBuilder(RawBars())
+            builder.reset(1)
+            barlist = BarList(builder)
+            barlist.reset(num_bar)
+            out = []
+            if name == 'BarList':
+                barlist.on_barlist_update = lambda: out.append(analyze(barlist) + [barlist.min('close'), barlist.max('volume')])
+            else:
+                barlist.on_barlist_update = lambda: out.append(analyze(barlist.barlist) + [min(b.close for b in barlist.barlist), max(b.volume for b in barlist.barlist)])
+            start = time.perf_counter()
+            for p, q, t in ticks:
+                builder.raw_bars.update(p, q, t)
+            results[name] = (time.perf_counter() - start, out)
+        (t_list, out_list), (t_roll, out_roll) = results.values()
+        assert out_list == out_roll
+        print(f"num_bar {num_bar:>5}: list[Bar] {t_list / N * 1e6:>8.1f} us/bar, BarList {t_roll / N * 1e6:>5.1f} us/bar")
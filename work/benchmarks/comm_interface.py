@@ -0,0 +1,72 @@
+# fan-out benchmark: python -m benchmarks.comm_interface (from work/)
+import asyncio
+import time
+
+from core.comm.comm_interface import AgentSession, OM_Dispatch, SendQueue, TickBoard
+from core.comm.wire_codec import BinaryCodec
+from core.kis.ws_data import TransactionPrices
+
+
+if __name__ == "__main__":
+    N_TICKS = 2000
+    trp = TransactionPrices(1, '^'.join(['005930', '090000', '70000'] + ['0']*9 + ['3'] + ['0']*(TransactionPrices.n_cols-13)))
+
+    # producer: time spent in the market data path per tick, writers excluded
+    async def bench_per_agent(n_agents): # previous path: encode and queue per agent
+        agents = [AgentSession(id=f'A{i}', code='005930', codec=BinaryCodec) for i in range(n_agents)]
+        start = time.perf_counter()
+        for _ in range(N_TICKS):
+            for agent in agents:
+                await agent.dispatch(trp)
+            for agent in agents: # writers keep up
+                agent._send_queue.high.clear()
+        return (time.perf_counter() - start) / N_TICKS * 1e6 # usec per tick
+
+    # board: publish only (producer), and until every writer has taken the tick (producer + writers)
+    async def bench_board(n_agents):
+        board = TickBoard()
+        queues = [SendQueue() for _ in range(n_agents)]
+        sent = 0
+        async def writer(q):
+            nonlocal sent
+            while await q.get(BinaryCodec) is not None:
+                sent += 1
+        for q in queues:
+            q.follow(board)
+        tasks = [asyncio.create_task(writer(q)) for q in queues]
+        await asyncio.sleep(0)
+
+        publish = 0
+        start = time.perf_counter()
+        for i in range(N_TICKS):
+            t = time.perf_counter()
+            board.publish(trp)
+            publish += time.perf_counter() - t
+            while sent < (i + 1) * n_agents:
+                await asyncio.sleep(0)
+        total = time.perf_counter() - start
+        for q in queues:
+            q.put_nowait(None)
+        await asyncio.gather(*tasks)
+        return publish / N_TICKS * 1e6, total / N_TICKS * 1e6
+
+    async def main():
+        print(f"{'agents':>6} {'per-agent(us)':>14} {'publish(us)':>12} {'with writers(us)':>17}")
+        for n in (1, 5, 10, 20, 50):
+            publish, total = await bench_board(n)
+            print(f"{n:>6} {await bench_per_agent(n):>14.1f} {publish:>12.2f} {total:>17.1f}")
+        print("publish does not grow with agents, the writers are still woken and send once per agent")
+
+        # stalled agent: ticks are conflated, an order dispatch is not behind them
+        agent = AgentSession(id='A0', code='005930', codec=BinaryCodec)
+        board = TickBoard()
+        agent._send_queue.follow(board)
+        for _ in range(N_TICKS):
+            board.publish(trp)
+        await agent.dispatch(OM_Dispatch('order', 1))
+        first = BinaryCodec.decode(await agent._send_queue.get(agent.codec))
+        tick = BinaryCodec.decode(await agent._send_queue.get(agent.codec))
+        print(f"stalled agent after {N_TICKS} ticks: {agent._send_queue}, first out: {type(first).__name__}, then one tick of quantity {tick.quantity}")
+        assert type(first) is OM_Dispatch and tick.quantity == N_TICKS * trp.quantity and agent._send_queue.conflated == N_TICKS - 1
+
+    asyncio.run(main())
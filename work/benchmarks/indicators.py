@@ -0,0 +1,48 @@
+# batch / streaming check and benchmark: python -m benchmarks.indicators (from work/)
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.model.bar import RawBars
+from core.model.indicators import BATCH_RTOL, ema, EMA, vwap, VWAP, atr, ATR, rsi, RSI, volume_zscore, VolumeZScore, realized_vol, RealizedVol
+
+
+if __name__ == "__main__":
+    N = 12*3600 # a whole day of raw bars
+    raw_bars = RawBars()
+    t0 = datetime(2026, 1, 5, 8, 0, 0)
+    price = 70000
+    for i in range(N + 1):
+        for k in range(random.randint(0, 3)): # quiet seconds included
+            price = max(100, price + random.choice((-100, 0, 100)))
+            raw_bars.update(price, random.randint(1, 500), t0 + timedelta(seconds=i, milliseconds=k*100))
+    h, l, c, v = (raw_bars.view(f) for f in ('high', 'low', 'close', 'volume'))
+
+    cases = {
+        'EMA(20)': (lambda: ema(c, 20), lambda: EMA(20), ('close', )),
+        'VWAP': (lambda: vwap(h, l, c, v), lambda: VWAP(), ('high', 'low', 'close', 'volume')),
+        'ATR(14)': (lambda: atr(h, l, c, 14), lambda: ATR(14), ('high', 'low', 'close')),
+        'RSI(14)': (lambda: rsi(c, 14), lambda: RSI(14), ('close', )),
+        'VolumeZScore(20)': (lambda: volume_zscore(v, 20), lambda: VolumeZScore(20), ('volume', )),
+        'RealizedVol(20)': (lambda: realized_vol(c, 20), lambda: RealizedVol(20), ('close', )),
+    }
+    rows = raw_bars.rows()
+    print(f"{len(rows)} bars")
+    for name, (batch, make, fields) in cases.items():
+        start = time.perf_counter()
+        res_batch = batch()
+        t_batch = time.perf_counter() - start
+
+        cols = [RawBars.FIELDS.index(f) for f in fields]
+        ind = make()
+        start = time.perf_counter()
+        res_stream = [ind.update(*(row[i] for i in cols)) for row in rows]
+        t_stream = time.perf_counter() - start
+
+        res_stream = np.array(res_stream)
+        assert np.array_equal(np.isnan(res_batch), np.isnan(res_stream)), name
+        assert np.allclose(res_batch, res_stream, rtol=BATCH_RTOL, atol=0, equal_nan=True), name
+        diff = np.nanmax(np.abs(res_batch - res_stream) / np.maximum(np.abs(res_stream), 1e-300))
+        print(f"{name:<18} batch {t_batch * 1000:>6.1f} ms, streaming {t_stream / len(rows) * 1e6:>5.2f} us/bar, max relative diff {diff:.1e}")
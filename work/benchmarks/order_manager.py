@@ -0,0 +1,115 @@
+# dispatch replay check (a fill notice while the agent is away or syncing), and journal persistence check:
+# python -m benchmarks.order_manager (from work/)
+from datetime import date, timedelta
+import asyncio
+import logging
+import os
+import tempfile
+
+from core.base.settings import Service
+from core.comm.comm_interface import AgentSession
+from core.comm.conn_agents import ConnectedAgents
+from core.comm import order_journal, order_manager
+from core.comm.order_journal import JournalKind
+from core.comm.order_manager import OrderManager, INCOMPLETED_ORDERS
+from core.comm.wire_codec import BinaryCodec
+from core.kis.kis_tools import SIDE, MTYPE, EXG
+from core.kis.ws_data import TRNoticeColumns, TransactionNotice
+from core.model.aux_info import AuxInfo
+from core.model.order import Order
+from core.model.order_book import OrderBook
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("check")
+    CODE = '005930'
+
+    class NoDashboard:
+        def register_dp(self, agent_id, dp): return True
+        def unregister_dp(self, dp): pass
+
+    class Session(AgentSession): # dispatches are decoded into a list (as received by the agent)
+        def __init__(self):
+            super().__init__(id='A1', code=CODE, dp=0, connected=True, codec=BinaryCodec, session_key='key')
+            self.received = []
+        async def dispatch(self, message):
+            self.received.append(self.codec.decode(self.codec.encode(message)))
+
+    def fill_notice(order_no, qty, price):
+        d = {c: '' for c in TRNoticeColumns}
+        d.update(ODER_NO=order_no, SELN_BYOV_CLS='02', RFUS_YN='0', CNTG_YN='2', ACPT_YN='2', ODER_KIND='00', STCK_SHRN_ISCD=CODE,
+                 CNTG_QTY=str(qty), CNTG_UNPR=str(price), STCK_CNTG_HOUR='090000', ODER_QTY='10', EXG_YN='1Y', ODER_PRC=str(price))
+        return TransactionNotice(1, [d[c] for c in TRNoticeColumns], AuxInfo(Service.DEMO))
+
+    async def submitted(om, agent, order_no):
+        order = Order(agent_id=agent.id, code=CODE, side=SIDE.BUY, mtype=MTYPE.LIMIT, quantity=10, price=70000, exchange=EXG.KRX)
+        order.update_submit_response(order_no, '090000', '00950')
+        order.accepted = True
+        await om.dispatch_handler(agent, order)
+        om._get_code_map(CODE)[INCOMPLETED_ORDERS].setdefault(agent.id, {})[order_no] = order
+        om._get_order_index(CODE)[order_no] = (agent.id, order)
+        return order
+
+    async def replay(received, order_no): # returns the agent's order after the dispatches
+        book = OrderBook(agent_id='A1', code=CODE, logger=logger)
+        for m in received:
+            m = m.data
+            if isinstance(m, Order):
+                await book.handle_order_dispatch(m)
+            else:
+                await book.process_tr_notice(m)
+        return book._indexed_incompleted_orders.get(order_no) or book._indexed_completed_orders[order_no]
+
+    async def main():
+        ca = ConnectedAgents(logger, NoDashboard(), AuxInfo(Service.DEMO))
+        om = OrderManager(logger, ca, None, Service.DEMO)
+        om.map.clear()
+        om.order_index.clear()
+        om.dispatch_seqs.clear()
+
+        # the agent drops before receiving the submission result and the fill
+        agent = Session()
+        await ca.add(agent)
+        await ca.remove(agent)
+        om.detach(agent)
+        order = await submitted(om, agent, '0000000001')
+        await om.process_tr_notice(fill_notice('0000000001', 5, 70000))
+
+        resumed = Session()
+        success, msg = await om.resume_agent(resumed, last_seq=0)
+        booked = await replay(resumed.received, '0000000001')
+        print(f"resume: {msg}, processed server {order.processed} / agent {booked.processed}")
+        assert success and booked.processed == order.processed == 5
+
+        # the submission result and a fill held while the agent syncs
+        sync = await om.get_agent_sync(resumed)
+        resumed.received.clear()
+        order = await submitted(om, resumed, '0000000002')
+        await om.process_tr_notice(fill_notice('0000000002', 3, 70000))
+        await om.agent_sync_completed(resumed)
+        booked = await replay(resumed.received, '0000000002')
+        print(f"sync: {len(sync.incompleted_orders)} orders synced, held dispatches processed server {order.processed} / agent {booked.processed}")
+        assert booked.processed == order.processed == 3
+
+        # journal: what a dispatch reflects is in the files when it is sent, old days are removed on compaction
+        with tempfile.TemporaryDirectory() as tmp:
+            order_journal.DATA_DIR = order_manager.DATA_DIR = tmp
+            om = OrderManager(logger, ca, None, Service.DEMO)
+            today = date.today().isoformat()
+            written = []
+            resumed.dispatch = lambda message: asyncio.sleep(0, written.append([r[0] for r in om.journal.read(today)]))
+            await submitted(om, resumed, '0000000003')
+            print(f"journal: {written[0]} in the files when the dispatch is sent")
+            assert JournalKind.DISPATCH in written[0]
+
+            old = (date.today() - timedelta(days=om.load_days + 1)).isoformat()
+            for path in (om._snapshot_path(old), om._snapshot_path(old, '.idx'), om.journal._path(old, 1)):
+                open(path, 'wb').close()
+            await om.persist_to_disk(immediate=True)
+            om.journal.close()
+            left = sorted(os.listdir(tmp))
+            print(f"compaction: {left}")
+            assert not any(old in f for f in left) and any(today in f for f in left)
+
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+# scheduler check: python -m benchmarks.rate_limiter (from work/)
+import asyncio
+import time
+
+from core.kis.rate_limiter import RateLimiter, ReqClass
+
+
+if __name__ == "__main__":
+    RATE, N_INQUIRY, N_ORDER = 10, 20, 5
+
+    async def call(limiter, req_class, log):
+        await limiter.acquire(req_class)
+        log.append(req_class.name[0])
+
+    async def main():
+        limiter = RateLimiter(RATE, burst=2)
+        log = []
+        start = time.monotonic()
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(N_INQUIRY): # e.g., balance pages
+                tg.create_task(call(limiter, ReqClass.INQUIRY, log))
+            await asyncio.sleep(0.3)
+            for _ in range(N_ORDER): # orders arriving while inquiries are queued
+                tg.create_task(call(limiter, ReqClass.ORDER, log))
+        elapsed = time.monotonic() - start
+        print(f"{N_INQUIRY + N_ORDER} calls in {elapsed:.2f}s (rate {RATE}/s), start order: {''.join(log)}")
+        print(limiter)
+
+    asyncio.run(main())
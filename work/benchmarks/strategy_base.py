@@ -0,0 +1,57 @@
+# logic_run wakeup benchmark (ticks keep arriving, trn every 50 ticks): python -m benchmarks.strategy_base (from work/)
+import asyncio
+import time
+
+from core.model.strategy_base import StrategyBase, UpdateEvent
+
+
+if __name__ == "__main__":
+    DURATION = 1.0 # sec
+
+    class BenchStr(StrategyBase):
+        def __init__(self):
+            super().__init__()
+            self.wakeups = 0
+            self.seen = UpdateEvent(0)
+        def on_barlist_update(self):
+            pass
+        async def on_update(self, update_event: UpdateEvent):
+            self.wakeups += 1
+            self.seen |= update_event
+
+    async def legacy_logic_run(s: BenchStr, events: dict[UpdateEvent, asyncio.Event]): # previous: three wait tasks per iteration
+        await s.on_update_shell(UpdateEvent.INITIATE)
+        while True:
+            events[UpdateEvent.PRICE_UPDATE].clear()
+            if s.lazy_run:
+                events[UpdateEvent.TRN_RECEIVE].clear()
+            tasks = {asyncio.create_task(e.wait()): k for k, e in events.items()}
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in pending:
+                t.cancel()
+            event_type = tasks[done.pop()]
+            if event_type is UpdateEvent.BARLIST_EVENT:
+                events[UpdateEvent.BARLIST_EVENT].clear()
+            await s.on_update_shell(event_type)
+
+    async def bench(name, legacy: bool):
+        s = BenchStr()
+        events = {k: asyncio.Event() for k in (UpdateEvent.PRICE_UPDATE, UpdateEvent.TRN_RECEIVE, UpdateEvent.BARLIST_EVENT)}
+        notify = (lambda e: events[e].set()) if legacy else s._notify
+        runner = asyncio.create_task(legacy_logic_run(s, events) if legacy else s.logic_run())
+        await asyncio.sleep(0)
+        ticks = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < DURATION:
+            notify(UpdateEvent.PRICE_UPDATE)
+            ticks += 1
+            if ticks % 50 == 0:
+                notify(UpdateEvent.TRN_RECEIVE)
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        print(f"{name:<24} {ticks / elapsed:>9.0f} ticks/s {s.wakeups / elapsed:>9.0f} wakeups/s, events seen: {s.seen!r}")
+
+    asyncio.run(bench("three tasks per wakeup", legacy=True))
+    asyncio.run(bench("single wakeup + bitmask", legacy=False))
@@ -0,0 +1,83 @@
+# ring benchmark and reader wake-up check: python -m benchmarks.tick_ring (from work/)
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from core.comm.tick_ring import TickRingWriter, TickRingReader, TickRingWaiter, TickRings
+from core.kis.ws_data import TransactionPrices
+
+
+if __name__ == "__main__":
+    N = 200_000
+    path = os.path.join(tempfile.gettempdir(), "tick_ring_bench.ring")
+    writer = TickRingWriter(path)
+    readers = [TickRingReader(path) for _ in range(20)]
+
+    start = time.perf_counter()
+    for i in range(N):
+        writer.publish(70000, 10, 70100, 69900, 1.0 * i)
+    publish_only = time.perf_counter() - start
+    for r in readers: # skip the publish-only phase
+        r.read()
+        r.lost = 0
+
+    start = time.perf_counter()
+    for i in range(N):
+        writer.publish(70000 + i % 100, 10, 70100, 69900, 1.0 * i)
+        if i % 1000 == 999: # readers polling in batches
+            for r in readers:
+                r.read()
+    elapsed = time.perf_counter() - start
+
+    print(f"publish only: {publish_only / N * 1e9:.0f} ns/tick")
+    print(f"publish + {len(readers)} readers: {elapsed / N * 1e9:.0f} ns/tick ({(elapsed - publish_only) / N / len(readers) * 1e9:.0f} ns/tick/reader), lost {sum(r.lost for r in readers)}")
+    for r in readers:
+        r.close()
+    writer.close()
+
+    # wake-up: idle readers wait on the wake socket (no polling) and are woken by the next publish
+    async def wake():
+        N_TICKS, N_READERS = 200, 5
+        rings = TickRings(logging.getLogger("check"), 'bench')
+        server = asyncio.create_task(rings.run())
+        await asyncio.sleep(0.1)
+        ring_path = rings.open('005930')
+        latencies, reads = [], [0]
+
+        async def read_ticks():
+            reader, waiter = TickRingReader(ring_path), TickRingWaiter(rings.wake_path_if_running(), '005930')
+            await waiter.open()
+            try:
+                received = 0
+                while received < N_TICKS:
+                    ticks, _ = reader.read()
+                    reads[0] += 1
+                    for price, quantity, ask, bid, ts in ticks:
+                        latencies.append(time.time() - ts)
+                        trp = TickRingReader.to_trp('005930', price, quantity, ask, bid, ts)
+                        assert (trp.ask, trp.bid) == (70100, 69900)
+                    received += len(ticks)
+                    if not ticks:
+                        await waiter.wait(reader.next_seq)
+            finally:
+                waiter.close()
+                reader.close()
+
+        tasks = [asyncio.create_task(read_ticks()) for _ in range(N_READERS)]
+        await asyncio.sleep(0.1)
+        trp = TransactionPrices(1, '^'.join(['005930', '090000', '70000'] + ['0']*7 + ['70100', '69900', '3'] + ['0']*(TransactionPrices.n_cols-13)))
+        for _ in range(N_TICKS):
+            await asyncio.sleep(0.005) # ticks a few ms apart: readers are idle in between
+            trp.time = trp.time.fromtimestamp(time.time())
+            rings.publish(trp)
+        await asyncio.wait_for(asyncio.gather(*tasks), 10)
+        server.cancel()
+        rings.close()
+        latencies.sort()
+        print(f"wake-up: {N_READERS} readers x {N_TICKS} ticks, {reads[0] / N_READERS:.0f} reads per reader, "
+              f"latency median {latencies[len(latencies) // 2] * 1e6:.0f} us, p99 {latencies[len(latencies) * 99 // 100] * 1e6:.0f} us")
+        assert reads[0] <= N_READERS * N_TICKS * 2 + N_READERS # one read per tick and one empty read before each wait (no polling)
+
+    asyncio.run(wake())
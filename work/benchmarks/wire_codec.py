@@ -0,0 +1,49 @@
+# codec benchmark: python -m benchmarks.wire_codec (from work/)
+import time
+
+from core.base.settings import Service
+from core.comm.comm_interface import OM_Dispatch
+from core.comm.wire_codec import PickleCodec, BinaryCodec
+from core.kis.kis_tools import SIDE, MTYPE, EXG
+from core.kis.ws_data import TRNoticeColumns, TransactionPrices, TransactionNotice
+from core.model.aux_info import AuxInfo
+from core.model.order import Order, CancelOrder
+
+
+if __name__ == "__main__":
+    N = 20000
+    cols = [str(i*7919 % 100000) for i in range(TransactionPrices.n_cols-3)] # distinct values like the real feed
+    trp = TransactionPrices(2, '^'.join((['005930', '090000', '70000'] + cols)*2))
+    trn_data = {c: '' for c in TRNoticeColumns}
+    trn_data.update(ACNT_NO='5012345601', ODER_NO='0000012345', SELN_BYOV_CLS='02', RCTF_CLS='0', RFUS_YN='0', CNTG_YN='2', ACPT_YN='2',
+                    ODER_KIND='00', ODER_COND='0', STCK_SHRN_ISCD='005930', CNTG_QTY='5', CNTG_UNPR='70000', STCK_CNTG_HOUR='090001',
+                    BRNC_NO='00950', ODER_QTY='10', EXG_YN='1Y', CRDT_CLS='10', ODER_PRC='70000') # a fill, as received
+    trn = TransactionNotice(1, [trn_data[c] for c in TRNoticeColumns], AuxInfo(Service.DEMO))
+    order = Order(agent_id='A1', code='005930', side=SIDE.BUY, mtype=MTYPE.LIMIT, quantity=10, price=70000, exchange=EXG.KRX)
+    samples = {'TransactionPrices': trp, 'OM_Dispatch(notice)': OM_Dispatch(trn), 'OM_Dispatch(order)': OM_Dispatch(order)}
+
+    def best(f, arg, repeat=5): # usec per call, best of repeat runs (less noise)
+        res = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(N):
+                f(arg)
+            res.append((time.perf_counter() - start) / N * 1e6)
+        return min(res)
+
+    print(f"{'message':<20} {'codec':<7} {'bytes':>6} {'encode(us)':>11} {'decode(us)':>11}")
+    for name, msg in samples.items():
+        for codec in (PickleCodec, BinaryCodec):
+            data = codec.encode(msg)
+            enc = best(codec.encode, msg)
+            dec = best(codec.decode, data)
+            print(f"{name:<20} {codec.name:<7} {len(data):>6} {enc:>11.2f} {dec:>11.2f}")
+
+    # round trip: every field of the layout schemas (None, enums, str blob, tagged values)
+    order.update_submit_response('0000012345', '090000', '00950')
+    cancel = CancelOrder(agent_id='A1', code='005930', side=SIDE.BUY, mtype=MTYPE.LIMIT, quantity=10, price=70000, exchange=EXG.KRX,
+                         original_order_no='0000012345', original_order_org_no='00950', creation_msg='취소 주문')
+    for msg in (trn, order, cancel):
+        decoded = BinaryCodec.decode(BinaryCodec.encode(msg))
+        assert type(decoded) is type(msg) and decoded.__dict__ == msg.__dict__, type(msg).__name__
+    print(f"round trip ok, decoded tick: {BinaryCodec.decode(BinaryCodec.encode(trp))}")
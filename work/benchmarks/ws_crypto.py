@@ -0,0 +1,68 @@
+# decryption benchmark (notice bursts): python -m benchmarks.ws_crypto (from work/)
+import asyncio
+import os
+import time
+from base64 import b64decode, b64encode
+
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import pad, unpad
+
+from core.kis.ws_crypto import FrameCipher
+from core.kis.ws_data import TRNoticeColumns
+
+
+if __name__ == "__main__":
+    N = 2000 # frames per burst
+    key, iv = os.urandom(16).hex(), os.urandom(8).hex() # 32 / 16 chars, like the KIS response
+    frames = []
+    for i in range(N):
+        fields = [str(i * 7919 % 100000 + j) for j in range(len(TRNoticeColumns))]
+        cipher = AES.new(key.encode("utf-8"), AES.MODE_CBC, iv.encode("utf-8"))
+        frames.append(b64encode(cipher.encrypt(pad('^'.join(fields).encode("utf-8"), AES.block_size))).decode())
+
+    def per_frame_cipher(ct): # previous path: key / iv encoded and a new CBC cipher per frame
+        cipher = AES.new(key.encode("utf-8"), AES.MODE_CBC, iv.encode("utf-8"))
+        return bytes.decode(unpad(cipher.decrypt(b64decode(ct)), AES.block_size))
+
+    fc = FrameCipher(key, iv)
+    assert all(fc.decrypt(f) == per_frame_cipher(f) for f in frames)
+
+    def bench(name, fn):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<32} {elapsed / N * 1e6:>6.2f} us/frame, {N / elapsed:>7.0f} frames/s")
+
+    async def per_frame_offload():
+        for f in frames:
+            await asyncio.to_thread(fc.decrypt, f)
+
+    async def burst(batch): # batch 0: inline, otherwise batches of frames decrypted in one worker thread call
+        stop, gaps = asyncio.Event(), []
+        async def ticker(): # event loop responsiveness during the burst
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        if batch:
+            for i in range(0, N, batch):
+                await asyncio.to_thread(lambda b: [fc.decrypt(f) for f in b], frames[i:i + batch])
+        else:
+            for f in frames:
+                fc.decrypt(f)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await task
+        name = f"offloaded in batches of {batch}" if batch else "inline"
+        print(f"burst {name:<24} {elapsed / N * 1e6:>6.2f} us/frame, max event loop gap {max(gaps) * 1000:.2f} ms")
+
+    bench("encoded key / iv per frame", lambda: [per_frame_cipher(f) for f in frames])
+    bench("FrameCipher (cached key / iv)", lambda: [fc.decrypt(f) for f in frames])
+    bench("FrameCipher, thread per frame", lambda: asyncio.run(per_frame_offload()))
+    for batch in (0, 20, 200):
+        asyncio.run(burst(batch))
@@ -0,0 +1,69 @@
+# parser benchmark: python -m benchmarks.ws_data (from work/)
+import time
+from datetime import datetime
+
+from core.kis.ws_data import TransactionPrices, TRPriceData, _CODE, _PRICE, _VOL, _ASK, _BID
+
+
+if __name__ == "__main__":
+    N = 50_000
+
+    def legacy_parse(raw): # previous path: full split, a namedtuple per record, conversion from the records
+        dr = raw.split("|")
+        n_rows, d = int(dr[2]), dr[3].split("^")
+        n = TransactionPrices.n_cols
+        records = [TRPriceData(*d[i:i + n]) for i in range(0, n_rows * n, n)]
+        return records[0].MKSC_SHRN_ISCD, int(records[-1].STCK_PRPR), sum(int(r.CNTG_VOL) for r in records)
+
+    class FullSplitPrices: # previous parser: the payload split in full, conversion by offset
+        def __init__(self, n_rows, d):
+            n = TransactionPrices.n_cols
+            assert len(d) == n_rows * n
+            self.n_rows = n_rows
+            self._d = d
+            self._records = None
+            self.time = datetime.now()
+            last = (n_rows - 1) * n
+            self.code = d[_CODE]
+            self.price = int(d[last + _PRICE])
+            self.quantity = sum(map(int, d[_VOL::n])) if n_rows > 1 else int(d[_VOL])
+            self.ask = int(d[last + _ASK])
+            self.bid = int(d[last + _BID])
+
+    def full_split_parse(raw):
+        _, _, n_rows, payload = raw.split("|", 3)
+        trp = FullSplitPrices(int(n_rows), payload.split("^"))
+        return trp.code, trp.price, trp.quantity
+
+    def parse(raw):
+        _, _, n_rows, payload = raw.split("|", 3)
+        trp = TransactionPrices(int(n_rows), payload)
+        return trp.code, trp.price, trp.quantity
+
+    def frame(n_rows, seed): # same layout as the KIS feed, distinct values per field
+        rows = []
+        for r in range(n_rows):
+            fields = [str((seed + r) * 7919 % 100000 + i) for i in range(TransactionPrices.n_cols)]
+            fields[0], fields[1] = '005930', f"0930{r % 60:02d}"
+            rows.extend(fields)
+        return f"0|H0STCNT0|{n_rows:03d}|" + '^'.join(rows)
+
+    for n_rows in (1, 4, 16):
+        frames = [frame(n_rows, i) for i in range(100)]
+        assert all(legacy_parse(f) == full_split_parse(f) == parse(f) for f in frames)
+        for name, fn in (('legacy', legacy_parse), ('full split', full_split_parse), ('parser', parse)):
+            elapsed = float('inf')
+            for _ in range(5): # best of 5
+                start = time.perf_counter()
+                for i in range(N):
+                    fn(frames[i % 100])
+                elapsed = min(elapsed, time.perf_counter() - start)
+            print(f"{n_rows:>2} rows/frame {name:<10} {elapsed / N * 1e6:>7.2f} us/frame")
+
+    # a single record frame of another layout is rejected, not read at the wrong offsets
+    for n_cols in (TransactionPrices.n_cols - 1, TransactionPrices.n_cols + 1):
+        try:
+            TransactionPrices(1, '^'.join(['1'] * n_cols))
+        except AssertionError:
+            continue
+        raise AssertionError(f"{n_cols} cols accepted")
@@ -1,6 +1,7 @@
 from pathlib import Path
 from enum import StrEnum
 import os
+import tempfile
 
 # ----------------------------------------------------
 # project directory structure 
@@ -11,7 +12,7 @@ LOG_DIR = WORK_DIR / 'log'
 DATA_DIR = WORK_DIR / 'data'
 
 config_file = PROJECTS_DIR / 'config' / 'kis_devlp.yaml'
-# server_env_file = PROJECTS_DIR / 'config' / 'kis_server.env'
+TOKEN_DIR = PROJECTS_DIR / 'config' # kis_tokens_<service>.json: tokens reused on restart (owner only, like the config file)
 
 os.makedirs(LOG_DIR, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -20,9 +21,15 @@ if not Path(config_file).exists(): raise Exception(f'config file not found {conf
 # ----------------------------------------------------
 # API control settings
 # ----------------------------------------------------
-real_sleep = 0.1 # min 0.05
-demo_sleep = 0.5 # min 0.5
+# REST calls per app key: token bucket (rate: calls/sec, burst: calls allowed at once)
+real_rate = 10 # max 20
+real_burst = 3
+demo_rate = 2 # max 2
+demo_burst = 1
 reauth_margin_hr = 3
+# tokens and approval keys are renewed in the background this long before expiry (calls renew on demand only within reauth_margin_hr)
+token_refresh_margin_hr = 4
+token_refresh_interval = 600 # sec
 
 # ----------------------------------------------------
 # local communication settings
@@ -35,6 +42,23 @@ class Service(StrEnum):
     def is_real(self): 
         return self is not Service.DEMO
 
+# extra app keys (config: <name>_app / <name>_sec) sharing market data with the service's own key, e.g. ['autotrading']
+# - keys must be for the same server (real / demo), and not used by another running server (rate limits are per key)
+# - orders and account inquiries always use the service's own key
+# - each key also opens one websocket session: real-time subscriptions are spread over the sessions
+market_data_app_keys = {
+    Service.PROD: [],
+    Service.AUTO: [],
+    Service.DEMO: [],
+}
+
+# real-time registrations per websocket session (KIS: 41 per session including ccnl_notice)
+# - registrations beyond the total capacity are queued until a slot frees up
+ws_max_subscriptions = 40
+# encrypted frames (e.g., ccnl_notice) of a burst are decrypted together in a worker thread, in arrival order with the other frames
+# - keeps the event loop responsive during bursts, at a higher cost per frame (off: decrypted inline, a few us per frame)
+ws_decrypt_in_thread = False
+
 # clients(agents) to server
 HOST = "127.0.0.1"   # Localhost
 SERVER_PORT = {
@@ -44,6 +68,37 @@ SERVER_PORT = {
 }
 # note: server assigns a distinct port to each incoming client
 
+# unix domain socket (same host, no TCP loopback stack): server listens on both, agents try it first and fall back to TCP
+# not available on Windows (TCP only)
+use_unix_socket = True
+SERVER_UNIX_SOCKET = {
+    Service.PROD: '/tmp/optrading_server_prod.sock',
+    Service.AUTO: '/tmp/optrading_server_auto.sock',
+    Service.DEMO: '/tmp/optrading_server_demo.sock',
+}
+
+# memory mapped tick ring per code (same host): agents read ticks from it instead of the socket (orders and notices stay on the socket)
+use_tick_ring = True
+TICK_RING_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir() # tmpfs where available
+tick_ring_slots = 4096 # ticks kept per code, an agent falling behind more than this loses ticks (counted as lost)
+tick_ring_wait_timeout = 1.0 # sec, a reader waiting for a wake-up reads the ring again after this (wake-up lost, e.g., server restarted)
+tick_ring_poll_interval = 0.002 # sec, agent side polling when no new tick, only without the wake-up socket (no unix sockets)
+
+# per-agent outbound queue (server side): messages waiting in the high lane (orders, responses), ticks are conflated per code
+# overflow means the agent is not reading: the connection is closed (pending dispatches are synced on reconnect)
+send_queue_max = 10_000
+
+# Dispatch_ACK is cumulative (up to seq), sent by agents after the interval or the batch size, whichever comes first
+dispatch_ack_interval = 0.05 # sec
+dispatch_ack_batch_size = 32 # dispatches
+
+# session resume: a disconnected agent reconnects with its session key and last received seq, and only missed dispatches are replayed
+# - the server keeps dispatches of a disconnected agent for the window, a later reconnect needs a full sync (agent restart)
+agent_resume_window = 300 # sec
+agent_reconnect_tries = 8 # agent side, with backoff (1, 2, 4, .. max 30 sec)
+wire_codec = 'binary' # local comm message codec chosen by clients: 'binary' or 'pickle'
+accept_pickle_wire = False # server side: pickle clients are refused (decoding pickle can run arbitrary code)
+
 # browers to dashboard manager (main screen)
 DASHBOARD_MANAGER_PORT = {
     Service.PROD: 9000,
@@ -65,9 +120,15 @@ DASHBOARD_SERVER_PORT = {
 # ----------------------------------------------------
 # server may run for each service
 OM_save_filename = 'order_manager_' # + service type + date + .pkl
+OM_journal_filename = 'order_journal_' # + service type + date + .gen + .jnl
 order_manager_keep_days = 7 # days
-disk_save_period = 1800 # sec
+disk_save_period = 1800 # sec, compaction of the journal into the snapshot (.pkl)
+journal_flush_interval = 0.2 # sec, fsync batching: journal records are written before any dispatch, fsynced every interval
+journal_flush_size = 256 # records, flushes earlier if this many records are buffered
+journal_fsync = True # fsync once per flush (batched)
+order_manager_lazy_load = True # only today is loaded at start, previous days are loaded when an agent sync needs them
 server_broadcast_interval = 30 # sec
+status_render_interval = 0.5 # sec, server dashboard text is sent at most once per interval (and only if changed)
 
 # ----------------------------------------------------
 # key parameters in trading logic settings
@@ -80,4 +141,5 @@ class TradeSettings:
 
 # ----------------------------------------------------
 # bar settings
-# ----------------------------------------------------
\ No newline at end of file
+# ----------------------------------------------------
+raw_bar_retention = 12*3600 # raw (1 sec) bars kept per agent: a whole day with NXT extended hours (08:00 - 20:00)
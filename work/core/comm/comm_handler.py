@@ -1,7 +1,9 @@
-import pickle
 import asyncio
+import uuid
 
-from .comm_interface import RequestCommand, ClientRequest, ServerResponse, Sync, Dispatch_ACK, AgentSession
+from ..base.settings import accept_pickle_wire
+from .comm_interface import RequestCommand, ClientRequest, ServerResponse, Sync, Dispatch_ACK, AgentSession, TickBoard
+from .wire_codec import CODEC_IDS, PickleCodec
 from .order_manager import OrderManager
 from .conn_agents import ConnectedAgents
 from .subs_manager import SubscriptionManager
@@ -18,6 +20,7 @@ class CommHandler:
         self.subs_manager: SubscriptionManager = server.subs_manager
         self.order_manager: OrderManager = server.order_manager
         self.kf = server.kf
+        self.tick_rings = server.tick_rings
         self.COMMAND_HANDLERS = {
             RequestCommand.SUBMIT_ORDERS: self.handle_submit_orders, 
             RequestCommand.REGISTER_AGENT: self.handle_register_agent, 
@@ -25,16 +28,20 @@ class CommHandler:
             RequestCommand.SYNC_COMPLETE_NOTICE: self.handle_sync_complete_notice,
             RequestCommand.SUBSCRIBE_TRP: self.handle_subscribe_trp, 
             RequestCommand.GET_PSBL_ORDER: self.handle_get_psbl_order,
+            RequestCommand.RESUME_SESSION: self.handle_resume_session,
         }
 
     async def writer_loop(self, agent: AgentSession):
         try:
             while True:
-                data = await agent._send_queue.get()
+                data = await agent._send_queue.get(agent.codec)
                 if data is None:  # shutdown signal
+                    if agent._send_queue.overflow:
+                        self.logger.warning(f"[CommHandler] send queue overflow ({agent._send_queue}), closing agent {agent.id}", extra={"owner": agent.id})
                     break
 
-                agent.writer.write(len(data).to_bytes(4, "big") + data) # only bytes are accepted
+                # header and payload written without concatenation (payload bytes may be shared by many agents)
+                agent.writer.writelines((len(data).to_bytes(4, "big"), data)) # only bytes are accepted
                 await agent.writer.drain()
 
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, OSError) as e:
@@ -50,13 +57,34 @@ class CommHandler:
             except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, OSError) as e:
                 pass # suppress os errors
 
-    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # (host, port) for TCP clients / ('unix', fd) for unix socket clients (peername is empty): port part is unique in a session
+    @staticmethod
+    def _peer(writer: asyncio.StreamWriter):
         peer = writer.get_extra_info("peername") # peername: network term / uniqe in a session
+        if isinstance(peer, tuple):
+            return peer
+        return ('unix', writer.get_extra_info("socket").fileno())
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = self._peer(writer)
         agent = AgentSession() # agent_session is created here and assign session data first, later than agent-specific data
         agent.reader = reader
         agent.writer = writer
-        
-        self.logger.info(f"[CommHandler] client connected {peer}")
+
+        # first byte: codec id chosen by the client
+        try:
+            codec_id = (await reader.readexactly(1))[0]
+        except (asyncio.IncompleteReadError, ConnectionResetError, ConnectionAbortedError, BrokenPipeError, OSError) as e:
+            self.logger.info(f"[CommHandler] client {peer} closed before codec handshake: {e}")
+            writer.close()
+            return
+        agent.codec = CODEC_IDS.get(codec_id)
+        if agent.codec is None or (agent.codec is PickleCodec and not accept_pickle_wire):
+            self.logger.warning(f"[CommHandler] client {peer} refused: codec {codec_id} not accepted")
+            writer.close()
+            return
+
+        self.logger.info(f"[CommHandler] client connected {peer} ({agent.codec.name})")
         writer_task = asyncio.create_task(self.writer_loop(agent))
 
         try: 
@@ -67,7 +95,7 @@ class CommHandler:
                 length = int.from_bytes(length_bytes, "big")
                 payload = await reader.readexactly(length)
 
-                client_msg = pickle.loads(payload)
+                client_msg = agent.codec.decode(payload)
 
                 # process incoming
                 if isinstance(client_msg, Dispatch_ACK):
@@ -102,12 +130,17 @@ class CommHandler:
             await writer_task
 
             if agent.connected:
-                self.logger.info(f"[CommHandler] cleaning-up agent {agent.id}", extra={"owner": agent.id})
-                res = await self.subs_manager.remove(agent)
-                self.logger.info(res, extra={"owner": agent.id})
-                res = await self.connected_agents.remove(agent)
-                self.logger.info(res, extra={"owner": agent.id})
-                agent.connected = False
+                await self._detach(agent)
+
+    # cleans up a disconnected agent (kept in OrderManager for resume)
+    async def _detach(self, agent: AgentSession):
+        self.logger.info(f"[CommHandler] cleaning-up agent {agent.id}", extra={"owner": agent.id})
+        agent.connected = False
+        res = await self.subs_manager.remove(agent)
+        self.logger.info(res, extra={"owner": agent.id})
+        res = await self.connected_agents.remove(agent)
+        self.logger.info(res, extra={"owner": agent.id})
+        self.order_manager.detach(agent)
 
     # list[Order|CancelOrder]를 받아서 submit
     async def handle_submit_orders(self, client_request: ClientRequest, agent: AgentSession):
@@ -120,16 +153,38 @@ class CommHandler:
         agent.id, agent.code, agent.dp = client_request.get_request_data()
         agent.connected = True
         success, msg = await self.connected_agents.add(agent) 
-        self.logger.info(f"agent registered at client port {agent.writer.get_extra_info('peername')[1]}", extra={"owner": agent.id})
+        self.logger.info(f"agent registered at client port {self._peer(agent.writer)[1]}", extra={"owner": agent.id})
 
         # return with registration status
         res = ServerResponse(success, msg)
+        if success:
+            agent.session_key = uuid.uuid4().hex
+            res.data_dict['session_key'] = agent.session_key
         return res
 
+    # reconnected agent: registered again and only the dispatches it has not received are replayed (no full sync)
+    async def handle_resume_session(self, client_request: ClientRequest, agent: AgentSession):
+        if agent.connected:
+            return ServerResponse(False, f"agent {agent.id} already registered on this connection")
+        agent.id, agent.code, agent.dp, agent.session_key, last_seq = client_request.get_request_data()
+
+        # the previous connection may not be detected as closed yet
+        previous = self.connected_agents.get_agent_by_id(agent.id)
+        if previous is not None and previous.session_key == agent.session_key:
+            await self._detach(previous)
+            await previous._send_queue.put(None) # closes the previous connection
+
+        agent.connected = True
+        success, msg = await self.order_manager.resume_agent(agent, last_seq)
+        if not success:
+            agent.connected = False
+        return ServerResponse(success, msg)
+
     # agent sync with server 
+    # request data: (sync_start_date, cursor of the agent's last sync or None)
     async def handle_sync_order_history(self, client_request: ClientRequest, agent: AgentSession):
-        sync_start_date = client_request.get_request_data()
-        sync: Sync = await self.order_manager.get_agent_sync(agent, sync_start_date=sync_start_date)
+        sync_start_date, cursor = client_request.get_request_data()
+        sync: Sync = await self.order_manager.get_agent_sync(agent, sync_start_date=sync_start_date, cursor=cursor)
 
         # return with sync data
         res = ServerResponse(True, "sync request submitted")
@@ -137,7 +192,7 @@ class CommHandler:
         return res
 
     async def handle_sync_complete_notice(self, client_request: ClientRequest, agent: AgentSession):
-        success = await self.order_manager.agent_sync_completed_lock_release(agent)
+        success = await self.order_manager.agent_sync_completed(agent)
 
         # return with sync data
         if success:
@@ -149,8 +204,15 @@ class CommHandler:
     async def handle_subscribe_trp(self, client_request: ClientRequest, agent: AgentSession):
         msg = await self.subs_manager.add(agent, self.kf.ccnl_krx)
         self.logger.info(f"agent {agent.id} trp ({agent.code}) subscribed", extra={"owner": agent.id})
-    
-        return ServerResponse(success=True, status=msg)
+
+        res = ServerResponse(success=True, status=msg)
+        # request data: whether the agent can read the tick ring / response: ring path (and wake socket) if the server provides it
+        agent.tick_ring = bool(client_request.get_request_data()) and self.tick_rings is not None
+        if agent.tick_ring:
+            res.data_dict['tick_ring'] = self.tick_rings.open(agent.code)
+            res.data_dict['tick_ring_wake'] = self.tick_rings.wake_path_if_running()
+        agent._send_queue.follow(None if agent.tick_ring else TickBoard.get(agent.code))
+        return res
 
     async def handle_get_psbl_order(self, client_request: ClientRequest, agent: AgentSession):
         code, mtype, price = client_request.get_request_data()
@@ -1,10 +1,12 @@
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum, auto
 import uuid
 import asyncio
-import pickle
 
+from ..base.settings import send_queue_max
 from ..base.tools import dict_key_number
+from ..kis.ws_data import TransactionPrices
 
 class RequestCommand(Enum):
     SUBMIT_ORDERS = auto()
@@ -13,6 +15,143 @@ class RequestCommand(Enum):
     SYNC_COMPLETE_NOTICE = auto()
     SUBSCRIBE_TRP = auto()
     GET_PSBL_ORDER = auto()
+    RESUME_SESSION = auto()
+
+class TickBoard:
+    """
+    Latest tick of a code, shared by the writers of all agents of the code (server side)
+    - publish(): one update per tick, whatever the number of agents (no per-agent queue put)
+    - each writer keeps the seq / cum_quantity it has sent up to (SendQueue.follow) and reads the board when free
+    - encoded bytes are made once per codec on the first read, and shared by the writers of the same codec
+    - a writer behind by more than one tick gets the latest tick with the quantity of the ticks missed (conflated)
+    - idle writers wait on one shared future, resolved in the next loop iteration after a publish
+      (a single call_soon per wake-up, ticks published in the same iteration wake the writers once)
+
+    _boards = {
+        code: TickBoard,
+        ...
+    }
+    """
+    _boards: dict[str, "TickBoard"] = {}
+
+    @classmethod
+    def get(cls, code):
+        board = cls._boards.get(code)
+        if board is None:
+            board = cls._boards[code] = cls()
+        return board
+
+    def __init__(self):
+        self.seq = 0
+        self.cum_quantity = 0
+        self.trp: TransactionPrices | None = None
+        self.encoded: dict = {} # codec: bytes of trp
+        self._changed: asyncio.Future | None = None
+
+    def publish(self, trp: TransactionPrices):
+        self.seq += 1
+        self.cum_quantity += trp.quantity
+        self.trp = trp
+        self.encoded = {}
+        if self._changed is not None:
+            changed, self._changed = self._changed, None
+            asyncio.get_running_loop().call_soon(changed.set_result, None)
+
+    # resolved on the next publish
+    def changed(self) -> asyncio.Future:
+        if self._changed is None:
+            self._changed = asyncio.get_running_loop().create_future()
+        return self._changed
+
+    # the tick for a writer that has sent up to (seq, cum_quantity)
+    def read(self, codec, seq, cum_quantity) -> bytes:
+        if seq == self.seq - 1:
+            data = self.encoded.get(codec)
+            if data is None:
+                data = self.encoded[codec] = codec.encode(self.trp)
+            return data
+        return codec.encode(self.trp.conflated(self.cum_quantity - cum_quantity))
+
+class SendQueue:
+    """
+    Per-agent outbound queue (server side), consumed by CommHandler.writer_loop
+    - high lane: encoded messages (OM_Dispatch, ServerResponse, ...) in FIFO order, always sent first
+      bounded by send_queue_max: on overflow the queue is closed and the writer stops (connection closed)
+    - tick lane: the TickBoard of the agent's code (none for agents reading the tick ring)
+      read when the high lane is empty: the latest tick, ticks published meanwhile are conflated into it
+    """
+    def __init__(self):
+        self.high: deque[bytes | None] = deque()
+        self.board: TickBoard | None = None
+        self.tick_seq = 0 # board seq / cum_quantity sent up to
+        self.tick_cum = 0
+        self._changed: asyncio.Future | None = None # board future the queue is woken by
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.overflow = False
+
+        # metrics
+        self.max_depth = 0
+        self.conflated = 0
+
+    def __len__(self):
+        return len(self.high) + (self.ticks_behind > 0)
+
+    def __str__(self):
+        return f"q {len(self.high)}/{self.ticks_behind} max {self.max_depth} cf {self.conflated}"
+
+    @property
+    def ticks_behind(self):
+        return self.board.seq - self.tick_seq if self.board is not None else 0
+
+    def _put(self):
+        self.max_depth = max(self.max_depth, len(self))
+        self._ready.set()
+
+    def _wake(self, _):
+        self._ready.set()
+
+    # ticks from now on, None: no ticks
+    def follow(self, board: TickBoard | None):
+        self.board = board
+        if board is not None:
+            self.tick_seq, self.tick_cum = board.seq, board.cum_quantity
+        self._ready.set()
+
+    # None: stop signal to the writer
+    def put_nowait(self, data: bytes | None):
+        if self.closed:
+            return
+        if data is None:
+            self.closed = True
+        elif len(self.high) >= send_queue_max:
+            self.overflow = self.closed = True
+            data = None
+        if self.closed:
+            self.board = None
+        self.high.append(data)
+        self._put()
+
+    async def put(self, data: bytes | None):
+        self.put_nowait(data)
+
+    async def get(self, codec) -> bytes | None:
+        while True:
+            if self.high:
+                return self.high.popleft()
+            board = self.board
+            if board is not None:
+                if board.seq != self.tick_seq:
+                    data = board.read(codec, self.tick_seq, self.tick_cum)
+                    self.conflated += board.seq - self.tick_seq - 1
+                    self.tick_seq, self.tick_cum = board.seq, board.cum_quantity
+                    return data
+                changed = board.changed()
+                if changed is not self._changed:
+                    self._changed = changed
+                    changed.add_done_callback(self._wake)
+            self._ready.clear()
+            await self._ready.wait()
 
 # an agent's session info in the server
 # all server operation on agent is done with AgentSession instance
@@ -30,7 +169,10 @@ class AgentSession:
     reader: asyncio.StreamReader | None = None 
     writer: asyncio.StreamWriter | None = None 
     connected: bool = False
-    _send_queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    _send_queue: SendQueue = field(default_factory=SendQueue)
+    codec: object | None = None # wire codec chosen by the client (set by CommHandler on connect)
+    tick_ring: bool = False # ticks are read from the shared tick ring, not sent on the socket
+    session_key: str | None = None # issued on registration, presented by the agent to resume after a disconnection
 
     subscriptions: set = field(default_factory=set) # subscribed functions
 
@@ -39,15 +181,19 @@ class AgentSession:
 
     async def dispatch(self, message): 
         # should not use writer directly
-        data = pickle.dumps(message) # data freezed this moment
-        await self._send_queue.put(data)
+        data = self.codec.encode(message) # data freezed this moment
+        self._send_queue.put_nowait(data)
     
+    # encode once (per codec) and share the same (immutable) bytes across all agents
+    # ticks are not sent this way but published to the TickBoard of the code
     @classmethod
     async def dispatch_multiple(cls, to: list, message):
-        if not to:
-            return
+        encoded = {}
         for agent in to:
-            await agent.dispatch(message)
+            data = encoded.get(agent.codec)
+            if data is None:
+                data = encoded[agent.codec] = agent.codec.encode(message)
+            agent._send_queue.put_nowait(data)
 
 @dataclass
 class ClientRequest:
@@ -80,12 +226,13 @@ class ServerResponse: # acknowledgement of client_request
 @dataclass
 class OM_Dispatch:
     data: object 
-    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    seq: int = 0 # per agent, increasing (also across resumed sessions, assigned by OrderManager)
 
-# on every OM_Dispatch, client sends Dispatch_ACK
+# cumulative: all OM_Dispatches up to seq are received
+# client sends it after dispatch_ack_interval or dispatch_ack_batch_size dispatches, whichever comes first
 @dataclass
 class Dispatch_ACK:
-    id: str 
+    seq: int 
     agent_id: str
 
 @dataclass
@@ -99,14 +246,23 @@ class Sync:
     prev_incompleted_orders: dict | None = None
     # today
     incompleted_orders: dict | None = None
-    # all days
+    # today (previous days are in the summary)
     completed_orders: dict | None = None
 
     # today
     pending_trns: dict | None = None
 
+    # full sync: stats of the orders before today (RecordStats fields), instead of the orders
+    summary: dict | None = None
+    # (server epoch, date, version): presented on the next sync of the agent to get only the changes
+    cursor: tuple | None = None
+    # True: only today's orders changed since the presented cursor
+    delta: bool = False
+
     def __str__(self):
-        res = ''
+        res = 'delta\n' if self.delta else ''
+        if self.summary:
+            res += f'summary {self.summary}\n'
         for k, v in (self.prev_incompleted_orders or {}).items():
             res += f'p-inc {v}\n'
         for k, v in (self.incompleted_orders or {}).items():
@@ -118,4 +274,4 @@ class Sync:
         if res: res = '\n'+res 
         else: res = "sync data empty"
 
-        return res
\ No newline at end of file
+        return res
@@ -1,10 +1,9 @@
 import asyncio
 
-from .comm_interface import AgentSession
+from .comm_interface import AgentSession, TickBoard
 from ..base.tools import list_str, get_listed_market
 from ..model.aux_info import AuxInfo
 from ..model.dashboard import DashboardManager
-from ..kis.ws_data import TransactionPrices
 
 # used in server, and handles AgentSession instances for which agent specific info is received
 class ConnectedAgents:
@@ -26,6 +25,7 @@ class ConnectedAgents:
         self.agent_id_map: dict[str, AgentSession] = {}
         self.dashboard_manager = dashboard_manager
         self._lock = asyncio.Lock()
+        self.version = 0 # increases on every change, used by the server status renderer
 
     def __str__(self): 
         if self.code_agent_map:
@@ -39,6 +39,12 @@ class ConnectedAgents:
         else: 
             return '[ConnectedAgents] no agents connected'
 
+    # send queue metrics change on every message (no version): formatted separately
+    def queue_status(self):
+        if not self.agent_id_map:
+            return '[SendQueue] -'
+        return '[SendQueue] ' + list_str([f'{a.id} {a._send_queue}' for a in self.agent_id_map.values()])
+
     async def add(self, agent: AgentSession):
         async with self._lock:
             if self.get_agent_by_id(agent.id):
@@ -52,6 +58,8 @@ class ConnectedAgents:
                 # self.code_market_map[agent.code] = get_listed_market(agent.code) 
                 self.code_market_map[agent.code] = None  # currently fdr function does not work properly.
             self.agent_id_map[agent.id] = agent
+            agent._send_queue.follow(None if agent.tick_ring else TickBoard.get(agent.code))
+            self.version += 1
             return True, f'agent {agent.id} registered in the server'
 
     async def remove(self, agent: AgentSession):
@@ -62,12 +70,14 @@ class ConnectedAgents:
                 if target:
                     agent_list.remove(target)
                     del self.agent_id_map[agent.id]
+                    target._send_queue.follow(None)
                     self.dashboard_manager.unregister_dp(target.dp)
 
                     # clean up emtpy code
                     if not agent_list:
                         del self.code_agent_map[agent.code]
                         del self.code_market_map[agent.code]
+                    self.version += 1
                     return f"[ConnectedAgents] agent {agent.id} removed from the server"
             return f"[ConnectedAgents] agent {agent.id} not found"
 
@@ -77,5 +87,3 @@ class ConnectedAgents:
     def get_all_agents(self):
         return list(self.agent_id_map.values())
 
-    def get_target_agents_by_trp(self, trp: TransactionPrices):
-        return self.code_agent_map.get(trp.code, []).copy()
@@ -0,0 +1,161 @@
+from datetime import date
+from enum import Enum, auto
+import asyncio
+import pickle
+import os
+
+from ..base.settings import DATA_DIR, OM_journal_filename, journal_flush_interval, journal_flush_size, journal_fsync
+
+class JournalKind(Enum):
+    ORDER = auto() # (kind, code, order): order snapshot, upserted by order_no
+    TRN = auto() # (kind, code, notice): pending trn added
+    TRN_POP = auto() # (kind, code, order_no): pending trns consumed
+    DISPATCH = auto() # (kind, code, agent_id, seq, data)
+    ACK = auto() # (kind, code, agent_id, seq): dispatches up to seq acknowledged
+    DISPATCH_CLEAR = auto() # (kind, code, agent_id)
+
+class OrderJournal:
+    """
+    Append-only write-ahead journal of OrderManager changes (server side)
+    - records are appended as changes happen and buffered in memory
+    - commit(): writes the buffered records to the files right away (in the event loop, no fsync)
+      called by OrderManager before a dispatch leaves the server, so the records a dispatch depends on are written first
+    - run(): every journal_flush_interval (or earlier if journal_flush_size records are buffered), commits and fsyncs
+    - loss window: none on a crash of the server process (records are in the OS before the dispatch is sent);
+      up to journal_flush_interval of records on an OS crash / power loss (fsync is batched, if journal_fsync)
+    - file: order_journal_<service>_<date>.<gen>.jnl / record: 4 byte length + pickle (the same framing as the local comm)
+
+    compaction (done by OrderManager)
+    - rotate(): following records go to the next gen
+    - snapshot (.pkl) is written with the covered gen
+    - remove_segments(): segments covered by the snapshot are removed
+    - on restart, snapshot is loaded and segments newer than the covered gen are replayed
+    """
+    def __init__(self, logger, service):
+        self.logger = logger
+        self.prefix = f"{OM_journal_filename}{service}_"
+
+        self._buffer: list[tuple[str, bytes]] = [] # (path, framed record)
+        self._files: dict[str, object] = {} # path: open segment file
+        self._unsynced: set[str] = set() # paths written since the last fsync
+        self._flush_lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+
+        self.dates: set[str] = set() # dates with records since the last rotate
+        self.gen: int = max((g for _, g, _ in self.segments()), default=0) + 1
+
+    def _path(self, date_, gen):
+        return os.path.join(DATA_DIR, f"{self.prefix}{date_}.{gen}.jnl")
+
+    # [(date_, gen, path), ...] sorted by gen
+    def segments(self, date_=None):
+        res = []
+        for fname in os.listdir(DATA_DIR):
+            if not (fname.startswith(self.prefix) and fname.endswith(".jnl")):
+                continue
+            d_, g_ = fname[len(self.prefix):-len(".jnl")].split('.')
+            if date_ is None or d_ == date_:
+                res.append((d_, int(g_), os.path.join(DATA_DIR, fname)))
+        return sorted(res, key=lambda x: x[1])
+
+    def append(self, record: tuple, date_=None):
+        if date_ is None:
+            date_ = date.today().isoformat()
+        data = pickle.dumps(record) # data freezed this moment
+        self._buffer.append((self._path(date_, self.gen), len(data).to_bytes(4, "big") + data))
+        self.dates.add(date_)
+        if len(self._buffer) >= journal_flush_size:
+            self._flush_event.set()
+
+    def rotate(self):
+        # returns the gen that a snapshot taken right now covers, and the dates changed since the last rotate
+        covered, dates = self.gen, self.dates
+        self.gen += 1
+        self.dates = set()
+        return covered, dates
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), journal_flush_interval)
+            except TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    def commit(self):
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        written = set()
+        for i, (path, data) in enumerate(buffer):
+            try:
+                f = self._files.get(path)
+                if f is None:
+                    f = self._files[path] = open(path, "ab")
+                f.write(data)
+                written.add(path)
+            except OSError as e:
+                self._buffer[:0] = buffer[i:] # put back in front, retried on the next commit
+                self.logger.error(f"[OrderJournal] write failed, {len(buffer) - i} records kept in buffer: {e}")
+                break
+        for path in written:
+            try:
+                self._files[path].flush() # to the OS: survives a crash of the process
+            except OSError as e:
+                self.logger.error(f"[OrderJournal] write failed: {e}")
+        self._unsynced |= written
+
+    async def flush(self):
+        async with self._flush_lock:
+            self.commit()
+            if not self._unsynced or not journal_fsync:
+                self._unsynced.clear()
+                return
+            files, self._unsynced = [self._files[p] for p in self._unsynced if p in self._files], set()
+            try:
+                await asyncio.to_thread(lambda: [os.fsync(f.fileno()) for f in files])
+            except (OSError, ValueError) as e: # ValueError: closed meanwhile (segment removed)
+                self.logger.error(f"[OrderJournal] fsync failed: {e}")
+
+    def close(self):
+        self.commit()
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        self._unsynced.clear()
+
+    # yields records of date_ in segments newer than after_gen
+    def read(self, date_, after_gen=0):
+        for _, gen, path in self.segments(date_):
+            if gen <= after_gen:
+                continue
+            with open(path, "rb") as f:
+                while True:
+                    length_bytes = f.read(4)
+                    if not length_bytes:
+                        break
+                    length = int.from_bytes(length_bytes, "big")
+                    data = f.read(length)
+                    if len(length_bytes) < 4 or len(data) < length: # crash during write
+                        self.logger.warning(f"[OrderJournal] truncated record at the end of {os.path.basename(path)}")
+                        break
+                    yield pickle.loads(data)
+
+    def remove_segments(self, date_, upto_gen):
+        for _, gen, path in self.segments(date_):
+            if gen <= upto_gen:
+                self._remove(path)
+
+    # segments of the dates before date_ (older than the days kept)
+    def remove_before(self, date_):
+        for d, _, path in self.segments():
+            if d < date_:
+                self._remove(path)
+
+    def _remove(self, path):
+        f = self._files.pop(path, None)
+        if f is not None:
+            f.close()
+        self._unsynced.discard(path)
+        os.remove(path)
@@ -1,16 +1,21 @@
+from dataclasses import asdict
 from datetime import date, timedelta
 import asyncio
+import copy
 import pickle
 import os
 import time
+import uuid
 
 from .comm_interface import AgentSession
 from .comm_interface import Sync, OM_Dispatch, Dispatch_ACK
-from ..base.settings import DATA_DIR, OM_save_filename, disk_save_period, order_manager_keep_days
+from .order_journal import OrderJournal, JournalKind
+from ..base.settings import DATA_DIR, OM_save_filename, disk_save_period, order_manager_keep_days, order_manager_lazy_load, agent_resume_window
 from ..base.tools import merge_with_suffix_on_A, list_str, dict_key_number
 from ..kis.kis_tools import KIS_Functions
 from ..kis.ws_data import TransactionNotice
 from ..model.order import Order, CancelOrder
+from ..model.order_book import RecordStats
 from ..comm.conn_agents import ConnectedAgents
 
 # this is a server side application
@@ -56,8 +61,8 @@ class OrderManager:
                 ...
             }
             pending_dispatches: {  # indexed
-                agent_id: {id: data, id: data, ...}
-                agent_id: {id: data, id: data, ...}
+                agent_id: {seq: data, seq: data, ...}
+                agent_id: {seq: data, seq: data, ...}
                 ...
             }
         },
@@ -78,14 +83,56 @@ class OrderManager:
                 ...
             }
             pending_dispatches: {  # indexed
-                agent_id: {id: data, id: data, ...}
-                agent_id: {id: data, id: data, ...}
+                agent_id: {seq: data, seq: data, ...}
+                agent_id: {seq: data, seq: data, ...}
                 ...
             }
         },
         ...
     }
+    # pending dispatches are keyed by seq, replayed in seq order and removed up to seq by cumulative ACKs (compared by seq, not by dict order)
+    # pending dispatches hold copies taken at dispatch time (orders in the map keep changing with later notices)
     # pending dispatches are already reflected in the server side (order_manager) data, so wheyn sync is processed, 1) clear pending_dispatches for the agent and 2) do not send it
+
+    order_index = {date_: {}, }
+    order_index[date_] = {
+        code: {
+            order_no: (agent_id, order), # incompleted orders only
+            ...
+        },
+        ...
+    }
+    # mirrors incompleted_orders in map for notice routing without scanning all agents
+
+    # persistence
+    - every change of map is appended to the journal (OrderJournal) as it happens
+    - the journal is committed (written, not fsynced) before a dispatch is sent: what an agent has seen is on disk
+      (an OS crash may still lose up to journal_flush_interval, see OrderJournal)
+    - journal is compacted into the daily snapshot (.pkl) every disk_save_period
+    - snapshot (.pkl, .idx) and journal files of the days before keep_days are removed on compaction
+    - on start, snapshots are loaded and journal records not covered by the snapshots are replayed
+    - with order_manager_lazy_load, only today is loaded on start
+      previous days are kept in lazy_days and loaded when get_agent_sync needs them
+
+    lazy_days = {
+        date_: {code: {agent_id, ...}, ...}, # from the snapshot index file (.idx)
+        date_: None, # index not available: loaded on any sync reaching the date
+        ...
+    }
+
+    # session resume
+    - dispatch_seqs: {agent_id: last seq}, kept across the agent's sessions and seeded from the pending dispatches loaded on start
+    - detached: {agent_id: (session, monotonic time of disconnection)}
+      notices of a detached agent are kept in pending_dispatches (not sent) for agent_resume_window
+      on resume, dispatches up to the agent's last received seq are removed and the rest are replayed
+
+    # agent sync
+    - orders before today are sent as a summary of their stats (RecordStats), cached per (agent, code, sync_start_date) for the day
+    - today's orders are sent as copies taken under the code lock, with a cursor (sync_epoch, date, sync_version)
+    - order_versions = {date_: {agent_id: {order_no: sync_version of the last change}}}
+      an agent presenting a cursor of this server run and day gets only the orders changed after it (delta sync)
+    - the code lock is not held until the agent replies: dispatches to a syncing agent are kept in pending_dispatches
+      and sent when the agent notifies the sync completion (those before the sync are reflected in the sync data and cleared)
     """
     def __init__(self, logger, connected_agents: ConnectedAgents, kf: KIS_Functions, service):
         self.logger = logger
@@ -96,10 +143,35 @@ class OrderManager:
 
         # top-level map: code -> agent_id -> state dict
         self.map: dict[str, dict[str, dict]] = {}
+        self.order_index: dict[str, dict[str, dict[str, tuple[str, Order | CancelOrder]]]] = {}
 
         # explicit lock storage
         self._locks: dict[str, asyncio.Lock] = {}
 
+        # write-ahead journal, run() has to be running in the server
+        self.journal = OrderJournal(self.logger, self.service)
+
+        # previous days not loaded yet
+        self.lazy_days: dict[str, dict[str, set[str]] | None] = {}
+        self._lazy_load_lock = asyncio.Lock()
+
+        # session resume
+        self.dispatch_seqs: dict[str, int] = {}
+        self.detached: dict[str, tuple[AgentSession, float]] = {}
+
+        # agent sync
+        self.sync_epoch = uuid.uuid4().hex # cursors of a previous server run are not valid
+        self.sync_version = 0 # increases on every order change
+        self.order_versions: dict[str, dict[str, dict[str, int]]] = {}
+        self.sync_summaries: dict[tuple[str, str, str], tuple[str, dict]] = {} # (agent_id, code, sync_start_date): (date_, summary)
+        self.syncing: set[str] = set() # agent ids
+
+        # status text cache for the server dashboard
+        self.version = 0 # increases on every change
+        self._dirty_codes: set[str] = set()
+        self._status_cache: dict[str, str] = {} # code: rendered text (for _status_date)
+        self._status_date: str | None = None
+
         self.sec = lambda t: int(t[:2])*3600 + int(t[2:4])*60 + int(t[4:6])
         self.load_history()
 
@@ -112,93 +184,158 @@ class OrderManager:
         })
         return code_map
 
+    def _get_order_index(self, code, date_=None):
+        if date_ is None:
+            date_ = date.today().isoformat()
+        return self.order_index.setdefault(date_, {}).setdefault(code, {})
+
+    def _build_order_index(self, date_):
+        self.order_index[date_] = {}
+        for code, code_map in self.map.get(date_, {}).items():
+            index = self._get_order_index(code, date_)
+            for agent_id, orders_dict in code_map[INCOMPLETED_ORDERS].items():
+                for order_no, order in orders_dict.items():
+                    index[order_no] = (agent_id, order)
+
     def _get_lock(self, code: str) -> asyncio.Lock:
         return self._locks.setdefault(code, asyncio.Lock())
 
+    # marks the code as changed; only changed codes are re-rendered in __str__
+    def _touch(self, code):
+        self.version += 1
+        self._dirty_codes.add(code)
+
     def __str__(self):
         if not self.map:
             return "[OrderManager] no map initialized"
         date_ = max(self.map.keys())
-        res = f'[OrderManager] for {date_}, codes: ' + list_str(self.map[date_].keys()) +'\n'
-        for code, code_map in self.map[date_].items():
-            res += f'- {code}\n'
-            res += f'  {PENDING_TRNS}: ' + dict_key_number(code_map[PENDING_TRNS])+'\n' 
-            res += f'  {INCOMPLETED_ORDERS}: \n'
-            for agent_id, orders_dict in code_map[INCOMPLETED_ORDERS].items():
-                res += f'  - {agent_id}: total {len(orders_dict)} orders\n'
-                for _, o in orders_dict.items():
-                    res += f'    - {o}\n'
-            res += f'  {COMPLETED_ORDERS}: \n'
-            for agent_id, orders_dict in code_map[COMPLETED_ORDERS].items():
-                res += f'  - {agent_id}: total {len(orders_dict)} orders\n'
-                for _, o in orders_dict.items():
-                    res += f'    - {o}\n'
-            res += f'  {PENDING_DISPATCHES}: \n'
-            for agent_id, data_dict in code_map[PENDING_DISPATCHES].items():
-                res += f'  - {agent_id}: total {len(data_dict)} items\n'
-                for _, o in data_dict.items():
-                    res += f'    - {o}\n'
+        if date_ != self._status_date: # date changed: render all again
+            self._status_date = date_
+            self._status_cache.clear()
+
+        date_map = self.map[date_]
+        for code, code_map in date_map.items():
+            if code in self._dirty_codes or code not in self._status_cache:
+                self._status_cache[code] = self._code_status(code, code_map)
+        self._dirty_codes.clear()
+
+        res = f'[OrderManager] for {date_}, codes: ' + list_str(date_map.keys()) +'\n'
+        for code in date_map.keys():
+            res += self._status_cache[code]
         return res.strip()
 
+    def _code_status(self, code, code_map):
+        res = f'- {code}\n'
+        res += f'  {PENDING_TRNS}: ' + dict_key_number(code_map[PENDING_TRNS])+'\n' 
+        res += f'  {INCOMPLETED_ORDERS}: \n'
+        for agent_id, orders_dict in code_map[INCOMPLETED_ORDERS].items():
+            res += f'  - {agent_id}: total {len(orders_dict)} orders\n'
+            for _, o in orders_dict.items():
+                res += f'    - {o}\n'
+        res += f'  {COMPLETED_ORDERS}: \n'
+        for agent_id, orders_dict in code_map[COMPLETED_ORDERS].items():
+            res += f'  - {agent_id}: total {len(orders_dict)} orders\n'
+            for _, o in orders_dict.items():
+                res += f'    - {o}\n'
+        res += f'  {PENDING_DISPATCHES}: \n'
+        for agent_id, data_dict in code_map[PENDING_DISPATCHES].items():
+            res += f'  - {agent_id}: total {len(data_dict)} items\n'
+            for _, o in data_dict.items():
+                res += f'    - {o}\n'
+        return res
+
     # sync is based first by code, and then by checking if agent.id exists
     # sync_start_date should be an isoformat ("YYYY-MM-DD")
-    async def get_agent_sync(self, agent: AgentSession, sync_start_date: str | None = None):
-        lock = self._get_lock(agent.code)
-        await lock.acquire()
-
+    # cursor: from the agent's last sync (None: full sync)
+    async def get_agent_sync(self, agent: AgentSession, sync_start_date: str | None = None, cursor: tuple | None = None):
         today_ = date.today().isoformat()
         if sync_start_date is None: sync_start_date = today_
+        delta = cursor is not None and tuple(cursor[:2]) == (self.sync_epoch, today_)
+        if not delta:
+            await self._load_lazy_days(agent, sync_start_date)
 
-        pios = {} # prev incompleted order 
-        ios = {} # for today
-        cos = {} # all days
-        ptrns = {} # for today
-
-        # incompleted_orders: multi-day sync needed (as an order can be partially executed)
-        # completed_orders: multi-day sync needed
-        # pending_trns: should exist only for today, and only today data will be sent
-        for d_ in sorted(self.map.keys()): # dates are isoformat "yyyy-mm-dd"
-            if d_ < sync_start_date: continue
+        async with self._get_lock(agent.code):
+            summary = None if delta else self._sync_summary(agent, sync_start_date, today_)
+            pios = {} # prev incompleted order, already in the summary
+            ios = {} # for today
+            cos = {} # for today
+            ptrns = {} # for today
 
-            date_map = self.map.get(d_)
-            if not date_map: continue
+            if not delta:
+                for d_ in sorted(self.map.keys()):
+                    if sync_start_date <= d_ < today_ and agent.code in self.map[d_]:
+                        pios = merge_with_suffix_on_A(pios, self.map[d_][agent.code][INCOMPLETED_ORDERS].get(agent.id, {}))
 
-            code_map = date_map.get(agent.code)
+            code_map = self._get_code_map(agent.code)
+            versions = self.order_versions.get(today_, {}).get(agent.id, {})
+            since = cursor[2] if delta else 0
+            for target, orders in ((ios, code_map[INCOMPLETED_ORDERS]), (cos, code_map[COMPLETED_ORDERS])):
+                for order_no, order in orders.get(agent.id, {}).items():
+                    if not delta or versions.get(order_no, 0) > since:
+                        target[order_no] = order
+            ptrns = {k: list(v) for k, v in code_map[PENDING_TRNS].items()}
+
+            # copies: orders keep changing after the lock is released, and the changes reach the agent as dispatches
+            pios, ios, cos = ({k: copy.copy(o) for k, o in d.items()} for d in (pios, ios, cos))
+
+            # pending dispatches so far are reflected in the sync data / later ones are sent on the sync completion
+            if code_map[PENDING_DISPATCHES].pop(agent.id, None) is not None:
+                self.journal.append((JournalKind.DISPATCH_CLEAR, agent.code, agent.id))
+                self._touch(agent.code)
+            self.syncing.add(agent.id)
+            cursor = (self.sync_epoch, today_, self.sync_version)
+
+        self.logger.info(f"[OrderManager] agent {'delta' if delta else 'full'} sync data sent: {len(ios)+len(cos)} orders of today", extra={"owner": agent.id})
+        return Sync(agent.id, pios, ios, cos, ptrns, summary, cursor, delta)
+
+    # stats of the agent's orders from sync_start_date to yesterday (these do not change any more)
+    def _sync_summary(self, agent: AgentSession, sync_start_date: str, today_: str):
+        key = (agent.id, agent.code, sync_start_date)
+        cached = self.sync_summaries.get(key)
+        if cached is not None and cached[0] == today_:
+            return cached[1]
+
+        stats = RecordStats()
+        for d_ in sorted(self.map.keys()): # dates are isoformat "yyyy-mm-dd"
+            if not sync_start_date <= d_ < today_: continue
+            code_map = self.map[d_].get(agent.code)
             if not code_map: continue
 
-            if d_ < today_:
-                pios = merge_with_suffix_on_A(pios, code_map[INCOMPLETED_ORDERS].get(agent.id, {}))
-                cos = merge_with_suffix_on_A(cos, code_map[COMPLETED_ORDERS].get(agent.id, {}))
-                if code_map[PENDING_TRNS]: # if not empty for prev dates, log error
-                    self.logger.error(f"[OrderManager] pending trns not empty: {code_map[PENDING_TRNS]} for date {d_} - check the validity of incompleted orders required", extra={"owner": agent.id})
-            else: # d_ == today_
-                ios = code_map[INCOMPLETED_ORDERS].get(agent.id, {})
-                cos = merge_with_suffix_on_A(cos, code_map[COMPLETED_ORDERS].get(agent.id, {}))
-                ptrns = code_map[PENDING_TRNS]
-
-        self.logger.info(f"[OrderManager] agent sync data sent", extra={"owner": agent.id})
-        return Sync(agent.id, pios, ios, cos, ptrns)
-
-    async def agent_sync_completed_lock_release(self, agent: AgentSession):
-        lock = self._get_lock(agent.code)
-        if lock and lock.locked():
-            # to avoid deadlock with ack_received(), release first
-            lock.release()
-
-            # handling of pending dispatches
-            code_map = self._get_code_map(agent.code)
-            code_map[PENDING_DISPATCHES].pop(agent.id, None) # may or may not exist
+            # prev incompleted orders: has to be dealt like completed orders
+            for orders in (code_map[COMPLETED_ORDERS], code_map[INCOMPLETED_ORDERS]):
+                for order in orders.get(agent.id, {}).values():
+                    stats.add(order)
+            if code_map[PENDING_TRNS]: # if not empty for prev dates, log error
+                self.logger.error(f"[OrderManager] pending trns not empty: {code_map[PENDING_TRNS]} for date {d_} - check the validity of incompleted orders required", extra={"owner": agent.id})
+
+        summary = asdict(stats)
+        self.sync_summaries[key] = (today_, summary)
+        return summary
 
-            self.logger.info(f"[OrderManager] agent sync completed", extra={"owner": agent.id})
+    async def agent_sync_completed(self, agent: AgentSession):
+        async with self._get_lock(agent.code):
+            if agent.id not in self.syncing:
+                self.logger.error(f"[OrderManager] agent sync completion without sync: code {agent.code}", extra={"owner": agent.id})
+                return False
+            self.syncing.discard(agent.id)
+
+            # dispatches after the sync data: copies taken at dispatch time, not the orders as they are now
+            # (the sync data has copies as of the sync, and the held notices bring them up to date)
+            agent_map = self._get_code_map(agent.code)[PENDING_DISPATCHES].get(agent.id, {})
+            for seq, data in self._in_seq_order(agent_map):
+                await agent.dispatch(OM_Dispatch(data, seq))
+
+            self.logger.info(f"[OrderManager] agent sync completed, {len(agent_map)} dispatches sent", extra={"owner": agent.id})
             return True
-        else:
-            self.logger.error(f"[OrderManager] agent sync lock released FAILED: code {agent.code}", extra={"owner": agent.id})
-            return False
 
     def _update_map(self, code_map, order: Order | CancelOrder):
+        self.journal.append((JournalKind.ORDER, order.code, order))
+        self._order_changed(order)
         # move to completed if finished 
         if order.completed:
+            order_index = self._get_order_index(order.code)
             code_map[INCOMPLETED_ORDERS].get(order.agent_id, {}).pop(order.order_no, None)
+            order_index.pop(order.order_no, None)
             code_map[COMPLETED_ORDERS].setdefault(order.agent_id, {})[order.order_no] = order
 
             if not order.is_regular_order: 
@@ -216,34 +353,54 @@ class OrderManager:
                 if original_order.quantity == original_order.processed:
                     original_order.completed = True
                     code_map[INCOMPLETED_ORDERS].get(order.agent_id).pop(order.original_order_no)
+                    order_index.pop(order.original_order_no, None)
                     code_map[COMPLETED_ORDERS].setdefault(order.agent_id, {})[original_order.order_no] = original_order
+                self.journal.append((JournalKind.ORDER, original_order.code, original_order))
+                self._order_changed(original_order)
+
+    def _order_changed(self, order: Order | CancelOrder):
+        self.sync_version += 1
+        versions = self.order_versions.setdefault(date.today().isoformat(), {})
+        versions.setdefault(order.agent_id, {})[order.order_no] = self.sync_version
+
+    async def _submit_request(self, order: Order | CancelOrder):
+        if order.is_regular_order:
+            return await self.kf.order_cash(
+                ord_dv=order.side, 
+                pdno=order.code, 
+                mtype=order.mtype, 
+                ord_qty=order.quantity,
+                ord_unpr=order.price, 
+                excg_id_dvsn_cd=order.exchange
+                )
+        else: # CancelOrder
+            return await self.kf.order_rvsecncl(
+                krx_fwdg_ord_orgno=order.original_order_org_no,
+                orgn_odno=order.original_order_no,
+                mtype=order.mtype, 
+                rvse_cncl_dvsn_cd='02', # cancel
+                ord_qty=order.quantity, # to cancel quantity
+                ord_unpr=0, # send it with 0 (cancel)
+                qty_all_ord_yn=order.qty_all_yn, 
+                excg_id_dvsn_cd=order.exchange
+            )
 
     async def submit_orders_and_register(self, agent, orders: list[Order | CancelOrder]):
         if any(o.submitted for o in orders):
             self.logger.error(f"[OrderManager] orders already submitted: no actions taken", extra={"owner": agent.id})
             return False
-        
-        for order in orders:
-            if order.is_regular_order:
-                res = await self.kf.order_cash(
-                    ord_dv=order.side, 
-                    pdno=order.code, 
-                    mtype=order.mtype, 
-                    ord_qty=order.quantity,
-                    ord_unpr=order.price, 
-                    excg_id_dvsn_cd=order.exchange
-                    )
-            else: # CancelOrder
-                res = await self.kf.order_rvsecncl(
-                    krx_fwdg_ord_orgno=order.original_order_org_no,
-                    orgn_odno=order.original_order_no,
-                    mtype=order.mtype, 
-                    rvse_cncl_dvsn_cd='02', # cancel
-                    ord_qty=order.quantity, # to cancel quantity
-                    ord_unpr=0, # send it with 0 (cancel)
-                    qty_all_ord_yn=order.qty_all_yn, 
-                    excg_id_dvsn_cd=order.exchange
-                )
+
+        # REST requests are started together (in order, spaced by the rate limiter) and overlap
+        # results are handled in the submitted order, each as soon as it and the ones before it are done
+        # - cancel orders refer to already submitted orders (order_no), so orders in a batch are independent
+        # - batches of an agent do not overlap (requests of a client are handled one by one)
+        requests = [asyncio.create_task(self._submit_request(order)) for order in orders]
+        for order, request in zip(orders, requests):
+            try:
+                res = await request
+            except Exception as e: # not cancelling the others: they may be already accepted by KIS
+                self.logger.error(f"[OrderManager] order submit error, uid {order.unique_id}: {e}", extra={"owner": agent.id}, exc_info=True)
+                res = None
 
             if res is None:
                 self.logger.error(f"[OrderManager] order submit failed, uid {order.unique_id}", extra={"owner": agent.id})
@@ -263,16 +420,22 @@ class OrderManager:
                 # register incompleted order
                 code_map = self._get_code_map(agent.code)
                 code_map[INCOMPLETED_ORDERS].setdefault(agent.id, {})[order.order_no] = order
+                self._get_order_index(agent.code)[order.order_no] = (agent.id, order)
+                self.journal.append((JournalKind.ORDER, agent.code, order))
 
                 # process pending notices
                 # - catch notices that are delivered before order submission is completed
-                for notice in code_map[PENDING_TRNS].pop(order.order_no, []):
+                pending_trns = code_map[PENDING_TRNS].pop(order.order_no, [])
+                if pending_trns:
+                    self.journal.append((JournalKind.TRN_POP, agent.code, order.order_no))
+                for notice in pending_trns:
                     res = order.update(notice)
                     if res:
                         self.logger.info(res, extra={"owner": agent.id})
                     # send back notice to the agent right away
                     await self.dispatch_handler(agent, notice) 
                 self._update_map(code_map, order)
+                self._touch(agent.code)
         return True
 
     async def process_tr_notice(self, notice: TransactionNotice):
@@ -282,23 +445,21 @@ class OrderManager:
         # trn: order = N : 1 relationship
         async with self._get_lock(notice.code):
             code_map = self._get_code_map(notice.code)
-            order = None
             # find order by notice.order_no (which doesn't have agent id)
-            for _, order_dict in code_map[INCOMPLETED_ORDERS].items(): 
-                order = order_dict.get(notice.order_no)
-                if order: 
-                    break # stop finding
+            _, order = self._get_order_index(notice.code).get(notice.order_no, (None, None))
             if order:  
                 res = order.update(notice)
                 if res:
                     self.logger.info(res, extra={"owner": order.agent_id})
                 self._update_map(code_map, order)
-                agent = self.connected_agents.get_agent_by_id(order.agent_id)
-                if agent: # if agent is still connected
+                agent = self.connected_agents.get_agent_by_id(order.agent_id) or self._detached_session(order.agent_id)
+                if agent: # if agent is still connected (or may resume)
                     await self.dispatch_handler(agent, notice)
             else:
                 # otherwise save it to pending_trns
                 code_map[PENDING_TRNS].setdefault(notice.order_no, []).append(notice)
+                self.journal.append((JournalKind.TRN, notice.code, notice))
+            self._touch(notice.code)
 
     # checks if pending trns persist for a specific code
     # runs as an independent coroutine on the server
@@ -331,59 +492,261 @@ class OrderManager:
             await asyncio.sleep(disk_save_period)
             await self._save_once() 
 
-    # save only today's record
+    def _snapshot_path(self, date_, ext='.pkl'):
+        return os.path.join(DATA_DIR, f"{OM_save_filename}{self.service}_{date_}{ext}")
+
+    # compaction: saves today's record and any date changed since the last save, then drops the covered journal
+    # - code locks are not needed: the snapshot is taken without await, and later changes go to the next journal gen
     async def _save_once(self):
             os.makedirs(DATA_DIR, exist_ok=True)
             date_ = date.today().isoformat()
-            date_map = self.map.get(date_, {})
 
-            # acquire all code locks in parallel
-            locks = [self._get_lock(code) for code in date_map.keys()]
-            await asyncio.gather(*(lock.acquire() for lock in locks))
-            try:
-                filename = os.path.join(DATA_DIR, f"{OM_save_filename}{self.service}_{date_}.pkl")
-                with open(filename, "wb") as f:
-                    pickle.dump(dict(date_map), f)
-            finally:
-                # Release all locks
-                for lock in locks:
-                    lock.release()
+            covered, dates = self.journal.rotate()
+            dates = {d for d in dates if d in self.map} | {date_} # lazy days are not loaded, so not to be overwritten
+            # snapshot file: pickled date_map followed by the covered journal gen
+            snapshots = {d: pickle.dumps(dict(self.map.get(d, {}))) + pickle.dumps(covered) for d in dates}
+            indexes = {d: pickle.dumps(self._day_index(self.map.get(d, {}))) for d in dates}
+
+            await self.journal.flush() # covered records are on disk until the snapshot replaces them
+            for d, data in snapshots.items():
+                await asyncio.to_thread(self._write_snapshot, self._snapshot_path(d), data)
+                await asyncio.to_thread(self._write_snapshot, self._snapshot_path(d, '.idx'), indexes[d])
+                self.journal.remove_segments(d, covered)
 
             # clean up old dates
             cutoff = (date.today() - timedelta(days=self.load_days)).isoformat()
+            self._remove_old_files(cutoff)
             dates_to_remove = [d for d in self.map.keys() if d < cutoff]
             for d in dates_to_remove:
                 del self.map[d]
+                self.order_index.pop(d, None)
+            for d in [d for d in self.lazy_days.keys() if d < cutoff]:
+                del self.lazy_days[d]
+            for d in [d for d in self.order_versions.keys() if d < date_]:
+                del self.order_versions[d]
+            for k in [k for k, (d, _) in self.sync_summaries.items() if d < date_]:
+                del self.sync_summaries[k]
             return date_
-    
+
+    # snapshot / index files and journal segments of the dates before cutoff
+    def _remove_old_files(self, cutoff):
+        prefix = f"{OM_save_filename}{self.service}_"
+        for fname in os.listdir(DATA_DIR):
+            if fname.startswith(prefix) and fname.endswith(('.pkl', '.idx')) and fname[len(prefix):].split('.')[0] < cutoff:
+                os.remove(os.path.join(DATA_DIR, fname))
+        self.journal.remove_before(cutoff)
+
+    @staticmethod
+    def _write_snapshot(path, data: bytes):
+        tmp = path + '.tmp'
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path) # atomic
+
+    # compact index of a day: which agents have orders on which code
+    @staticmethod
+    def _day_index(date_map: dict):
+        return {
+            code: set(code_map[INCOMPLETED_ORDERS].keys()) | set(code_map[COMPLETED_ORDERS].keys())
+            for code, code_map in date_map.items()
+        }
+
+    # returns (date_map, covered journal gen)
+    @staticmethod
+    def _read_snapshot(path):
+        if not os.path.exists(path):
+            return {}, 0 # journal only (crashed before the first save of the day)
+        with open(path, "rb") as f:
+            date_map = pickle.load(f)
+            try:
+                covered = pickle.load(f)
+            except EOFError: # saved without journal
+                covered = 0
+        return date_map, covered
+
+    # installs a day read from the snapshot, and replays journal records not covered by the snapshot
+    def _install_day(self, date_, date_map, covered):
+        self.map[date_] = date_map
+        n = 0
+        for record in self.journal.read(date_, covered):
+            self._apply_journal_record(date_, record)
+            n += 1
+        if n:
+            self.journal.dates.add(date_) # to be compacted on the next save
+        self._build_order_index(date_)
+        self._seed_dispatch_seqs(date_)
+        self._status_cache.clear()
+        self.version += 1
+        return n
+
+    # seq numbers continue after the loaded pending dispatches (new ones would overwrite them)
+    def _seed_dispatch_seqs(self, date_):
+        for code_map in self.map[date_].values():
+            for agent_id, agent_map in code_map[PENDING_DISPATCHES].items():
+                seqs = [k for k in agent_map if isinstance(k, int)] # non-int: uuid keys from before seq numbering
+                if seqs:
+                    self.dispatch_seqs[agent_id] = max(self.dispatch_seqs.get(agent_id, 0), max(seqs))
+
     def load_history(self):
+        started = time.perf_counter()
         self.map.clear()
+        self.order_index.clear()
+        self.lazy_days.clear()
+        today_ = date.today().isoformat()
         cutoff_date = (date.today() - timedelta(days=self.load_days)).isoformat()
-        for fname in sorted(os.listdir(DATA_DIR)):
-            if not (fname.startswith(f"{OM_save_filename}{self.service}") and fname.endswith(".pkl")):
-                continue
-            date_ = fname.split('.')[0].split('_')[-1] # 'YYYY-MM-DD'
+
+        dates = set(d for d, _, _ in self.journal.segments())
+        for fname in os.listdir(DATA_DIR):
+            if fname.startswith(f"{OM_save_filename}{self.service}") and fname.endswith(".pkl"):
+                dates.add(fname.split('.')[0].split('_')[-1]) # 'YYYY-MM-DD'
+
+        replayed = 0
+        for date_ in sorted(dates):
             if date_ < cutoff_date:
                 continue  # skip old files
-            path = os.path.join(DATA_DIR, fname)
-            with open(path, "rb") as f:
-                self.map[date_] = pickle.load(f)
-            self.logger.info(f"[OrderManager] loaded history for {date_} ({fname})")
+            if order_manager_lazy_load and date_ < today_:
+                self.lazy_days[date_] = self._read_day_index(date_)
+                continue
+            date_map, covered = self._read_snapshot(self._snapshot_path(date_))
+            replayed += self._install_day(date_, date_map, covered)
+            self.logger.info(f"[OrderManager] loaded history for {date_}")
+
+        elapsed = (time.perf_counter() - started)*1000
+        self.logger.info(f"[OrderManager] start-up load {elapsed:.1f} ms: {len(self.map)} days loaded, {replayed} journal records replayed, {len(self.lazy_days)} days lazy")
+
+    def _read_day_index(self, date_):
+        path = self._snapshot_path(date_, '.idx')
+        if not os.path.exists(path) or self.journal.segments(date_): # index does not cover journal records
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    # loads lazy days needed for the agent's sync
+    async def _load_lazy_days(self, agent: AgentSession, sync_start_date: str):
+        async with self._lazy_load_lock:
+            for date_ in sorted(self.lazy_days.keys()):
+                if date_ < sync_start_date:
+                    continue
+                day_index = self.lazy_days[date_]
+                if day_index is not None and agent.id not in day_index.get(agent.code, ()):
+                    continue # nothing for the agent
+                started = time.perf_counter()
+                date_map, covered = await asyncio.to_thread(self._read_snapshot, self._snapshot_path(date_))
+                del self.lazy_days[date_]
+                n = self._install_day(date_, date_map, covered)
+                elapsed = (time.perf_counter() - started)*1000
+                self.logger.info(f"[OrderManager] lazy loaded history for {date_} in {elapsed:.1f} ms ({n} journal records replayed)", extra={"owner": agent.id})
+
+    def _apply_journal_record(self, date_, record: tuple):
+        kind, code, *args = record
+        code_map = self._get_code_map(code, date_)
+        if kind is JournalKind.ORDER:
+            (order, ) = args
+            code_map[INCOMPLETED_ORDERS].setdefault(order.agent_id, {}).pop(order.order_no, None)
+            code_map[COMPLETED_ORDERS].setdefault(order.agent_id, {}).pop(order.order_no, None)
+            target = COMPLETED_ORDERS if order.completed else INCOMPLETED_ORDERS
+            code_map[target][order.agent_id][order.order_no] = order
+        elif kind is JournalKind.TRN:
+            (notice, ) = args
+            code_map[PENDING_TRNS].setdefault(notice.order_no, []).append(notice)
+        elif kind is JournalKind.TRN_POP:
+            (order_no, ) = args
+            code_map[PENDING_TRNS].pop(order_no, None)
+        elif kind is JournalKind.DISPATCH:
+            agent_id, seq, data = args
+            code_map[PENDING_DISPATCHES].setdefault(agent_id, {})[seq] = data
+        elif kind is JournalKind.ACK:
+            agent_id, seq = args
+            self._remove_acked(code_map[PENDING_DISPATCHES].get(agent_id, {}), seq)
+        elif kind is JournalKind.DISPATCH_CLEAR:
+            (agent_id, ) = args
+            code_map[PENDING_DISPATCHES].pop(agent_id, None)
 
     async def dispatch_handler(self, agent: AgentSession, data):
-        d = OM_Dispatch(data)
+        seq = self.dispatch_seqs[agent.id] = self.dispatch_seqs.get(agent.id, 0) + 1
+        # snapshot: the order in the map keeps changing with later notices, which are dispatched (and replayed) on their own
+        d = OM_Dispatch(copy.copy(data), seq)
         code_map = self._get_code_map(agent.code)
-        code_map[PENDING_DISPATCHES].setdefault(agent.id, {})[d.id] = data
-        await agent.dispatch(d)
+        code_map[PENDING_DISPATCHES].setdefault(agent.id, {})[d.seq] = d.data
+        self.journal.append((JournalKind.DISPATCH, agent.code, agent.id, d.seq, d.data))
+        self._touch(agent.code)
+
+        # sent to the agent's current session: none while detached (replayed on resume), a new one if resumed meanwhile
+        # while syncing, sent on the sync completion
+        current = self.connected_agents.get_agent_by_id(agent.id)
+        if current is not None and agent.id not in self.syncing:
+            self.journal.commit() # the records this dispatch reflects (order, notice, dispatch) are written first
+            await current.dispatch(d)
+
+    # a disconnected agent that may resume
+    def detach(self, agent: AgentSession):
+        self.syncing.discard(agent.id)
+        if agent.session_key is not None:
+            self.detached[agent.id] = (agent, time.monotonic())
+
+    def _detached_session(self, agent_id):
+        entry = self.detached.get(agent_id)
+        if entry is None:
+            return None
+        session, since = entry
+        if time.monotonic() - since > agent_resume_window: # needs a full sync now
+            del self.detached[agent_id]
+            return None
+        return session
+
+    async def resume_agent(self, agent: AgentSession, last_seq: int):
+        # returns (success, message)
+        # registration and replay under the code lock: dispatches of new notices come after the replayed ones
+        async with self._get_lock(agent.code):
+            detached = self._detached_session(agent.id)
+            if detached is None or detached.session_key != agent.session_key or detached.code != agent.code:
+                return False, f"[OrderManager] session of {agent.id} cannot be resumed, full sync required"
+
+            success, msg = await self.connected_agents.add(agent)
+            if not success:
+                return False, msg
+            del self.detached[agent.id]
+
+            code_map = self._get_code_map(agent.code)
+            agent_map = code_map[PENDING_DISPATCHES].get(agent.id, {})
+            if self._remove_acked(agent_map, last_seq): # received before the disconnection, not acknowledged
+                self.journal.append((JournalKind.ACK, agent.code, agent.id, last_seq))
+                self._touch(agent.code)
+            for seq, data in self._in_seq_order(agent_map):
+                await agent.dispatch(OM_Dispatch(data, seq))
+
+            self.logger.info(f"[OrderManager] session resumed from seq {last_seq}, {len(agent_map)} dispatches replayed", extra={"owner": agent.id})
+            return True, f"session resumed, {len(agent_map)} dispatches replayed"
+
+    # non-int keys: uuid keys from before seq numbering, taken as the oldest
+    @staticmethod
+    def _in_seq_order(agent_map: dict):
+        return sorted(agent_map.items(), key=lambda kv: kv[0] if isinstance(kv[0], int) else 0)
+
+    # removes dispatches up to seq (non-int keys included) / returns the number removed
+    @staticmethod
+    def _remove_acked(agent_map: dict, seq: int):
+        acked = [k for k in agent_map if not isinstance(k, int) or k <= seq]
+        for k in acked:
+            del agent_map[k]
+        return len(acked)
         
     async def ack_received(self, dispatch_ack: Dispatch_ACK):
         agent = self.connected_agents.get_agent_by_id(dispatch_ack.agent_id)
+        if agent is None: # from a connection already detached: covered by the last seq on resume
+            return
 
         async with self._get_lock(agent.code):
             code_map = self._get_code_map(agent.code)
             agent_map = code_map[PENDING_DISPATCHES].get(agent.id)
-            if not agent_map:
-                self.logger.error(f"[OrderManager] stale ACK: {dispatch_ack}", extra={"owner": agent.id})
+            if not agent_map or not self._remove_acked(agent_map, dispatch_ack.seq):
+                if dispatch_ack.seq <= self.dispatch_seqs.get(agent.id, 0): # acknowledged already (e.g., again after a resume replay)
+                    self.logger.debug(f"[OrderManager] duplicate ACK: {dispatch_ack}", extra={"owner": agent.id})
+                else:
+                    self.logger.error(f"[OrderManager] ACK of a seq not dispatched: {dispatch_ack}", extra={"owner": agent.id})
                 return
-            
-            del agent_map[dispatch_ack.id] # should exist
+
+            self.journal.append((JournalKind.ACK, agent.code, agent.id, dispatch_ack.seq))
+            self._touch(agent.code)
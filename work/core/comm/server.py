@@ -1,14 +1,15 @@
 import asyncio
-import json
 import datetime
+import os
 
-from .comm_interface import AgentSession
+from .comm_interface import AgentSession, TickBoard
 from .comm_handler import CommHandler
 from .conn_agents import ConnectedAgents
 from .subs_manager import SubscriptionManager
 from .order_manager import OrderManager
+from .tick_ring import TickRings
 from ..base.logger import LogSetup
-from ..base.settings import Service, HOST, SERVER_PORT, DASHBOARD_SERVER_PORT, DASHBOARD_MANAGER_PORT, server_broadcast_interval # server_env_file
+from ..base.settings import Service, HOST, SERVER_PORT, SERVER_UNIX_SOCKET, use_unix_socket, use_tick_ring, DASHBOARD_SERVER_PORT, DASHBOARD_MANAGER_PORT, server_broadcast_interval, status_render_interval
 from ..kis.kis_connect import KIS_Connector 
 from ..kis.kis_tools import KIS_Functions
 from ..kis.ws_data import TransactionNotice, TransactionPrices
@@ -19,8 +20,7 @@ class Server:
     def __init__(self, service: Service, logger): 
         self.service = service
         self.logger = logger 
-        # self.server_env = self.get_server_env() # for not leave it as dict
-        self.kc = KIS_Connector(self.logger, self.service, self.on_result) # self.server_env)
+        self.kc = KIS_Connector(self.logger, self.service, self.on_result) # loads tokens saved by a previous run
         self.kf = KIS_Functions(self.kc)
         self.aux_info = AuxInfo(self.service)
         self.dashboard_manager = DashboardManager(self.logger, "manager", DASHBOARD_MANAGER_PORT[self.service])
@@ -29,54 +29,82 @@ class Server:
         self.connected_agents = ConnectedAgents(self.logger, self.dashboard_manager, self.aux_info) 
         self.order_manager = OrderManager(self.logger, self.connected_agents, self.kf, self.service)
         self.subs_manager = SubscriptionManager()
+        self.tick_rings = TickRings(self.logger, self.service) if use_tick_ring else None
         self.comm_handler = CommHandler(self.logger, self)
+        self._status_rendered = None # component versions of _status_components
+        self._status_components = ''
 
-    # def get_server_env(self) -> dict:
-    #     if not server_env_file.exists(): return {}
-    #     with open(server_env_file, 'r', encoding='utf-8') as f: return json.load(f)
-
-    # def save_server_env(self):
-    #     self.server_env['token'] = self.kc.token
-    #     self.server_env['token_exp'] = self.kc.token_exp.strftime('%Y-%m-%d %H:%M:%S') if self.kc.token_exp else None
-    #     # ... to be added ...
-
-    #     self.server_env['token'] = self.kc.token
-    #     with open(server_env_file, 'w', encoding='utf-8') as f:
-    #         json.dump(self.server_env, f, ensure_ascii=False, indent=4)
-
-    def on_result(self, tr_id, n_rows, d):
+    def on_result(self, tr_id, n_rows, payload):
         target = self.kf.tr_id.get_target(tr_id)
 
         if target == "TransactionNotice":
-            trn = TransactionNotice(n_rows, d, self.aux_info)
+            trn = TransactionNotice(n_rows, payload.split('^'), self.aux_info)
             self.logger.info(trn)
             self._tg.create_task(self.order_manager.process_tr_notice(trn))
 
         elif target == "TransactionPrices": 
-            trp = TransactionPrices(n_rows, d)
+            trp = TransactionPrices(n_rows, payload)
             # self.logger.info(trp)
-            self._tg.create_task(AgentSession.dispatch_multiple(self.connected_agents.get_target_agents_by_trp(trp), trp)) 
+            if self.tick_rings is not None:
+                self.tick_rings.publish(trp)
+            TickBoard.get(trp.code).publish(trp) # read by the writers of the agents of the code
 
-        self.get_status()
+        # no status formatting here: render_status() picks up the changes
     
     def get_status(self): 
-        text = (
+        text = self._status_text()
+        # relay to dashboard
+        self.dashboard.enqueue(text)
+        return text
+
+    # versioned components are formatted again only when their version changes
+    # rate limiters, websocket sessions and send queues change without a version: their lines are formatted every time
+    def _status_text(self):
+        versions = self._status_versions()
+        if versions != self._status_rendered:
+            self._status_rendered = versions
+            self._status_components = f"{self.connected_agents}\n{self.subs_manager}\n{self.order_manager}"
+        return (
             f"[Server] {self.service} - dashboard\n"
             f"----------------------------------------------------\n"
-            f"{self.connected_agents}\n"
-            f"{self.subs_manager}\n"
-            f"{self.order_manager}\n"
+            f"{self._status_components}\n"
+            f"{self.connected_agents.queue_status()}\n"
+            f"{self.kc.rate_status()}\n"
+            f"{self.kc.ws_status()}\n"
             f"----------------------------------------------------"
         )
-        # relay to dashboard
-        self.dashboard.enqueue(text)
-        return text
+
+    def _status_versions(self):
+        return (self.connected_agents.version, self.subs_manager.version, self.order_manager.version)
+
+    # renders the status at most once per status_render_interval, and only if the text has changed
+    async def render_status(self):
+        rendered = None
+        while True:
+            await asyncio.sleep(status_render_interval)
+            text = self._status_text()
+            if text == rendered:
+                continue
+            rendered = text
+            self.dashboard.enqueue(text)
 
     async def run_comm_server(self):
-        # listening on HOST:PORT
-        local_server = await asyncio.start_server(self.comm_handler.handle_client, HOST, SERVER_PORT[self.service])  
-        async with local_server:  
-            await local_server.serve_forever()
+        # listening on HOST:PORT (always) and on the unix socket (if enabled)
+        servers = [await asyncio.start_server(self.comm_handler.handle_client, HOST, SERVER_PORT[self.service])]
+        path = None
+        if use_unix_socket and hasattr(asyncio, 'start_unix_server'):
+            path = SERVER_UNIX_SOCKET[self.service]
+            if os.path.exists(path): # left by a previous run (TCP bind above fails first if the server is still running)
+                os.remove(path)
+            servers.append(await asyncio.start_unix_server(self.comm_handler.handle_client, path))
+            self.logger.info(f"[Server] listening on {HOST}:{SERVER_PORT[self.service]} and {path}")
+        try:
+            await asyncio.gather(*(s.serve_forever() for s in servers))
+        finally:
+            for s in servers:
+                s.close()
+            if path is not None and os.path.exists(path): # python < 3.13 does not remove it on close
+                os.remove(path)
 
     async def broadcast_to_clients(self):
         while True:
@@ -98,34 +126,38 @@ class Server:
 
                 # API - server (in addition to the REST connection)
                 tg.create_task(self.kc.run_websocket()) 
+                tg.create_task(self.kc.refresh_tokens()) # tokens renewed ahead of expiry
 
                 # server - clients(agents) using asyncio reader/writer streams
                 tg.create_task(self.run_comm_server()) 
 
                 # other periodic tasks
                 tg.create_task(self.broadcast_to_clients())
+                tg.create_task(self.render_status())
+                tg.create_task(self.order_manager.journal.run())
+                if self.tick_rings is not None:
+                    tg.create_task(self.tick_rings.run()) # wake-up of the tick ring readers
                 tg.create_task(self.order_manager.persist_to_disk())
                 tg.create_task(self.order_manager.pending_trns_timeout())
                 
-                # (re)subscription upon ws reconnect
+                # default subscriptions
                 tg.create_task(self.subscribe())
 
         except Exception as e: 
             self.logger.error(f"[Server] {e}", exc_info=True)
         finally: 
             await self.kc.close_httpx()
+            if self.tick_rings is not None:
+                self.tick_rings.close()
             saved_date = await self.order_manager.persist_to_disk(immediate = True)
-            # self.save_server_env()
+            self.order_manager.journal.close()
             self.logger.info(f"[Server] order_manager saved for {saved_date}")
             self.logger.info(f"[Server] shutdown completed =============================================")
     
     async def subscribe(self):
-        while True:
-            await self.kc.ws_ready.wait()
-            self.kc.ws_ready.clear()
-            # default subscription
-            await self.kf.ccnl_notice() 
-            await self.subs_manager.resubscribe_all() # if needed
+        # default subscription
+        # registrations are kept by the websocket sessions and re-sent on reconnect (no resubscription needed here)
+        await self.kf.ccnl_notice() 
 
 if __name__ == "__main__":
     service = Service.DEMO
@@ -7,6 +7,7 @@ class SubscriptionManager:
     Server side application
     Manage subscriptions from agents 
     note: receiving TR notices (ccnl_notice) is subscripted separately
+    note: placing registrations on websocket sessions (and re-sending them on reconnect) is done by KIS_Connector
     note: this class assumes that all functions are from one KIS_Functions class instance (handed through the server)
     
     subs_map = {
@@ -20,6 +21,7 @@ class SubscriptionManager:
     def __init__(self):
         self.subs_map = {}
         self._lock: asyncio.Lock = asyncio.Lock()
+        self.version = 0 # increases on every change, used by the server status renderer
 
     def __str__(self): 
         if self.subs_map:
@@ -46,16 +48,9 @@ class SubscriptionManager:
                 return f"agent {agent.id} already subscribed"
 
             agent.subscriptions.add(func) # agent's own record
+            self.version += 1
             return f"agent {agent.id} subscribed"
     
-    # to resubs all when reconnect
-    # - only resubs funcs in subs_map
-    # - need to separately handle default subscritions such as ccnl_notice 
-    async def resubscribe_all(self):
-        for func, func_map in self.subs_map.items():
-            for code in func_map.keys():
-                await func(tr_key=code)
-
     # remove and unsubscribe
     # agent could have multiple subscriptions (i.e., multiple funcs)
     async def remove(self, agent: AgentSession, func=None): # if func = None, remove all
@@ -82,6 +77,7 @@ class SubscriptionManager:
 
         agent_list.remove(agent.id)
         agent.subscriptions.discard(func)
+        self.version += 1
 
         # cleanup empty code list
         if not agent_list:
@@ -0,0 +1,228 @@
+from datetime import datetime
+import asyncio
+import mmap
+import os
+import socket
+import struct
+import uuid
+
+from ..base.settings import TICK_RING_DIR, tick_ring_slots, tick_ring_wait_timeout
+from ..kis.ws_data import TransactionPrices
+
+# ----------------------------------------------------------------------
+# memory mapped tick ring (single writer: server / multiple readers: agents on the same host)
+# - one ring file per code: header + tick_ring_slots fixed size slots
+# - header: magic, n_slots, write_seq (last published seq, 0: none)
+# - slot: seq (begin), price, quantity, ask, bid, time (timestamp), seq (end)
+# - writer: begin seq -> data -> end seq -> header write_seq
+# - reader: end seq -> data -> begin seq (reverse order); a slot is valid only if both seqs are the expected one
+#   (a slot overwritten during the read fails the check and counts as lost)
+# - the fields of TransactionPrices sent to the agents are published (the same summary as the binary wire codec)
+# - wake-up (unix datagram socket of the server, one per service): a reader with nothing to read registers
+#   (code, next seq) and waits; the server sends it one datagram on the next publish of the code (at once if already past)
+# ----------------------------------------------------------------------
+MAGIC = b'TRG2' # layout version: readers of another layout reject the ring
+_HEADER = struct.Struct('<4sIQ')
+_WRITE_SEQ_OFFSET = 8
+_SEQ = struct.Struct('<Q')
+_DATA = struct.Struct('<qqqqd')
+_SLOT_SIZE = _SEQ.size * 2 + _DATA.size
+_WAIT = struct.Struct('<Q') # wait request: next seq + code
+_WAKE = b'\x01'
+
+def tick_ring_path(service, code):
+    return os.path.join(TICK_RING_DIR, f"optrading_ticks_{service}_{code}.ring")
+
+def tick_ring_wake_path(service):
+    return os.path.join(TICK_RING_DIR, f"optrading_ticks_{service}.wake")
+
+class TickRingWriter:
+    def __init__(self, path, n_slots=tick_ring_slots):
+        self.path = path
+        self.n_slots = n_slots
+        self.seq = 0
+
+        # built aside and moved in place: readers of a previous ring keep their (stale) mapping instead of a truncated one
+        tmp = f"{path}.tmp"
+        size = _HEADER.size + n_slots * _SLOT_SIZE
+        with open(tmp, "w+b") as f:
+            f.truncate(size)
+            self.mm = mmap.mmap(f.fileno(), size)
+        _HEADER.pack_into(self.mm, 0, MAGIC, n_slots, 0)
+        os.replace(tmp, path)
+
+    def publish(self, price: int, quantity: int, ask: int, bid: int, ts: float):
+        self.seq += 1
+        seq = self.seq
+        off = _HEADER.size + (seq % self.n_slots) * _SLOT_SIZE
+        mm = self.mm
+        _SEQ.pack_into(mm, off, seq)
+        _DATA.pack_into(mm, off + _SEQ.size, price, quantity, ask, bid, ts)
+        _SEQ.pack_into(mm, off + _SEQ.size + _DATA.size, seq)
+        _SEQ.pack_into(mm, _WRITE_SEQ_OFFSET, seq)
+
+    def close(self, remove=True):
+        self.mm.close()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+class TickRingReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_slots, write_seq = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.mm.close()
+            raise ValueError(f"[TickRing] {path} is not a tick ring")
+        self.next_seq = max(write_seq, 1) # starts from the latest tick (if any)
+        self.lost = 0 # total ticks missed (overrun by the writer)
+
+    def read(self, limit=None) -> tuple[list[tuple[int, int, int, int, float]], int]:
+        # returns ([(price, quantity, ask, bid, ts), ...], lost in this read)
+        mm = self.mm
+        (write_seq, ) = _SEQ.unpack_from(mm, _WRITE_SEQ_OFFSET)
+        lost = 0
+        if write_seq - self.next_seq >= self.n_slots: # fell behind more than the ring holds
+            lost = write_seq - self.n_slots + 1 - self.next_seq
+            self.next_seq = write_seq - self.n_slots + 1
+        end_seq = write_seq if limit is None else min(write_seq, self.next_seq + limit - 1)
+
+        ticks = []
+        for seq in range(self.next_seq, end_seq + 1):
+            off = _HEADER.size + (seq % self.n_slots) * _SLOT_SIZE
+            (end, ) = _SEQ.unpack_from(mm, off + _SEQ.size + _DATA.size)
+            data = _DATA.unpack_from(mm, off + _SEQ.size)
+            (begin, ) = _SEQ.unpack_from(mm, off)
+            if begin == end == seq:
+                ticks.append(data)
+            else:
+                lost += 1
+        self.next_seq = max(self.next_seq, end_seq + 1)
+        self.lost += lost
+        return ticks, lost
+
+    def close(self):
+        self.mm.close()
+
+    @staticmethod
+    def to_trp(code, price, quantity, ask, bid, ts) -> TransactionPrices:
+        # summary only TransactionPrices (no records) for the agent side handlers
+        trp = TransactionPrices(0, '')
+        trp.code, trp.price, trp.quantity, trp.ask, trp.bid, trp.time = code, price, quantity, ask, bid, datetime.fromtimestamp(ts)
+        return trp
+
+class TickRingWaiter(asyncio.DatagramProtocol):
+    """
+    Reader side wake-up: a datagram socket of its own, registered on the server's wake socket on every wait
+    - a wake-up may never come (server restarted, datagram refused): the ring is read again after tick_ring_wait_timeout
+    """
+    def __init__(self, wake_path, code):
+        self.wake_path = wake_path
+        self.request_tail = code.encode()
+        self.path = os.path.join(TICK_RING_DIR, f"optrading_ticks_waiter_{uuid.uuid4().hex[:12]}.sock")
+        self.transport = None
+        self._woken = asyncio.Event()
+
+    async def open(self):
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, local_addr=self.path, family=socket.AF_UNIX)
+
+    def datagram_received(self, data, addr):
+        self._woken.set()
+
+    def error_received(self, exc): # server not listening: the timeout reads the ring again
+        pass
+
+    async def wait(self, next_seq):
+        self._woken.clear()
+        self.transport.sendto(_WAIT.pack(next_seq) + self.request_tail, self.wake_path)
+        try:
+            await asyncio.wait_for(self._woken.wait(), tick_ring_wait_timeout)
+        except TimeoutError:
+            pass
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class _WakeProtocol(asyncio.DatagramProtocol):
+    def __init__(self, rings: "TickRings"):
+        self.rings = rings
+
+    def datagram_received(self, data, addr):
+        self.rings._wait_requested(data, addr)
+
+    def error_received(self, exc): # a reader gone meanwhile
+        self.rings.logger.debug(f"[TickRings] wake-up not delivered: {exc}")
+
+class TickRings:
+    """
+    Server side: one TickRingWriter per code
+    - a ring is opened when an agent asks for it (SUBSCRIBE_TRP) and kept until the server stops
+    - run(): the wake socket, readers waiting for the next tick of a code are woken on its publish
+      (one datagram per waiting reader, readers busy reading cost nothing)
+    - no wake socket without unix sockets (Windows): readers poll every tick_ring_poll_interval
+    - writers: {code: TickRingWriter}
+    - waiters: {code: {reader socket path, ...}}
+    """
+    def __init__(self, logger, service):
+        self.logger = logger
+        self.service = service
+        self.writers: dict[str, TickRingWriter] = {}
+        self.waiters: dict[str, set[str]] = {}
+        self.wake_path = tick_ring_wake_path(service)
+        self._transport: asyncio.DatagramTransport | None = None
+
+    async def run(self):
+        if not hasattr(asyncio, 'start_unix_server'):
+            return
+        if os.path.exists(self.wake_path): # left by a previous run
+            os.remove(self.wake_path)
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _WakeProtocol(self), local_addr=self.wake_path, family=socket.AF_UNIX)
+        try:
+            await asyncio.Future() # until the server stops
+        finally:
+            self._transport.close()
+            self._transport = None
+            if os.path.exists(self.wake_path):
+                os.remove(self.wake_path)
+
+    # wake socket path for the readers, None if readers have to poll
+    def wake_path_if_running(self):
+        return self.wake_path if self._transport is not None else None
+
+    def _wait_requested(self, data: bytes, addr):
+        if len(data) <= _WAIT.size or not addr:
+            return
+        (next_seq, ) = _WAIT.unpack_from(data)
+        code = data[_WAIT.size:].decode()
+        writer = self.writers.get(code)
+        if writer is None or writer.seq >= next_seq: # published meanwhile, or no ring (reader reads again and finds out)
+            self._transport.sendto(_WAKE, addr)
+        else:
+            self.waiters.setdefault(code, set()).add(addr)
+
+    def open(self, code):
+        writer = self.writers.get(code)
+        if writer is None:
+            writer = self.writers[code] = TickRingWriter(tick_ring_path(self.service, code))
+            self.logger.info(f"[TickRings] ring opened for {code}: {writer.path}")
+        return writer.path
+
+    def publish(self, trp: TransactionPrices):
+        writer = self.writers.get(trp.code)
+        if writer is not None and trp.price is not None:
+            writer.publish(trp.price, trp.quantity, trp.ask, trp.bid, trp.time.timestamp())
+            waiting = self.waiters.pop(trp.code, None)
+            if waiting and self._transport is not None:
+                for addr in waiting:
+                    self._transport.sendto(_WAKE, addr)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
@@ -0,0 +1,355 @@
+from datetime import datetime
+from enum import Enum
+from operator import attrgetter
+import pickle
+import struct
+
+from .comm_interface import RequestCommand, ClientRequest, ServerResponse, OM_Dispatch, Dispatch_ACK, Sync
+from ..kis.kis_tools import SIDE, MTYPE, EXG
+from ..kis.ws_data import TransactionNotice, TransactionPrices
+from ..model.order import Order, CancelOrder
+
+# ----------------------------------------------------------------------
+# local communication (server - agent) message codecs
+# - a client chooses the codec per connection by sending its codec id (1 byte) right after connecting
+# - messages are framed the same way for all codecs: 4 byte length + payload
+# ----------------------------------------------------------------------
+class PickleCodec:
+    id = 0
+    name = 'pickle'
+
+    @staticmethod
+    def encode(message) -> bytes:
+        return pickle.dumps(message)
+
+    @staticmethod
+    def decode(data: bytes):
+        return pickle.loads(data)
+
+class BinaryCodec:
+    """
+    Schema driven binary codec: no code execution on decode
+    - every value starts with a type tag byte
+    - registered classes (_SCHEMAS): tag + class id + fixed struct part + variable fields in schema order
+    - field names are not sent, so both sides must run the same schema
+    """
+    id = 1
+    name = 'binary'
+
+    @staticmethod
+    def encode(message) -> bytes:
+        buf = bytearray()
+        _encode_value(buf, message)
+        return bytes(buf)
+
+    @staticmethod
+    def decode(data: bytes):
+        value, _ = _decode_value(memoryview(data), 0)
+        return value
+
+CODECS = {c.name: c for c in (PickleCodec, BinaryCodec)}
+CODEC_IDS = {c.id: c for c in (PickleCodec, BinaryCodec)}
+
+# ----------------------------------------------------------------------
+# value encoding
+# ----------------------------------------------------------------------
+T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_STR, T_LIST, T_TUPLE, T_DICT, T_DATETIME, T_ENUM, T_OBJ = range(12)
+
+_I64 = struct.Struct('!q')
+_F64 = struct.Struct('!d')
+_U32 = struct.Struct('!I')
+
+# enum classes that can be sent (id is part of the protocol: append only)
+_ENUMS: list[type[Enum]] = [SIDE, MTYPE, EXG, RequestCommand]
+_ENUM_IDS = {e: i for i, e in enumerate(_ENUMS)}
+
+def _encode_str(buf: bytearray, s: str):
+    b = s.encode('utf-8')
+    buf += _U32.pack(len(b))
+    buf += b
+
+def _decode_str(mv: memoryview, pos: int):
+    (n, ) = _U32.unpack_from(mv, pos)
+    pos += 4
+    return str(mv[pos:pos+n], 'utf-8'), pos+n
+
+def _encode_value(buf: bytearray, v):
+    t = type(v)
+    schema = _SCHEMAS.get(t)
+    if schema is not None:
+        buf.append(T_OBJ)
+        buf.append(schema.id)
+        schema.encode(buf, v)
+    elif v is None:
+        buf.append(T_NONE)
+    elif t is bool:
+        buf.append(T_TRUE if v else T_FALSE)
+    elif t is int:
+        buf.append(T_INT)
+        buf += _I64.pack(v)
+    elif t is float:
+        buf.append(T_FLOAT)
+        buf += _F64.pack(v)
+    elif t is str:
+        buf.append(T_STR)
+        _encode_str(buf, v)
+    elif t in _ENUM_IDS: # before list/dict checks as StrEnum is also str
+        buf.append(T_ENUM)
+        buf.append(_ENUM_IDS[t])
+        _encode_value(buf, v.value)
+    elif t is list or t is tuple:
+        buf.append(T_LIST if t is list else T_TUPLE)
+        buf += _U32.pack(len(v))
+        for x in v:
+            _encode_value(buf, x)
+    elif t is dict:
+        buf.append(T_DICT)
+        buf += _U32.pack(len(v))
+        for k, x in v.items():
+            _encode_value(buf, k)
+            _encode_value(buf, x)
+    elif t is datetime:
+        buf.append(T_DATETIME)
+        buf += _F64.pack(v.timestamp())
+    else:
+        raise TypeError(f"[BinaryCodec] unsupported type {t.__name__}")
+
+def _decode_value(mv: memoryview, pos: int):
+    tag = mv[pos]
+    pos += 1
+    if tag == T_OBJ:
+        return _SCHEMA_IDS[mv[pos]].decode(mv, pos+1)
+    if tag == T_NONE:
+        return None, pos
+    if tag == T_FALSE:
+        return False, pos
+    if tag == T_TRUE:
+        return True, pos
+    if tag == T_INT:
+        return _I64.unpack_from(mv, pos)[0], pos+8
+    if tag == T_FLOAT:
+        return _F64.unpack_from(mv, pos)[0], pos+8
+    if tag == T_STR:
+        return _decode_str(mv, pos)
+    if tag == T_ENUM:
+        enum_cls = _ENUMS[mv[pos]]
+        value, pos = _decode_value(mv, pos+1)
+        member = enum_cls._value2member_map_.get(value) # faster than enum_cls(value)
+        return (enum_cls(value) if member is None else member), pos
+    if tag == T_LIST or tag == T_TUPLE:
+        (n, ) = _U32.unpack_from(mv, pos)
+        pos += 4
+        items = []
+        for _ in range(n):
+            x, pos = _decode_value(mv, pos)
+            items.append(x)
+        return (items if tag == T_LIST else tuple(items)), pos
+    if tag == T_DICT:
+        (n, ) = _U32.unpack_from(mv, pos)
+        pos += 4
+        d = {}
+        for _ in range(n):
+            k, pos = _decode_value(mv, pos)
+            d[k], pos = _decode_value(mv, pos)
+        return d, pos
+    if tag == T_DATETIME:
+        return datetime.fromtimestamp(_F64.unpack_from(mv, pos)[0]), pos+8
+    raise ValueError(f"[BinaryCodec] unknown type tag {tag}")
+
+# ----------------------------------------------------------------------
+# schemas
+# ----------------------------------------------------------------------
+class _Schema:
+    """
+    fixed: [(attr, struct format char), ...] packed in one struct (attrs must not be None)
+    var: [attr, ...] encoded as tagged values
+    objects are rebuilt without calling __init__ (no validation / id generation on decode)
+    """
+    def __init__(self, cls, fixed: list[tuple[str, str]], var: list[str]):
+        self.cls = cls
+        self.fixed = [a for a, _ in fixed]
+        self.struct = struct.Struct('!' + ''.join(f for _, f in fixed))
+        self.var = var
+        self.id: int | None = None # assigned on registration
+
+    def encode(self, buf: bytearray, obj):
+        buf += self.struct.pack(*[getattr(obj, a) for a in self.fixed])
+        self._encode_var(buf, obj)
+
+    def decode(self, mv: memoryview, pos: int):
+        obj = self.cls.__new__(self.cls)
+        d = obj.__dict__
+        d.update(zip(self.fixed, self.struct.unpack_from(mv, pos)))
+        return obj, self._decode_var(d, mv, pos + self.struct.size)
+
+    # str / None / int / enum (most of the var fields) are handled inline: a call per field is most of the cost
+    def _encode_var(self, buf: bytearray, obj):
+        for a in self.var:
+            v = getattr(obj, a)
+            if type(v) is str:
+                b = v.encode('utf-8')
+                buf.append(T_STR)
+                buf += _U32.pack(len(b))
+                buf += b
+            elif v is None:
+                buf.append(T_NONE)
+            elif type(v) is int:
+                buf.append(T_INT)
+                buf += _I64.pack(v)
+            elif type(v) in _ENUM_IDS and type(v.value) is str: # SIDE / MTYPE / EXG
+                b = v.value.encode('utf-8')
+                buf.append(T_ENUM)
+                buf.append(_ENUM_IDS[type(v)])
+                buf.append(T_STR)
+                buf += _U32.pack(len(b))
+                buf += b
+            else:
+                _encode_value(buf, v)
+
+    def _decode_var(self, d: dict, mv: memoryview, pos: int):
+        for a in self.var:
+            tag = mv[pos]
+            if tag == T_STR:
+                (n, ) = _U32.unpack_from(mv, pos+1)
+                pos += 5
+                d[a] = str(mv[pos:pos+n], 'utf-8')
+                pos += n
+            elif tag == T_NONE:
+                d[a] = None
+                pos += 1
+            elif tag == T_INT:
+                (d[a], ) = _I64.unpack_from(mv, pos+1)
+                pos += 9
+            else:
+                d[a], pos = _decode_value(mv, pos)
+        return pos
+
+_NONE_INDEX = 0xFF # enum member index of None
+_SEP = '\x1f' # ASCII unit separator between the str fields of a layout
+
+# attrs as a tuple in one C call (attrgetter returns a bare value for a single attr)
+def _tuple_getter(attrs: list[str]):
+    if len(attrs) > 1:
+        return attrgetter(*attrs)
+    if attrs:
+        get = attrgetter(attrs[0])
+        return lambda obj: (get(obj), )
+    return lambda obj: ()
+
+class _LayoutSchema(_Schema):
+    """
+    Fixed layout for the typed fields of the messages sent on every order event (TransactionNotice, Order)
+    - one struct: fixed fields, null mask (ints and strs), ints, enum member indexes
+    - str fields are sent as one utf-8 blob after the struct, joined by _SEP (split back in one call on decode)
+      a str containing _SEP cannot be sent (ValueError)
+    - var fields (values whose type is not fixed, e.g., fee_ / tax_ follow the rounding type) follow as tagged values
+    - fields are read / set with C level calls (attrgetter, zip, map): a Python step per field is most of the cost
+    """
+    def __init__(self, cls, fixed: list[tuple[str, str]], ints: list[str], enums: list[tuple[str, type[Enum]]], strs: list[str], var: list[str]):
+        super().__init__(cls, fixed, var)
+        assert len(ints) + len(strs) <= 32, f"[BinaryCodec] {cls.__name__}: too many nullable fields"
+        self.ints = ints
+        self.enums = [a for a, _ in enums]
+        self.strs = strs
+        self.nullable = ints + strs # bit k of the null mask: nullable[k]
+        self.member_index = [{None: _NONE_INDEX} | {m: i for i, m in enumerate(e)} for _, e in enums]
+        self.members = [{_NONE_INDEX: None} | dict(enumerate(e)) for _, e in enums]
+        self.struct = struct.Struct('!' + ''.join(f for _, f in fixed) + 'I' + 'q'*len(ints) + 'B'*len(enums))
+        self._get_fixed, self._get_ints, self._get_enums, self._get_strs = (_tuple_getter(x) for x in (self.fixed, ints, self.enums, strs))
+
+    def encode(self, buf: bytearray, obj):
+        ints, strs = self._get_ints(obj), self._get_strs(obj)
+        mask = 0
+        if None in ints or None in strs:
+            for k, v in enumerate(ints + strs):
+                if v is None:
+                    mask |= 1 << k
+            ints = [0 if v is None else v for v in ints]
+            strs = ['' if v is None else v for v in strs]
+        enums = [index[v] for index, v in zip(self.member_index, self._get_enums(obj))]
+        buf += self.struct.pack(*self._get_fixed(obj), mask, *ints, *enums)
+        blob = _SEP.join(strs)
+        if blob.count(_SEP) != len(strs) - 1:
+            raise ValueError(f"[BinaryCodec] {self.cls.__name__}: str field contains the field separator")
+        b = blob.encode('utf-8')
+        buf += _U32.pack(len(b))
+        buf += b
+        self._encode_var(buf, obj)
+
+    def decode(self, mv: memoryview, pos: int):
+        values = self.struct.unpack_from(mv, pos)
+        pos += self.struct.size
+        (n, ) = _U32.unpack_from(mv, pos)
+        blob = str(mv[pos+4:pos+4+n], 'utf-8')
+        pos += 4 + n
+
+        obj = self.cls.__new__(self.cls)
+        d = obj.__dict__
+        i = len(self.fixed)
+        d.update(zip(self.fixed, values))
+        mask = values[i]
+        i += 1
+        d.update(zip(self.ints, values[i:]))
+        i += len(self.ints)
+        d.update(zip(self.enums, [members[m] for members, m in zip(self.members, values[i:])]))
+        d.update(zip(self.strs, blob.split(_SEP)))
+        while mask: # set bits only
+            low = mask & -mask
+            d[self.nullable[low.bit_length() - 1]] = None
+            mask ^= low
+        return obj, self._decode_var(d, mv, pos)
+
+class _PricesSchema(_Schema):
+    """
+    Ticks in one fixed struct: code (up to 12 bytes), price, quantity, ask, bid, time (timestamp)
+    - only the fields consumed by the agents are sent: decoded as a summary only TransactionPrices (no records),
+      the same as the ones read from the tick ring
+    - price None (a frame without records) is sent as -1
+    """
+    _STRUCT = struct.Struct('!12sqqqqd')
+
+    def __init__(self, cls):
+        super().__init__(cls, [], [])
+
+    def encode(self, buf: bytearray, obj: TransactionPrices):
+        price = -1 if obj.price is None else obj.price
+        buf += self._STRUCT.pack(obj.code.encode(), price, obj.quantity, obj.ask, obj.bid, obj.time.timestamp())
+
+    def decode(self, mv: memoryview, pos: int):
+        code, price, quantity, ask, bid, ts = self._STRUCT.unpack_from(mv, pos)
+        obj = self.cls.__new__(self.cls)
+        obj.__dict__.update(n_rows=0, _payload='', _fields=None, _records=None, code=code.rstrip(b'\0').decode(), price=None if price < 0 else price,
+                            quantity=quantity, ask=ask, bid=bid, time=datetime.fromtimestamp(ts))
+        return obj, pos + self._STRUCT.size
+
+# fee_ / tax_ / amount follow the cost calculation rounding type, so sent as tagged values
+_ORDER_FIXED = [
+    ('quantity', 'q'), ('price', 'q'), ('processed', 'q'), ('avg_price', 'd'),
+    ('is_regular_order', '?'), ('submitted', '?'), ('accepted', '?'), ('completed', '?'), ('null_order', '?'),
+]
+_ORDER_ENUMS = [('side', SIDE), ('mtype', MTYPE), ('exchange', EXG)]
+_ORDER_STRS = ['agent_id', 'code', 'unique_id', 'gen_time', 'org_no', 'order_no', 'submitted_time']
+_ORDER_VAR = ['amount', 'fee_', 'tax_']
+
+# id is the position in the list (part of the protocol: append only)
+_SCHEMA_LIST: list[_Schema] = [
+    _PricesSchema(TransactionPrices),
+    # seln_byov_cls is kept as the raw str if not a known side
+    _LayoutSchema(TransactionNotice, [('consumed', '?')], ['cntg_qty', 'cntg_unpr', 'oder_qty', 'oder_prc'],
+        [('oder_kind', MTYPE), ('traded_exchange', EXG)], [
+        'acnt_no', 'order_no', 'orignal_order_no', 'rctf_cls', 'oder_cond', 'code', 'stck_cntg_hour', 'rfus_yn', 'cntg_yn', 'acpt_yn',
+        'brnc_no', 'exg_yn', 'crdt_cls', 'checker_code',
+    ], ['fee_', 'tax_', 'seln_byov_cls']),
+    _LayoutSchema(Order, _ORDER_FIXED, [], _ORDER_ENUMS, _ORDER_STRS, _ORDER_VAR),
+    _LayoutSchema(CancelOrder, _ORDER_FIXED + [('creation_success', '?')], [], _ORDER_ENUMS,
+                  _ORDER_STRS + ['original_order_org_no', 'original_order_no', 'qty_all_yn', 'creation_msg'], _ORDER_VAR),
+    _Schema(OM_Dispatch, [('seq', 'q')], ['data']),
+    _Schema(Dispatch_ACK, [('seq', 'q')], ['agent_id']),
+    _Schema(ClientRequest, [], ['command', 'request_id', 'data_dict']),
+    _Schema(ServerResponse, [('success', '?')], ['status', 'data_dict', 'request_id']),
+    _Schema(Sync, [('delta', '?')], ['agent_id', 'prev_incompleted_orders', 'incompleted_orders', 'completed_orders', 'pending_trns', 'summary', 'cursor']),
+]
+for i, s in enumerate(_SCHEMA_LIST):
+    s.id = i
+_SCHEMAS = {s.cls: s for s in _SCHEMA_LIST}
+_SCHEMA_IDS = {s.id: s for s in _SCHEMA_LIST}
@@ -1,16 +1,72 @@
 import asyncio
+import hashlib
 import json
+import os
 import websockets
 import yaml
 import httpx 
-import time
-from base64 import b64decode
 from collections import namedtuple
 from datetime import datetime, timedelta
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
 
-from ..base.settings import Service, config_file, real_sleep, demo_sleep, reauth_margin_hr 
+from ..base.settings import Service, config_file, TOKEN_DIR, token_refresh_margin_hr, token_refresh_interval, real_rate, real_burst, demo_rate, demo_burst, market_data_app_keys, reauth_margin_hr, ws_max_subscriptions, ws_decrypt_in_thread
+from .rate_limiter import RateLimiter, ReqClass
+from .ws_crypto import FrameCipher
+
+class AppKey:
+    """
+    REST app key with its own token and rate limiter (KIS limits are per app key)
+    """
+    def __init__(self, name, app_key, sec_key, rate_limiter: RateLimiter):
+        self.name = name # config prefix
+        self.app_key = app_key
+        self.sec_key = sec_key
+        self.rate_limiter = rate_limiter
+        self.token = None
+        self.token_exp = None
+        self.token_lock = asyncio.Lock() # one token request at a time
+        self.header = {
+            "appkey": app_key, 
+            "appsecret": sec_key, 
+        }
+
+    def __str__(self):
+        return f"[AppKey {self.name}] {self.rate_limiter}"
+
+class WSSession:
+    """
+    One KIS websocket connection (KIS allows one session per app key, with a limited number of registrations)
+    - subs: registrations placed on this session {(tr_id, tr_key), ...}
+    - sent: registrations sent on the current connection (reset on reconnect, so subs are re-sent)
+    - tr_id_map: {tr_id: {"key": ..., "iv": ..., "cipher": FrameCipher}} decryption keys received on this session
+    - lock: one sync (send of subs - sent / sent - subs) at a time
+    - frames: [(tr_id, n_rows, payload, cipher | None), ...] waiting for the frame worker (ws_decrypt_in_thread)
+    """
+    def __init__(self, no, key: AppKey):
+        self.no = no
+        self.key = key
+        self.ws = None # websocket to be initialized in runner
+        self.header = { 
+            "content-type": "utf-8", # not "charset"
+            "custtype": "P",
+        }
+        # for websocket, do not save token in file
+        self.token_ws = None
+        self.token_ws_exp = None
+        self.token_lock = asyncio.Lock()
+
+        self.subs: set[tuple[str, str]] = set()
+        self.sent: set[tuple[str, str]] = set()
+        self.tr_id_map = {}
+        self.lock = asyncio.Lock()
+        self.frames = []
+        self.frames_ready = asyncio.Event()
+        self.decrypting = False # frames handed to the worker thread, not yet dispatched
+        self.try_count = 0
+        self.closed = False # max tries reached
+
+    def __str__(self):
+        state = "closed" if self.closed else "connected" if self.ws is not None else "connecting"
+        return f"- ws{self.no} ({self.key.name}): {state}, subs {len(self.subs)}/{ws_max_subscriptions}"
 
 class KIS_Connector: 
     # default values
@@ -25,9 +81,8 @@ class KIS_Connector:
 
     # control settings
     _max_ws_tries = 5
-    _resubs_event = asyncio.Event()
 
-    def __init__(self, logger, service: Service, on_result=None, server_env=None):
+    def __init__(self, logger, service: Service, on_result=None):
         self.logger = logger
         self.service = service
         self.on_result = on_result
@@ -36,107 +91,172 @@ class KIS_Connector:
         if self.service.is_real():
             self.url = self._url_real
             self.url_ws = self._url_real_ws + self._ws_api_url
-            self.sleep = real_sleep
+            rate, burst = real_rate, real_burst
         else:
             self.url = self._url_demo
             self.url_ws = self._url_demo_ws + self._ws_api_url
-            self.sleep = demo_sleep
+            rate, burst = demo_rate, demo_burst
 
         self.read_config_file()
         self.base_header = {
             "content-type": "application/json",
             "charset": "utf-8",
-            "appkey": self.app_key, 
-            "appsecret": self.sec_key, 
             "custtype": "P",
         }
-        if server_env:
-            self.token = server_env.get('token')
-            self.token_exp = datetime.strptime(server_env.get('token_exp'),'%Y-%m-%d %H:%M:%S')
-        else: 
-            self.token = None
-            self.token_exp = None
+        # key: account owning key (orders, account inquiries) / keys: all keys, market data inquiries go to the least busy one
+        self.key = AppKey(self.key_name, self.app_key, self.sec_key, RateLimiter(rate, burst))
+        self.keys = [self.key] + [AppKey(name, a, s, RateLimiter(rate, burst)) for name, (a, s) in self.extra_keys.items()]
 
         self.httpx_client: httpx.AsyncClient | None = httpx.AsyncClient()
-        self._last_call_time = None
 
         # Websocket part ----------------
-        self.base_header_ws = { 
-            "content-type": "utf-8", # not "charset"
-            "custtype": "P",
-        }
-
-        # for websocket, do not save token in file
-        self.token_ws = None
-        self.token_ws_exp = None
-
-        self.ws = None # websocket to be initialized in runner
-        self.ws_ready = asyncio.Event()
-
-        self._ws_try_count = 0
-        self.tr_id_map = {}
+        # one session per app key: real-time registrations are spread over the sessions
+        # frames of all sessions are handed to on_result from the same event loop, in arrival order
+        self.ws_sessions = [WSSession(i, k) for i, k in enumerate(self.keys)]
+        self.ws_assign: dict[tuple[str, str], WSSession] = {} # (tr_id, tr_key) -> session
+        self.ws_pending: list[tuple[str, str]] = [] # registrations waiting for a slot
+        self.ws_primary: set[tuple[str, str]] = set() # registrations kept on the account owning key's session if possible
         self._tr_id_map_lock = asyncio.Lock()
 
+        # tokens / approval keys of a previous run (kept until expiry, so a restart does not wait on oauth calls)
+        self.token_file = TOKEN_DIR / f"kis_tokens_{self.service}.json"
+        self._load_tokens()
+
     def read_config_file(self): # shouldn't be called too frequently
         with open(config_file, encoding="UTF-8") as f:
             _cfg = yaml.load(f, Loader=yaml.FullLoader)
 
         self.htsid = _cfg['htsid']
         if self.service == Service.PROD:
-            self.app_key = _cfg['main_app']
-            self.sec_key = _cfg['main_sec']
+            self.key_name = 'main'
             self.account_no = _cfg['main_acct_stock']
         elif self.service == Service.AUTO:
-            self.app_key = _cfg['autotrading_app']
-            self.sec_key = _cfg['autotrading_sec']
+            self.key_name = 'autotrading'
             self.account_no = _cfg['auto_acct_stock']
         elif self.service == Service.DEMO:
-            self.app_key = _cfg['paper_app']
-            self.sec_key = _cfg['paper_sec']
+            self.key_name = 'paper'
             self.account_no = _cfg['paper_acct_stock']
-
-    async def set_token(self):
-        if self.token_exp:
-            if self.token_exp > datetime.now() + timedelta(hours = reauth_margin_hr):
+        self.app_key = _cfg[f'{self.key_name}_app']
+        self.sec_key = _cfg[f'{self.key_name}_sec']
+        self.extra_keys = {name: (_cfg[f'{name}_app'], _cfg[f'{name}_sec']) for name in market_data_app_keys[self.service]}
+
+    def _token_valid(self, key: AppKey, margin_hr=reauth_margin_hr):
+        return key.token_exp is not None and key.token_exp > datetime.now() + timedelta(hours = margin_hr)
+
+    async def set_token(self, key: AppKey | None = None, margin_hr=reauth_margin_hr):
+        key = key or self.key
+        if self._token_valid(key, margin_hr):
+            return
+        async with key.token_lock:
+            if self._token_valid(key, margin_hr): # set by a concurrent call
                 return
-        p = {
-            "grant_type": "client_credentials",
-            "appkey": self.app_key,
-            "appsecret": self.sec_key,
-        }
-        token_url = f"{self.url}/oauth2/tokenP"
+            p = {
+                "grant_type": "client_credentials",
+                "appkey": key.app_key,
+                "appsecret": key.sec_key,
+            }
+            token_url = f"{self.url}/oauth2/tokenP"
 
-        assert self.httpx_client is not None
+            assert self.httpx_client is not None
+            try:
+                resp = await self.httpx_client.post(token_url, json=p)
+            except httpx.RequestError as e:
+                self.logger.error(f"[KIS_Connector] getting token failed ({key.name}): {e}", exc_info=True)
+                raise
+            
+            if resp.status_code != 200:
+                self.logger.error(f"[KIS_Connector] getting token failed, {self.service} ({key.name}): {resp.status_code} | {resp.text}")
+                raise Exception("token error")
+
+            r = resp.json()
+            key.token = r['access_token'] 
+            key.token_exp = datetime.strptime(r['access_token_token_expired'], "%Y-%m-%d %H:%M:%S")
+            key.header["authorization"] = f"Bearer {key.token}"
+            self._save_tokens()
+
+    async def refresh_tokens(self):
+        # renews tokens and approval keys before calls would have to (calls renew on demand within reauth_margin_hr)
+        while True:
+            for session in self.ws_sessions:
+                try:
+                    await self.set_token(session.key, token_refresh_margin_hr)
+                    await self.set_token_ws(session, token_refresh_margin_hr)
+                except Exception as e: # retried on the next round, or on demand
+                    self.logger.error(f"[KIS_Connector] token refresh failed ({session.key.name}): {e}")
+            await asyncio.sleep(token_refresh_interval)
+
+    # saved tokens are only used for the same app key
+    @staticmethod
+    def _key_hash(key: AppKey):
+        return hashlib.sha256(key.app_key.encode("utf-8")).hexdigest()[:16]
+
+    def _load_tokens(self):
+        try:
+            with open(self.token_file, encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"[KIS_Connector] saved tokens not read: {e}")
+            return
+
+        fmt = "%Y-%m-%d %H:%M:%S"
+        for session in self.ws_sessions:
+            key = session.key
+            entry = saved.get(key.name)
+            if not entry or entry.get("app_key_hash") != self._key_hash(key):
+                continue
+            if entry.get("token") and entry.get("token_exp"):
+                key.token, key.token_exp = entry["token"], datetime.strptime(entry["token_exp"], fmt)
+                key.header["authorization"] = f"Bearer {key.token}"
+            if entry.get("approval_key") and entry.get("approval_key_exp"):
+                session.token_ws, session.token_ws_exp = entry["approval_key"], datetime.strptime(entry["approval_key_exp"], fmt)
+                session.header["approval_key"] = session.token_ws
+        self.logger.info(f"[KIS_Connector] saved tokens loaded from {self.token_file}")
+
+    def _save_tokens(self):
+        # owner only file, replaced as a whole (no partially written file on a crash)
+        fmt = "%Y-%m-%d %H:%M:%S"
+        saved = {}
+        for session in self.ws_sessions:
+            key = session.key
+            saved[key.name] = {
+                "app_key_hash": self._key_hash(key),
+                "token": key.token,
+                "token_exp": key.token_exp.strftime(fmt) if key.token_exp else None,
+                "approval_key": session.token_ws,
+                "approval_key_exp": session.token_ws_exp.strftime(fmt) if session.token_ws_exp else None,
+            }
+        tmp = f"{self.token_file}.tmp"
         try:
-            resp = await self.httpx_client.post(token_url, json=p)
-        except httpx.RequestError as e:
-            self.logger.error(f"[KIS_Connector] getting token failed: {e}", exc_info=True)
-            raise
-        
-        if resp.status_code != 200:
-            self.logger.error(f"[KIS_Connector] getting token failed, {self.service}: {resp.status_code} | {resp.text}")
-            raise Exception("token error")
-
-        r = resp.json()
-        self.token = r['access_token'] 
-        self.token_exp = datetime.strptime(r['access_token_token_expired'], "%Y-%m-%d %H:%M:%S")
-        self.base_header["authorization"] = f"Bearer {self.token}"
-
-    async def url_fetch(self, api_url, tr_id, tr_cont, params, post=False):
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=4)
+            os.chmod(tmp, 0o600) # in case tmp existed with other permissions
+            os.replace(tmp, self.token_file)
+        except OSError as e:
+            self.logger.warning(f"[KIS_Connector] tokens not saved: {e}")
+
+    def rate_status(self):
+        return '\n'.join(str(k) for k in self.keys)
+
+    # orders and account inquiries: the account owning key / market data: the key a call can start earliest
+    def _select_key(self, req_class: ReqClass) -> AppKey:
+        if req_class is ReqClass.MARKET and len(self.keys) > 1:
+            return min(self.keys, key=lambda k: k.rate_limiter.expected_wait())
+        return self.key
+
+    async def url_fetch(self, api_url, tr_id, tr_cont, params, post=False, req_class=ReqClass.INQUIRY):
         '''
         if error, returns (None, None)
         proper error handling (e.g. checking None) should be implemented in the caller
+        req_class: ORDER calls are started before queued INQUIRY / MARKET calls, MARKET calls may use other app keys
         '''
-        await self.set_token()
+        key = self._select_key(req_class)
+        await self.set_token(key)
 
-        # guarantees self.sleep time dealy between calls
-        now = time.monotonic() # less overhead and ever increasing (error proof)
-        if self._last_call_time is not None:
-            delay = self._last_call_time + self.sleep - now
-            if delay > 0:
-                # self.logger.info(f'[KIS_Connector] delay: {delay}') 
-                await asyncio.sleep(delay)
-        self._last_call_time = time.monotonic()
+        # waits for a rate limit token (calls are not serialized, only their starts are spaced)
+        await key.rate_limiter.acquire(req_class)
 
         url = self.url + api_url
         h = {
@@ -148,13 +268,13 @@ class KIS_Connector:
             if post:
                 resp = await self.httpx_client.post(
                     url,
-                    headers=self.base_header | h,
+                    headers=self.base_header | key.header | h,
                     json=params,
                 )
             else:
                 resp = await self.httpx_client.get(
                     url,
-                    headers=self.base_header | h,
+                    headers=self.base_header | key.header | h,
                     params=params,
                 )
         except httpx.RequestError as e: # network level / transport errors
@@ -174,40 +294,117 @@ class KIS_Connector:
     # -------------------------------------------------------------------
     # WebSocket part
     # -------------------------------------------------------------------
-    async def set_token_ws(self):
-        if self.token_ws_exp: 
-            if self.token_ws_exp > datetime.now() + timedelta(hours = reauth_margin_hr):
-                return
-
-        p = {
-            "grant_type": "client_credentials",
-            "appkey": self.app_key,
-            "secretkey": self.sec_key,
-        }
-        token_ws_url = f"{self.url}/oauth2/Approval" 
-
-        assert self.httpx_client is not None
-        try:
-            resp = await self.httpx_client.post(token_ws_url, json=p)
-        except httpx.RequestError as e:
-            self.logger.error(f"[KIS_Connector] getting token_ws failed: {e}", exc_info=True)
-            raise
-
-        if resp.status_code != 200:
-            self.logger.error(f"[KIS_Connector] getting token_ws failed, {self.service}: {resp.status_code} | {resp.text}")
-            raise Exception("token_ws error")
+    async def set_token_ws(self, session: WSSession, margin_hr=reauth_margin_hr):
+        if session.token_ws_exp and session.token_ws_exp > datetime.now() + timedelta(hours = margin_hr):
+            return
 
-        r = resp.json()
-        self.token_ws = r['approval_key'] 
-        self.token_ws_exp = datetime.now() + timedelta(hours=24)
-        self.base_header_ws["approval_key"] = self.token_ws
-
-    async def ws_send(self, tr_type, tr_id, tr_key): 
-        if self.ws is None: return # when socket is lost (e.g., closing up)
+        async with session.token_lock:
+            if session.token_ws_exp and session.token_ws_exp > datetime.now() + timedelta(hours = margin_hr): # set by a concurrent call
+                return
+            p = {
+                "grant_type": "client_credentials",
+                "appkey": session.key.app_key,
+                "secretkey": session.key.sec_key,
+            }
+            token_ws_url = f"{self.url}/oauth2/Approval" 
 
-        await self.set_token_ws()
+            assert self.httpx_client is not None
+            try:
+                resp = await self.httpx_client.post(token_ws_url, json=p)
+            except httpx.RequestError as e:
+                self.logger.error(f"[KIS_Connector] getting token_ws failed ({session.key.name}): {e}", exc_info=True)
+                raise
+
+            if resp.status_code != 200:
+                self.logger.error(f"[KIS_Connector] getting token_ws failed, {self.service} ({session.key.name}): {resp.status_code} | {resp.text}")
+                raise Exception("token_ws error")
+
+            r = resp.json()
+            session.token_ws = r['approval_key'] 
+            session.token_ws_exp = datetime.now() + timedelta(hours=24)
+            session.header["approval_key"] = session.token_ws
+            self._save_tokens()
+
+    def ws_status(self):
+        parts = [f"[KIS_Connector] websocket sessions, pending {len(self.ws_pending)}"]
+        parts.extend(str(s) for s in self.ws_sessions)
+        return '\n'.join(parts)
+
+    async def ws_send(self, tr_type, tr_id, tr_key, primary=False): 
         # tr_type: "1" subscribe, "2" unsubscribe
-        headers = self.base_header_ws | {"tr_type": tr_type}
+        # primary: keep on the account owning key's session if it has room (e.g., ccnl_notice)
+        sub = (tr_id, tr_key)
+        if tr_type == "1":
+            if sub in self.ws_assign or sub in self.ws_pending:
+                return
+            if primary:
+                self.ws_primary.add(sub)
+            self.ws_pending.append(sub)
+            await self._place_pending()
+            if sub in self.ws_pending:
+                self.logger.warning(f"[KIS_Connector] no websocket slot for {tr_id} {tr_key}, queued ({len(self.ws_pending)} pending)")
+        else:
+            self.ws_primary.discard(sub)
+            session = self.ws_assign.pop(sub, None)
+            if session is None:
+                if sub in self.ws_pending:
+                    self.ws_pending.remove(sub)
+                return
+            session.subs.discard(sub)
+            await self._sync_session(session)
+            await self._place_pending() # the freed slot
+
+    def _select_session(self, sub) -> WSSession | None:
+        # connected sessions first, then the least loaded
+        candidates = [s for s in self.ws_sessions if not s.closed and len(s.subs) < ws_max_subscriptions]
+        primary = self.ws_sessions[0]
+        if sub in self.ws_primary and primary in candidates and primary.ws is not None:
+            return primary
+        return min(candidates, key=lambda s: (s.ws is None, len(s.subs)), default=None)
+
+    async def _place_pending(self):
+        placed = set()
+        while self.ws_pending:
+            session = self._select_session(self.ws_pending[0])
+            if session is None:
+                break
+            sub = self.ws_pending.pop(0)
+            self.ws_assign[sub] = session
+            session.subs.add(sub)
+            placed.add(session)
+        for session in placed:
+            await self._sync_session(session)
+
+    def _release(self, session: WSSession):
+        # on disconnect: registrations go back to the front of the queue, and are placed again (other connected sessions first)
+        released = sorted(session.subs, key=lambda sub: sub not in self.ws_primary)
+        for sub in released:
+            del self.ws_assign[sub]
+        session.subs.clear()
+        session.sent.clear()
+        self.ws_pending[:0] = released
+
+    async def _sync_session(self, session: WSSession):
+        # sends unregistrations then registrations, so that the session holds exactly session.subs
+        async with session.lock:
+            if session.ws is None: # sent when (re)connected
+                return
+            if session.subs == session.sent:
+                return
+            try:
+                await self.set_token_ws(session)
+                for sub in session.sent - session.subs:
+                    await self._ws_request(session, "2", sub)
+                    session.sent.discard(sub)
+                for sub in session.subs - session.sent:
+                    await self._ws_request(session, "1", sub)
+                    session.sent.add(sub)
+            except websockets.ConnectionClosed as e: # the runner reconnects and places the registrations again
+                self.logger.warning(f"[KIS_Connector] ws{session.no} send failed: {e}")
+
+    async def _ws_request(self, session: WSSession, tr_type, sub):
+        tr_id, tr_key = sub
+        headers = session.header | {"tr_type": tr_type}
         input = {
             "tr_id": tr_id,
             "tr_key": tr_key,
@@ -215,41 +412,44 @@ class KIS_Connector:
         # required structure for KIS ws
         msg = {"header": headers, "body": {"input": input}}
         # fire and forget
-        await self.ws.send(json.dumps(msg))
+        await session.ws.send(json.dumps(msg))
 
-    async def _subscriber(self):
-        assert self.ws is not None
-        async for raw in self.ws:
+    async def _subscriber(self, session: WSSession):
+        ws = session.ws
+        assert ws is not None
+        async for raw in ws:
             assert isinstance(raw, str)
             if raw[0] in ["0", "1"]:
-                dr = raw.split("|")
+                dr = raw.split("|", 3) # header fields + payload (not scanned for '|')
                 if len(dr) < 4:
                     self.logger.error("[KIS_Connector] data not found ...")
                     raise
                 tr_id = dr[1]
                 n_rows = int(dr[2]) # record의 수
+                encrypted = raw[0] == "1" # 실시간 응답 0: 암호화되지 않은 데이터, 1: 암호화된 데이터
 
-                if raw[0] == "1": # 실시간 응답 0: 암호화되지 않은 데이터, 1: 암호화된 데이터
-                    dm = self.tr_id_map[tr_id]
-                    d = self.aes_cbc_base64_dec(dm["key"], dm["iv"], dr[3]).split("^")
-                else: 
-                    d = dr[3].split("^")
-                # safety check: len(d) == n_rows * n_cols:
+                # frames behind an encrypted one wait for the frame worker as well (arrival order kept)
+                if ws_decrypt_in_thread and (encrypted or session.frames or session.decrypting):
+                    session.frames.append((tr_id, n_rows, dr[3], self._cipher(session, tr_id) if encrypted else None))
+                    session.frames_ready.set()
+                    continue
 
+                # payload is handed over unsplit: the parser splits only the fields it needs
+                payload = self._cipher(session, tr_id).decrypt(dr[3]) if encrypted else dr[3]
                 if self.on_result:
-                    self.on_result(tr_id, n_rows, d)
+                    self.on_result(tr_id, n_rows, payload)
 
             else:
                 rsp = self.system_resp(raw)
                 if rsp.isPingPong:
-                    await self.ws.pong(raw)
+                    await ws.pong(raw)
                     continue
 
-                self.logger.info(self.sys_resp_to_str(rsp))
+                self.logger.info(f"[KIS_Connector] ws{session.no} {self.sys_resp_to_str(rsp)}")
                 if not rsp.tr_id.strip() or 'null' in rsp.tr_id.lower(): 
                     continue
                 await self.register_tr_id(
-                    tr_id=rsp.tr_id, key=rsp.ekey, iv=rsp.iv
+                    session, tr_id=rsp.tr_id, key=rsp.ekey, iv=rsp.iv
                 )
             
     def sys_resp_to_str(self, rsp):
@@ -312,16 +512,43 @@ class KIS_Connector:
         }
         return nt(**d)
 
-    def aes_cbc_base64_dec(self, key, iv, cipher_text):
-        if key is None or iv is None:
-            self.logger.error("[KIS_Connector] key and iv cannot be None")
-            raise ValueError
-
-        cipher = AES.new(key.encode("utf-8"), AES.MODE_CBC, iv.encode("utf-8"))
-        return bytes.decode(unpad(cipher.decrypt(b64decode(cipher_text)), AES.block_size))
+    def _cipher(self, session: WSSession, tr_id) -> FrameCipher:
+        cipher = session.tr_id_map.get(tr_id, {}).get("cipher")
+        if cipher is None:
+            self.logger.error(f"[KIS_Connector] key and iv not received for {tr_id}")
+            raise ValueError(f"no cipher for {tr_id}")
+        return cipher
+
+    async def _frame_worker(self, session: WSSession):
+        # takes all frames queued so far (a burst) and decrypts them in one worker thread call
+        while True:
+            await session.frames_ready.wait()
+            session.frames_ready.clear()
+            frames, session.frames = session.frames, []
+            session.decrypting = True
+            try:
+                results = await asyncio.to_thread(self._decode_frames, frames)
+            finally:
+                session.decrypting = False
+            if self.on_result:
+                for tr_id, n_rows, payload in results:
+                    try:
+                        self.on_result(tr_id, n_rows, payload)
+                    except Exception as e: # the worker keeps running (inline, the session would reconnect)
+                        self.logger.error(f"[KIS_Connector] ws{session.no} frame of {tr_id} not processed: {e}", exc_info=True)
+
+    def _decode_frames(self, frames): # runs in the worker thread
+        results = []
+        for tr_id, n_rows, payload, cipher in frames:
+            try:
+                results.append((tr_id, n_rows, cipher.decrypt(payload) if cipher else payload))
+            except ValueError as e: # wrong key / padding: the frame is dropped
+                self.logger.error(f"[KIS_Connector] {tr_id} frame not decrypted: {e}")
+        return results
 
     async def register_tr_id(
             self, 
+            session: WSSession,
             tr_id: str,
             columns: list | None = None,
             encrypt: str | None = None,
@@ -329,7 +556,7 @@ class KIS_Connector:
             iv: str | None = None,
     ):
         async with self._tr_id_map_lock:
-            entry = self.tr_id_map.setdefault(tr_id, {"key": None, "iv": None})
+            entry = session.tr_id_map.setdefault(tr_id, {"key": None, "iv": None})
 
             updates = {
                 "columns": columns,
@@ -341,32 +568,51 @@ class KIS_Connector:
             for k, v in updates.items():
                 if v is not None:
                     entry[k] = v
+            if key is not None or iv is not None:
+                entry["cipher"] = FrameCipher(entry["key"], entry["iv"]) if entry["key"] and entry["iv"] else None
 
     async def run_websocket(self):
+        async with asyncio.TaskGroup() as tg:
+            runners = [tg.create_task(self._run_session(session)) for session in self.ws_sessions]
+            workers = [tg.create_task(self._frame_worker(session)) for session in self.ws_sessions] if ws_decrypt_in_thread else []
+            await asyncio.wait(runners)
+            for worker in workers:
+                worker.cancel()
+
+    async def _run_session(self, session: WSSession):
         WEBSOCKET_RUN_DURATION_UNTIL_RESET = 300 # count reset after normal run of this duration
-        while self._ws_try_count < self._max_ws_tries:
+        while not session.closed:
+            exp_delay = 0
             try:
                 async with websockets.connect(self.url_ws) as ws:
-                    self.ws = ws
-                    self.ws_ready.set() 
+                    session.ws = ws
+                    session.sent.clear()
+                    self.logger.info(f"[KIS_Connector] ws{session.no} ({session.key.name}) connected")
 
                     # session start timestamp 
                     started = asyncio.get_event_loop().time()
 
-                    await self._subscriber()
+                    await self._place_pending() # registrations waiting for a slot (incl. the ones released on disconnect)
+                    await self._sync_session(session)
+                    await self._subscriber(session)
                     # ---- normal exit (no exception) ----
-                    session = asyncio.get_event_loop().time() - started
-                    if session > WEBSOCKET_RUN_DURATION_UNTIL_RESET:
-                        self._ws_try_count = 0
+                    duration = asyncio.get_event_loop().time() - started
+                    if duration > WEBSOCKET_RUN_DURATION_UNTIL_RESET:
+                        session.try_count = 0
             except Exception as e: # asyncio.CancelledError is not caught here, so escape while
-                self._ws_try_count += 1
-                exp_delay = min(2 ** self._ws_try_count, 30)
-                rec = "closed" if self._ws_try_count == self._max_ws_tries else f"reconnecting in {exp_delay} sec"
-                self.logger.error(f"[KIS_Connector] ws error {self._ws_try_count}/{self._max_ws_tries}, {rec}: {e}") #, exc_info=True)
-                await asyncio.sleep(exp_delay)
+                session.try_count += 1
+                session.closed = session.try_count >= self._max_ws_tries
+                exp_delay = min(2 ** session.try_count, 30)
+                rec = "closed" if session.closed else f"reconnecting in {exp_delay} sec"
+                self.logger.error(f"[KIS_Connector] ws{session.no} error {session.try_count}/{self._max_ws_tries}, {rec}: {e}") #, exc_info=True)
 
             finally:
-                self.ws = None
+                session.ws = None
+                self._release(session)
+
+            await self._place_pending() # moved to the other sessions (if room)
+            if not session.closed:
+                await asyncio.sleep(exp_delay)
                 
     async def close_httpx(self):
         if self.httpx_client is not None:
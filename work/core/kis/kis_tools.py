@@ -3,6 +3,7 @@ from typing import Optional, Tuple
 from enum import StrEnum
 
 from .kis_connect import KIS_Connector
+from .rate_limiter import ReqClass
 
 class _TR_ID:
     # this class should only be accessed through KIS_Functions class
@@ -13,6 +14,7 @@ class _TR_ID:
             self.RC_ORDER = "TTTC0013U"
             self.GET_PSBL_ORDER = "TTTC8908R"
             self.INQUIRE_BALANCE = "TTTC8434R"
+            self.INQUIRE_PRICE = "FHKST01010100"
             self.CCNL_NOTICE = "H0STCNI0"
             self.CCNL_KRX = "H0STCNT0"
 
@@ -22,6 +24,7 @@ class _TR_ID:
             self.RC_ORDER = "VTTC0013U"
             self.GET_PSBL_ORDER = "VTTC8908R"
             self.INQUIRE_BALANCE = "VTTC8434R"
+            self.INQUIRE_PRICE = "FHKST01010100"
             self.CCNL_NOTICE = "H0STCNI9"
             self.CCNL_KRX = "H0STCNT0" 
     
@@ -83,7 +86,7 @@ class KIS_Functions:
             "CNDT_PRIC": cndt_pric
         }
 
-        res, _ = await self.kc.url_fetch(api_url, tr_id, "", params, post=True)
+        res, _ = await self.kc.url_fetch(api_url, tr_id, "", params, post=True, req_class=ReqClass.ORDER)
         if res:
             return res.get('output', None)
         else: 
@@ -118,7 +121,7 @@ class KIS_Functions:
         if cndt_pric:
             params["CNDT_PRIC"] = cndt_pric
 
-        res, _ = await self.kc.url_fetch(api_url, tr_id, "", params, post=True)
+        res, _ = await self.kc.url_fetch(api_url, tr_id, "", params, post=True, req_class=ReqClass.ORDER)
         if res:
             return res.get('output', None)
         else: 
@@ -151,6 +154,21 @@ class KIS_Functions:
         else: 
             return None, None, None
 
+    # 주식현재가 시세: market data (not account bound), may be served by any configured app key
+    async def inquire_price(self, code: str):
+        api_url = "/uapi/domestic-stock/v1/quotations/inquire-price"
+        tr_id = self.tr_id.INQUIRE_PRICE
+        params = {
+            "FID_COND_MRKT_DIV_CODE": "J", # J: KRX
+            "FID_INPUT_ISCD": code,
+        }
+
+        res, _ = await self.kc.url_fetch(api_url, tr_id, "", params, req_class=ReqClass.MARKET)
+        if res:
+            return res.get('output', None)
+        else: 
+            return None
+
     async def inquire_balance(
         self,
         afhr_flpr_yn: str = "N",  # 시간외단일가·거래소여부
@@ -256,7 +274,7 @@ class KIS_Functions:
             tr_type = "2" # unsubscription
         tr_id = self.tr_id.CCNL_NOTICE
         tr_key = self.kc.htsid # tr_key: htsid
-        await self.kc.ws_send(tr_type, tr_id, tr_key)
+        await self.kc.ws_send(tr_type, tr_id, tr_key, primary=True)
 
     # tr_key: code
     async def ccnl_krx(self, tr_key: str, subs=True):
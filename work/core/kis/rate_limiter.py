@@ -0,0 +1,101 @@
+from collections import deque
+from enum import IntEnum
+import asyncio
+import time
+
+class ReqClass(IntEnum): # lower value served first
+    ORDER = 0 # order, revise/cancel
+    INQUIRY = 1 # account inquiries: balance, psbl order, ...
+    MARKET = 2 # market data inquiries (not account bound): may be spread over several app keys
+
+class _WaitStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, wait):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+    def __str__(self):
+        avg = self.total / self.count if self.count else 0
+        return f"n {self.count} avg {avg*1000:.0f}ms max {self.max*1000:.0f}ms"
+
+class RateLimiter:
+    """
+    Token bucket for KIS REST calls (one per app key)
+    - rate: tokens per sec / burst: bucket size
+    - acquire() only limits the start of a call: calls run concurrently once started
+    - waiters are queued by ReqClass and served in priority order (FIFO within a class)
+
+    waiters = {
+        ReqClass.ORDER: deque[future, ...],
+        ReqClass.INQUIRY: deque[future, ...],
+        ReqClass.MARKET: deque[future, ...],
+    }
+    stats: per class queue wait time (from acquire() to start)
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens: float = burst
+        self._updated = time.monotonic()
+        self.waiters: dict[ReqClass, deque[asyncio.Future]] = {c: deque() for c in ReqClass}
+        self._timer: asyncio.TimerHandle | None = None
+        self.stats = {c: _WaitStats() for c in ReqClass}
+
+    def __str__(self):
+        parts = [f"[RateLimiter] {self.rate}/s burst {self.burst}"]
+        for c in ReqClass:
+            parts.append(f"- {c.name}: queued {len(self.waiters[c])}, wait {self.stats[c]}")
+        return '\n'.join(parts)
+
+    # rough time until a new call could start (used to pick the least busy app key)
+    def expected_wait(self):
+        self._refill()
+        return max(0.0, (sum(len(q) for q in self.waiters.values()) + 1 - self.tokens) / self.rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # serves waiters with the tokens available now, and schedules itself for the next token if any waiter is left
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._refill()
+        for c in ReqClass:
+            q = self.waiters[c]
+            while q and self.tokens >= 1:
+                fut = q.popleft()
+                if fut.done(): # cancelled while waiting
+                    continue
+                self.tokens -= 1
+                fut.set_result(None)
+        if any(self.waiters.values()):
+            self._timer = asyncio.get_running_loop().call_later((1 - self.tokens) / self.rate, self._dispatch)
+
+    async def acquire(self, req_class: ReqClass = ReqClass.INQUIRY):
+        start = time.monotonic()
+        if not any(self.waiters.values()):
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.stats[req_class].add(0.0)
+                return
+
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters[req_class].append(fut)
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled(): # token granted but not used
+                self.tokens = min(self.burst, self.tokens + 1)
+                self._dispatch()
+            raise
+        self.stats[req_class].add(time.monotonic() - start)
@@ -0,0 +1,18 @@
+from base64 import b64decode
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+
+class FrameCipher:
+    """
+    AES-256-CBC decryption of encrypted real-time frames (key / iv per tr_id, from the subscription response)
+    - key / iv are encoded once per tr_id, a CBC cipher is built per frame (a CBC cipher object keeps chaining state)
+    """
+    def __init__(self, key: str, iv: str):
+        if key is None or iv is None:
+            raise ValueError("[FrameCipher] key and iv cannot be None")
+        self.key = key.encode("utf-8")
+        self.iv = iv.encode("utf-8")
+
+    def decrypt(self, cipher_text: str) -> str:
+        cipher = AES.new(self.key, AES.MODE_CBC, self.iv)
+        return bytes.decode(unpad(cipher.decrypt(b64decode(cipher_text)), AES.block_size))
@@ -144,31 +144,67 @@ TRPriceColumns = [
     "VI_STND_PRC", # 정적VI발동기준가
 ]
 TRPriceData = namedtuple('TRPriceData', TRPriceColumns)
+_CODE, _PRICE, _ASK, _BID, _VOL = (TRPriceColumns.index(c) for c in ("MKSC_SHRN_ISCD", "STCK_PRPR", "ASKP1", "BIDP1", "CNTG_VOL"))
+_N_USED = max(_CODE, _PRICE, _ASK, _BID, _VOL) + 1 # leading fields of a record that are converted
 
 class TransactionPrices:
+    """
+    Frame parser for the real-time prices: payload is the '^' joined fields of one frame (n_rows records of n_cols fields)
+    - only the fields used downstream are converted: code, price (last record), quantity (sum), ask / bid (last record)
+    - one record (the common case): the field count is checked, then split only up to the used fields
+      (the rest of the payload is left as one string)
+    - several records: records are not delimited, so the payload is split in full and read by offset
+    - records (TRPriceData per record) are built on first access, from the full split if there is one
+    """
     n_cols = len(TRPriceColumns)
 
-    def __init__(self, n_rows, d):
-        assert len(d) == n_rows * self.n_cols, (
-            f"TRP data {len(d)} cols {self.n_cols} x rows {n_rows} mismatch"
-        )
-        self.records = [
-            TRPriceData(*d[i:i + self.n_cols])
-            for i in range(0, n_rows * self.n_cols, self.n_cols)
-        ]
+    def __init__(self, n_rows, payload: str):
+        self.n_rows = n_rows
+        self._payload = payload
+        self._fields = None # full split (several records)
+        self._records = None
         self.time = datetime.now()
-        if not self.records:
+        if not n_rows:
             self.code = ""
             self.price = None
             self.quantity = 0
+            self.ask = self.bid = 0
             return
 
-        self.code = self.records[0].MKSC_SHRN_ISCD
-        self.price = int(self.records[-1].STCK_PRPR)
-        self.quantity = sum(int(r.CNTG_VOL) for r in self.records)
+        if n_rows == 1:
+            assert payload.count('^') == self.n_cols - 1, f"TRP data {payload.count('^') + 1} cols {self.n_cols} x rows 1 mismatch"
+            d = payload.split('^', _N_USED)
+            last = 0
+            self.quantity = int(d[_VOL])
+        else:
+            d = self._fields = payload.split('^')
+            assert len(d) == n_rows * self.n_cols, f"TRP data {len(d)} cols {self.n_cols} x rows {n_rows} mismatch"
+            last = (n_rows - 1) * self.n_cols
+            self.quantity = sum(map(int, d[_VOL::self.n_cols]))
+        self.code = d[_CODE]
+        self.price = int(d[last + _PRICE])
+        self.ask = int(d[last + _ASK])
+        self.bid = int(d[last + _BID])
+
+    @property
+    def records(self) -> list[TRPriceData]:
+        if self._records is None:
+            n, d = self.n_cols, self._fields or (self._payload.split('^') if self.n_rows else [])
+            self._records = [TRPriceData(*d[i:i + n]) for i in range(0, self.n_rows * n, n)]
+        return self._records
+
+    # the same trp with the quantity of several ticks: latest price / time / records, accumulated quantity
+    # used when ticks to a slow agent are conflated (TickBoard)
+    def conflated(self, quantity):
+        merged = TransactionPrices.__new__(TransactionPrices)
+        merged.__dict__.update(self.__dict__)
+        merged.quantity = quantity
+        return merged
 
     def __str__(self):
         parts = [f"[TR prices] {self.code}:"]
         for r in self.records:
             parts.append(f"    {r.STCK_CNTG_HOUR} {r.STCK_PRPR} {r.CNTG_VOL}")
+        if not self.n_rows and self.price is not None: # summary only (decoded from the wire or the tick ring): no records
+            parts.append(f"    {self.time:%H%M%S} {self.price} {self.quantity}")
         return '\n'.join(parts)
@@ -1,14 +1,16 @@
 import asyncio
 import logging
+import os
 
 from .order import Order, CancelOrder
 from .client import PersistentClient
 from .order_book import OrderBook
-from .bar import MovingBar
+from .bar import MovingBar, BarEngine
 from .perf_metric import PerformanceMetric
 from .strategy_base import StrategyBase
+from .strategy_util import UpdateEvent
 from ..base.logger import notice_beep
-from ..base.settings import Service, SERVER_PORT
+from ..base.settings import Service, SERVER_PORT, SERVER_UNIX_SOCKET, use_tick_ring, agent_reconnect_tries
 from ..kis.kis_tools import MTYPE
 from ..kis.ws_data import TransactionPrices, TransactionNotice
 from ..model.dashboard import DashBoard
@@ -26,7 +28,7 @@ class Agent:
         self.dashboard = DashBoard(logger=self.logger, owner_name=self.id, port=self.dp) 
 
         # for server communication
-        self.client = PersistentClient(id = self.id, logger = self.logger, port=SERVER_PORT[self.service], on_dispatch=self.on_dispatch)
+        self.client = PersistentClient(id = self.id, logger = self.logger, port=SERVER_PORT[self.service], unix_path=SERVER_UNIX_SOCKET[self.service], on_dispatch=self.on_dispatch)
         self.hardstop_event = asyncio.Event() # to finish agent activity
 
         # data tracking and strategy
@@ -40,6 +42,10 @@ class Agent:
         self.agent_ready_to_run_strategy: bool = False
         self.agent_initial_price_set_up = asyncio.Event() # wheather the first TNP is received (so that pm can be properly initialized)
         self.sync_start_date: str | None = None # isoformat date ("yyyy-mm-dd") # should be assigned in initialize() 
+        self.session_key: str | None = None # from the server on registration, used to resume after a disconnection
+        self.sync_cursor: tuple | None = None # from the server on sync, used to get only the changes on the next sync
+        self._tick_ring: tuple[str, int] | None = None # (path, inode) of the tick ring being read
+        self._tick_ring_task: asyncio.Task | None = None
 
         # strategy specific (ABC subclass instance)
         self.strategy.agent_id = self.id
@@ -68,57 +74,37 @@ class Agent:
         - has to be the starting point of the agent
         - does 1) connect to server, 2) register itself, 3) subscribe to trp by code, 4) wait until stopped
         - orders can be made afterward
+        - on a disconnection, reconnects and resumes the session (no full sync)
         """
         if not self.initialized: 
             self.logger.error(f"[Agent] agent not initialized - agent run aborted", extra={"owner": self.id})
             return 
         self.logger.info(f"[Agent] start running =============================================", extra={"owner": self.id})
+        self.strategy.attach_bar_engine(BarEngine.get(self.code)) # bars shared with the agents on the same code
 
         try:
             async with asyncio.TaskGroup() as tg:
                 tasks = []
-                tasks.append(tg.create_task(self.client.connect()))
+                connect_task = tg.create_task(self.client.connect())
                 await self.client.connected.wait()
 
                 # [DashBoard enact part]
                 tasks.append(tg.create_task(self.dashboard.run()))
 
                 # [Registration part]
-                register_request = ClientRequest(command=RequestCommand.REGISTER_AGENT)
-                register_request.set_request_data((self.id, self.code, self.dp)) 
-                register_resp: ServerResponse | None = await self.client.send_client_request(register_request)
-                if register_resp is None: 
-                    raise asyncio.CancelledError 
-                self.logger.info(f"[Agent] ServerResponse {register_resp}", extra={"owner": self.id})
-                if not register_resp.success:
+                if not await self._register():
                     raise asyncio.CancelledError 
 
-                # [Sync part - getting sync data]
-                sync_request = ClientRequest(command=RequestCommand.SYNC_ORDER_HISTORY)
-                sync_request.set_request_data(self.sync_start_date)
-                sync_resp: ServerResponse | None = await self.client.send_client_request(sync_request)
-                if sync_resp is None: 
-                    raise asyncio.CancelledError 
-                self.logger.info(f"[Agent] ServerResponse {sync_resp}", extra={"owner": self.id})
-                sync: Sync = sync_resp.data_dict.get("sync_data") 
-                await self.order_book.process_sync(sync)
-
-                # [Sync part - releasing lock]
-                release_request = ClientRequest(command=RequestCommand.SYNC_COMPLETE_NOTICE)
-                release_resp: ServerResponse | None = await self.client.send_client_request(release_request)
-                if release_resp is None: 
+                # [Sync part]
+                if not await self._sync():
                     raise asyncio.CancelledError 
-                if release_resp.success:
-                    self.logger.info(f"[Agent] ServerResponse {release_resp}", extra={"owner": self.id})
-                else: 
-                    self.logger.error(f"[Agent] ServerResponse lock release failed", extra={"owner": self.id})
         
                 # [Subscription part]
-                subs_request = ClientRequest(command=RequestCommand.SUBSCRIBE_TRP)
-                subs_resp: ServerResponse | None = await self.client.send_client_request(subs_request)
-                if subs_resp is None:
+                if not await self._subscribe_prices(tg):
                     raise asyncio.CancelledError 
-                self.logger.info(f"[Agent] ServerResponse {subs_resp}", extra={"owner": self.id})
+
+                # [Reconnection part]
+                tasks.append(tg.create_task(self.keep_connected(tg, connect_task)))
 
                 # [Price initialization part]
                 self.logger.info(f"[Agent] waiting for initial market price", extra={"owner": self.id})
@@ -134,10 +120,127 @@ class Agent:
                 # - need to cancel explicitly as tasks are long living
                 for t in tasks:
                     t.cancel()
+                if self._tick_ring_task is not None:
+                    self._tick_ring_task.cancel()
         
         finally:
+            self.strategy.detach_bar_engine()
             self.logger.info(f"[Agent] run completed =============================================", extra={"owner": self.id})
 
+    async def _register(self) -> bool:
+        register_request = ClientRequest(command=RequestCommand.REGISTER_AGENT)
+        register_request.set_request_data((self.id, self.code, self.dp)) 
+        register_resp: ServerResponse | None = await self.client.send_client_request(register_request)
+        if register_resp is None: 
+            return False
+        self.logger.info(f"[Agent] ServerResponse {register_resp}", extra={"owner": self.id})
+        if not register_resp.success:
+            return False
+        self.session_key = register_resp.data_dict.get('session_key')
+        return True
+
+    async def _sync(self) -> bool:
+        # getting sync data: only the changes since the last sync if the server accepts the cursor
+        sync_request = ClientRequest(command=RequestCommand.SYNC_ORDER_HISTORY)
+        sync_request.set_request_data((self.sync_start_date, self.sync_cursor))
+        sync_resp: ServerResponse | None = await self.client.send_client_request(sync_request)
+        if sync_resp is None: 
+            return False
+        self.logger.info(f"[Agent] ServerResponse {sync_resp}", extra={"owner": self.id})
+        sync: Sync = sync_resp.data_dict.get("sync_data") 
+        await self.order_book.process_sync(sync)
+        self.sync_cursor = sync.cursor
+        if sync.delta: # order dispatches missed while disconnected: strategy may be waiting for them
+            for order in (sync.incompleted_orders | sync.completed_orders).values():
+                if order.accepted and order.unique_id in self.strategy.pending_strategy_orders:
+                    self.strategy.handle_order_dispatch(order)
+
+        # completion notice: the server sends dispatches held during the sync
+        release_request = ClientRequest(command=RequestCommand.SYNC_COMPLETE_NOTICE)
+        release_resp: ServerResponse | None = await self.client.send_client_request(release_request)
+        if release_resp is None: 
+            return False
+        if release_resp.success:
+            self.logger.info(f"[Agent] ServerResponse {release_resp}", extra={"owner": self.id})
+        else: 
+            self.logger.error(f"[Agent] ServerResponse sync completion failed", extra={"owner": self.id})
+        return True
+
+    async def _subscribe(self, tick_ring: bool = use_tick_ring) -> ServerResponse | None:
+        subs_request = ClientRequest(command=RequestCommand.SUBSCRIBE_TRP)
+        subs_request.set_request_data(tick_ring) # asks for the shared tick ring
+        subs_resp: ServerResponse | None = await self.client.send_client_request(subs_request)
+        if subs_resp is not None:
+            self.logger.info(f"[Agent] ServerResponse {subs_resp}", extra={"owner": self.id})
+        return subs_resp
+
+    async def _subscribe_prices(self, tg: asyncio.TaskGroup) -> bool:
+        # subscribes and (re)starts the tick ring reader if the ring changed: a restarted server replaces the ring file (new inode)
+        # - no ring in the response: trps come through the socket
+        # - ring given but not readable: subscribes again without it, so that the server sends trps through the socket
+        subs_resp = await self._subscribe()
+        if subs_resp is None:
+            return False
+        path = subs_resp.data_dict.get('tick_ring')
+        ring = None
+        if path:
+            try:
+                ring = (path, os.stat(path).st_ino)
+            except OSError as e:
+                self.logger.error(f"[Agent] tick ring {path} not available, trps through the socket: {e}", extra={"owner": self.id})
+                if await self._subscribe(tick_ring=False) is None:
+                    return False
+
+        if ring != self._tick_ring or (ring is not None and self._tick_ring_task.done()):
+            if self._tick_ring_task is not None:
+                self._tick_ring_task.cancel()
+                self._tick_ring_task = None
+            self._tick_ring = ring
+            if ring is not None:
+                self._tick_ring_task = tg.create_task(self.client.read_tick_ring(path, self.code, subs_resp.data_dict.get('tick_ring_wake')))
+        return True
+
+    async def keep_connected(self, tg: asyncio.TaskGroup, connect_task: asyncio.Task):
+        # waits for a disconnection, then reconnects and resumes the session
+        # - the server replays the dispatches after the last one received, orders and notices meanwhile included
+        # - a tick ring reader keeps running (the ring does not depend on the connection), unless the server replaced the ring
+        # - if the session cannot be resumed (e.g., resume window passed or server restarted), the agent registers again and syncs
+        #   (only the orders changed since its last sync, unless the server restarted)
+        try:
+            while True:
+                await connect_task
+                self.logger.warning(f"[Agent] disconnected from the server, resuming session", extra={"owner": self.id})
+                for i in range(agent_reconnect_tries):
+                    await asyncio.sleep(min(2 ** i, 30))
+                    connect_task = tg.create_task(self.client.connect())
+                    connected = tg.create_task(self.client.connected.wait())
+                    await asyncio.wait((connect_task, connected), return_when=asyncio.FIRST_COMPLETED)
+                    if not self.client.is_connected:
+                        connected.cancel()
+                        continue
+
+                    resume_request = ClientRequest(command=RequestCommand.RESUME_SESSION)
+                    resume_request.set_request_data((self.id, self.code, self.dp, self.session_key, self.client.last_seq))
+                    resume_resp: ServerResponse | None = await self.client.send_client_request(resume_request)
+                    if resume_resp is None: # disconnected again
+                        continue
+                    self.logger.info(f"[Agent] ServerResponse {resume_resp}", extra={"owner": self.id})
+                    if not resume_resp.success:
+                        self.logger.warning(f"[Agent] session not resumed - registering again with a sync", extra={"owner": self.id})
+                        if not await self._register() or not await self._sync():
+                            continue
+                        if self.agent_ready_to_run_strategy:
+                            self.pm.update()
+                    if not await self._subscribe_prices(tg):
+                        continue
+                    break
+                else:
+                    self.logger.error(f"[Agent] reconnection failed after {agent_reconnect_tries} tries", extra={"owner": self.id})
+                    self.hardstop_event.set()
+                    return
+        finally:
+            connect_task.cancel()
+
     # ----------------------------------------------------------------------------------
     # order handling
     # ----------------------------------------------------------------------------------
@@ -195,7 +298,7 @@ class Agent:
         self.moving_bar.update(trp.price, trp.quantity, trp.time)
         # self.logger.info(self.moving_bar, extra={"owner": self.id})
 
-        self.strategy.raw_bars.update(trp.price, trp.quantity, trp.time)
+        self.strategy.bar_engine.update(self.id, trp.price, trp.quantity, trp.time)
 
         if not self.agent_ready_to_run_strategy:
             self.pm.update() # initial full update
@@ -204,7 +307,7 @@ class Agent:
         else: 
             self.pm.update(price_update_only=True) 
 
-        self.strategy._price_update_event.set()
+        self.strategy._notify(UpdateEvent.PRICE_UPDATE)
         
     async def handle_notice(self, trn: TransactionNotice):
         self.logger.info(trn, extra={"owner": self.id}) # show trn before processing
@@ -215,7 +318,7 @@ class Agent:
             self.logger.info(self.pm, extra={"owner": self.id})
         if order is not None: # accepted order
             self.strategy.handle_order_dispatch(order)
-        self.strategy._trn_receive_event.set()
+        self.strategy._notify(UpdateEvent.TRN_RECEIVE)
 
     # ----------------------------------------------------------------------------------
     # tools
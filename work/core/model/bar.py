@@ -1,6 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from collections import deque
 from datetime import datetime, timedelta
+import numpy as np
+
+from ..base.settings import raw_bar_retention
 
 # market prices for a given code
 # has moving window to record HLCV and weighted ma
@@ -68,18 +71,36 @@ class Bar:
     close: int
     volume: int
 
-    # for dashboard display
+    # for dashboard display (set on copies: see BarList.marked_barlist)
     price_event: str | None = None
     volume_event: str | None = None
     barlist_event: str | None = None
     status: str | None = None
 
 class RawBars:
+    """
+    Raw (1 sec) bars in a columnar store
+    - data: int64 array of shape (len(FIELDS), capacity), a row per field; bars are in data[:, _head:_tail] (oldest first)
+    - start is kept as seconds since ORIGIN (to_datetime() converts back)
+    - the last `retention` bars are kept: when the buffer is full, they are moved to the front
+      (the buffer grows up to 2 x retention, so append is amortized O(1))
+    - view(field, n): the last n values without copying; to be used right away, as appends may move the data
+    - raw bars are numbered in closing order (0: the first closed, `closed`: the next), span(first, last) is a view by number
+    - listeners: called on every raw bar close (BarBuilders)
+    """
     RAW_BAR_DELTA_SEC = 1 # sec
+    FIELDS = ('start', 'open', 'high', 'low', 'close', 'volume')
+    START, OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(FIELDS))
+    INITIAL_CAPACITY = 4096
 
-    def __init__(self):
+    def __init__(self, retention: int = raw_bar_retention):
         self.raw_bar_delta = timedelta(seconds=self.RAW_BAR_DELTA_SEC)
-        self.raw_bars: list = [] # unbounded list | should not be a deque (which is not efficient when slicing)
+        self.retention = retention
+        self.data = np.zeros((len(self.FIELDS), min(self.INITIAL_CAPACITY, 2*retention)), dtype=np.int64)
+        self._head = 0
+        self._tail = 0
+        self.dropped = 0 # bars dropped by retention
+        self.listeners: list = []
 
         self._cur_start: datetime | None = None
         self._cur_open: int | None = None
@@ -91,10 +112,13 @@ class RawBars:
     def __str__(self):
         NPRINT = 10
         res = []
-        for b in self.raw_bars[-NPRINT:]:
-            res.append(f"[Bar] ({b.start.strftime('%H%M%S')}) OHLCV {b.open} {b.high} {b.low} {b.close} {b.volume}")
+        for s, o, h, l, c, v in self.rows(NPRINT):
+            res.append(f"[Bar] ({self.to_datetime(s).strftime('%H%M%S')}) OHLCV {o} {h} {l} {c} {v}")
         return '\n'.join(res)
 
+    def __len__(self):
+        return self._tail - self._head
+
     # ---- public API ----
     def update(self, price: int, quantity: int, t: datetime):
         if self._cur_start is None:
@@ -110,6 +134,37 @@ class RawBars:
         self._cur_close = price
         self._cur_volume += quantity
 
+    def view(self, field: str, n: int | None = None) -> np.ndarray:
+        # last n (None: all kept) values of a field, zero-copy
+        head = self._head if n is None else max(self._head, self._tail - n)
+        return self.data[self.FIELDS.index(field), head:self._tail]
+
+    def columns(self, n: int | None = None) -> np.ndarray:
+        # (len(FIELDS), n) view of the last n bars
+        head = self._head if n is None else max(self._head, self._tail - n)
+        return self.data[:, head:self._tail]
+
+    @property
+    def closed(self) -> int: # raw bars closed so far, including the dropped ones
+        return self.dropped + self._tail - self._head
+
+    def span(self, first: int, last: int | None = None) -> np.ndarray:
+        # (len(FIELDS), n) view of the raw bars numbered first to last-1 (None: to the end), dropped ones excluded
+        head = self._head + max(first - self.dropped, 0)
+        tail = self._tail if last is None else self._head + max(last - self.dropped, 0)
+        return self.data[:, head:tail]
+
+    def rows(self, n: int | None = None) -> list[tuple[int, ...]]:
+        # last n bars as python tuples (start, open, high, low, close, volume)
+        return list(zip(*self.columns(n).tolist()))
+
+    def last(self) -> tuple[int, ...]:
+        return tuple(self.data[:, self._tail-1].tolist())
+
+    @classmethod
+    def to_datetime(cls, start: int) -> datetime:
+        return cls.ORIGIN + timedelta(seconds=start)
+
     # ---- internals ----
     ORIGIN = datetime(2000, 1, 1) # alignment anchor, naive local time (meaning tz is not specifically set)
     def _align_start(self, t: datetime) -> datetime:
@@ -126,117 +181,316 @@ class RawBars:
         self._cur_volume = 0
 
     def _close_bar(self):
-        self.raw_bars.append(
-            Bar(
-                start=self._cur_start,
-                open=self._cur_open,
-                high=self._cur_high,
-                low=self._cur_low,
-                close=self._cur_close,
-                volume=self._cur_volume,
-            )
+        if self._tail == self.data.shape[1]:
+            self._make_room()
+        self.data[:, self._tail] = (
+            (self._cur_start - self.ORIGIN) // timedelta(seconds=1),
+            self._cur_open,
+            self._cur_high,
+            self._cur_low,
+            self._cur_close,
+            self._cur_volume,
         )
+        self._tail += 1
+        if self._tail - self._head > self.retention:
+            self._head += 1
+            self.dropped += 1
+
+    def _make_room(self):
+        n = len(self)
+        if self.data.shape[1] < 2*self.retention: # grow
+            data = np.zeros((len(self.FIELDS), min(2*self.data.shape[1], 2*self.retention)), dtype=np.int64)
+        else: # move the kept bars to the front
+            data = self.data
+        data[:, :n] = self.data[:, self._head:self._tail]
+        self.data, self._head, self._tail = data, 0, n
+
+    def on_raw_bar_close(self):
+        for listener in self.listeners:
+            listener()
 
-    def on_raw_bar_close(self): # callback
-        pass
-    
 class BarBuilder:
+    """
+    Builds bars of bar_build_delta from raw bars
+    - a bar starts with the first raw bar at or after the end of the previous one
+    - raw bars are read as column views of RawBars (no copy, no Bar per raw bar): the open bar is only its start
+      and the number of its first raw bar, and is made a Bar from RawBars.span() when closed
+      (a bar longer than the raw bar retention is built from the raw bars still kept)
+    - listeners: called on every bar close (BarLists)
+    - sums: {field: prefix sums of the closed bars}, sums[field][i] = sum of bars[:i] (window sums in O(1))
+    """
     BAR_BUILD_DELTA_SEC = 20 # sec
+    SUM_FIELDS = ('open', 'high', 'low', 'close', 'volume')
 
     def __init__(self, raw_bars: RawBars):
         self.raw_bars = raw_bars
-        self.raw_bars.on_raw_bar_close = self.on_raw_bar_close
-        self.bar_build_delta = timedelta(seconds=self.BAR_BUILD_DELTA_SEC)
+        self.raw_bars.listeners.append(self.on_raw_bar_close)
+        self.bar_build_delta = self.BAR_BUILD_DELTA_SEC # sec
         self.bars: list[Bar] = []
+        self.listeners: list = []
+        self.sums: dict[str, list[int]] = {f: [0] for f in self.SUM_FIELDS}
 
-        self._cur_start: datetime | None = None
-        self._cur_bar: Bar | None = None
+        self._cur_start: int | None = None
+        self._cur_first: int = 0 # number of the first raw bar of the open bar
 
     def reset(self, bar_delta: int):
         res = None
-        self.bar_build_delta = timedelta(seconds=bar_delta)
-        if self.bar_build_delta < self.raw_bars.raw_bar_delta: 
-            self.bar_build_delta = self.raw_bars.raw_bar_delta
-            res = "[BarBuilder] bar_build_delta is set at raw_bar_delta, cannot go below raw_bar granularity"
+        self.bar_build_delta = bar_delta
+        if self.bar_build_delta < self.raw_bars.RAW_BAR_DELTA_SEC: 
+            self.bar_build_delta = self.raw_bars.RAW_BAR_DELTA_SEC
+            res = "[BarBuilder] bar_build_delta is set at raw_bar_delta, cannot go below raw_bar_granularity"
         self.bars.clear() 
+        self.sums = {f: [0] for f in self.SUM_FIELDS}
         self._cur_start = None
-        self._cur_bar = None
-
-        for b in self.raw_bars.raw_bars:
-            self.consume(b, reset=True)
+        self._cur_first = 0
+
+        cols = self.raw_bars.columns()
+        if not cols.shape[1]:
+            return res
+        # bar boundaries: a search per bar on the start column, then the bars by reduceat over the column views
+        starts = cols[RawBars.START]
+        idx = [0]
+        while True:
+            i = int(np.searchsorted(starts, starts[idx[-1]] + self.bar_build_delta))
+            if i == len(starts):
+                break
+            idx.append(i)
+        closed = idx[:-1] # the last one is the open bar
+        if closed:
+            ends = np.array(idx[1:]) - 1
+            values = {
+                'start': starts[closed],
+                'open': cols[RawBars.OPEN, closed],
+                'high': np.maximum.reduceat(cols[RawBars.HIGH, :idx[-1]], closed),
+                'low': np.minimum.reduceat(cols[RawBars.LOW, :idx[-1]], closed),
+                'close': cols[RawBars.CLOSE, ends],
+                'volume': np.add.reduceat(cols[RawBars.VOLUME, :idx[-1]], closed),
+            }
+            for f in self.SUM_FIELDS:
+                self.sums[f].extend(np.cumsum(values[f]).tolist())
+            values = {f: v.tolist() for f, v in values.items()}
+            self.bars = [
+                Bar(RawBars.to_datetime(t), o, h, l, c, v)
+                for t, o, h, l, c, v in zip(*(values[f] for f in ('start', *self.SUM_FIELDS)))
+            ]
+        self._cur_start = int(starts[idx[-1]])
+        self._cur_first = self.raw_bars.dropped + idx[-1]
         return res
 
     def on_raw_bar_close(self):
-        self.consume(self.raw_bars.raw_bars[-1])
-
-    def consume(self, bar: Bar, reset: bool = False) -> Bar | None:
+        start = int(self.raw_bars.columns(1)[RawBars.START, 0])
+        n = self.raw_bars.closed - 1
         if self._cur_start is None:
-            self._start(bar)
-            return 
-
-        if bar.start >= self._cur_start + self.bar_build_delta:
-            self.bars.append(self._cur_bar)
-            self._start(bar)
-            if not reset:
-                self.on_bar_close() 
+            self._cur_start, self._cur_first = start, n
             return
 
-        self._update(bar)
-
-    def _start(self, bar: Bar):
-        self._cur_start = bar.start
-        self._cur_bar = Bar(
-            start=bar.start,
-            open=bar.open,
-            high=bar.high,
-            low=bar.low,
-            close=bar.close,
-            volume=bar.volume,
+        if start >= self._cur_start + self.bar_build_delta:
+            self._close(self._bar(self.raw_bars.span(self._cur_first, n)))
+            self._cur_start, self._cur_first = start, n
+            self.on_bar_close() 
+
+    @staticmethod
+    def _bar(cols: np.ndarray) -> Bar:
+        return Bar(
+            start=RawBars.to_datetime(int(cols[RawBars.START, 0])),
+            open=int(cols[RawBars.OPEN, 0]),
+            high=int(cols[RawBars.HIGH].max()),
+            low=int(cols[RawBars.LOW].min()),
+            close=int(cols[RawBars.CLOSE, -1]),
+            volume=int(cols[RawBars.VOLUME].sum()),
         )
 
-    def _update(self, bar: Bar):
-        b = self._cur_bar
-        self._cur_bar = Bar(
-            start=b.start,
-            open=b.open,
-            high=max(b.high, bar.high),
-            low=min(b.low, bar.low),
-            close=bar.close,
-            volume=b.volume + bar.volume,
-        )
+    def _close(self, bar: Bar):
+        self.bars.append(bar)
+        for f, sums in self.sums.items():
+            sums.append(sums[-1] + getattr(bar, f))
 
-    def on_bar_close(): # callback
-        pass 
+    def on_bar_close(self):
+        for listener in self.listeners:
+            listener()
 
 class BarList: # subset of bars to be used in analysis
+    """
+    Window of the last num_bar bars (None: all) of a BarBuilder
+    - barlist: the bars in the window, sliced when accessed
+    - sum / mean: from the prefix sums of the BarBuilder, O(1) for any window size
+    - min / max: monotonic deques of bar indexes per (attr, kind), kept from the first call on (amortized O(1) per bar)
+    - marks: {bar start: dashboard fields} of this BarList only, as the bars may be shared; kept for the window
+    """
     NUM_BAR_TO_ANALYZE = 50
 
-    def __init__(self, bar_builder: BarBuilder):
-        self.barlist = []
+    def __init__(self, bar_builder: BarBuilder | None = None):
+        self.bar_builder: BarBuilder | None = None
+        self._num_bar = self.NUM_BAR_TO_ANALYZE
+        self._extremes: dict[tuple[str, str], deque] = {}
+        self.marks: dict[datetime, dict[str, str | None]] = {}
+        if bar_builder is not None:
+            self.bind(bar_builder)
+
+    def __len__(self):
+        start, end = self._window()
+        return end - start
+
+    @property
+    def barlist(self) -> list[Bar]:
+        if self.bar_builder is None:
+            return []
+        start, end = self._window()
+        return self.bar_builder.bars[start:end]
+
+    # subscribes to the bars of bar_builder (may be shared with other BarLists)
+    def bind(self, bar_builder: BarBuilder):
+        self.unbind()
         self.bar_builder = bar_builder
-        self.bar_builder.on_bar_close = self.on_bar_close
-        self.reset(self.NUM_BAR_TO_ANALYZE) # initialize
+        self.bar_builder.listeners.append(self.on_bar_close)
+
+    def unbind(self):
+        if self.bar_builder is not None:
+            self.bar_builder.listeners.remove(self.on_bar_close)
+            self.bar_builder = None
+        self._extremes.clear()
+        self.marks.clear()
 
     # if None; use all
     def reset(self, num_bar: int | None):
         self._num_bar = num_bar
-        self._get_barlist()
+        self._extremes.clear()
 
     def on_bar_close(self):
-        self._get_barlist()
+        start, end = self._window()
+        for (attr, kind), dq in self._extremes.items():
+            self._push_extreme(dq, attr, kind, end-1)
+            while dq[0] < start:
+                dq.popleft()
         self.on_barlist_update()
 
     def on_barlist_update(self): # callback
         pass
-    
-    def _get_barlist(self):
-        self.barlist = self.bar_builder.bars[-self._num_bar:] if self._num_bar else self.bar_builder.bars
 
+    # ---- window stats ----
+    def _window(self) -> tuple[int, int]: # [start, end) in bar_builder.bars
+        end = len(self.bar_builder.bars) if self.bar_builder is not None else 0
+        return (max(0, end - self._num_bar) if self._num_bar else 0), end
+
+    def sum(self, attr: str, start: int | None = None, stop: int | None = None) -> tuple[int, int]:
+        # (sum, count) of barlist[start:stop]
+        w_start, w_end = self._window()
+        i, j, _ = slice(start, stop).indices(w_end - w_start)
+        if j <= i:
+            return 0, 0
+        sums = self.bar_builder.sums[attr]
+        return sums[w_start + j] - sums[w_start + i], j - i
+
+    def mean(self, attr: str, start: int | None = None, stop: int | None = None) -> float | None:
+        total, count = self.sum(attr, start, stop)
+        return total / count if count else None
+
+    def last(self, attr: str):
+        return getattr(self.bar_builder.bars[-1], attr) if len(self) else None
+
+    def min(self, attr: str):
+        return self._extreme(attr, 'min')
+
+    def max(self, attr: str):
+        return self._extreme(attr, 'max')
+
+    def _extreme(self, attr, kind):
+        start, end = self._window()
+        if start == end:
+            return None
+        dq = self._extremes.get((attr, kind))
+        if dq is None: # built from the window once, then kept on bar close
+            dq = self._extremes[(attr, kind)] = deque()
+            for i in range(start, end):
+                self._push_extreme(dq, attr, kind, i)
+        return getattr(self.bar_builder.bars[dq[0]], attr)
+
+    def _push_extreme(self, dq: deque, attr, kind, i):
+        bars = self.bar_builder.bars
+        v = getattr(bars[i], attr)
+        if kind == 'min':
+            while dq and getattr(bars[dq[-1]], attr) >= v:
+                dq.pop()
+        else:
+            while dq and getattr(bars[dq[-1]], attr) <= v:
+                dq.pop()
+        dq.append(i)
+
+    # bars are shared by the strategies on the same code and bar_delta: marks are kept here, not on the bars
     def mark_on_barlist(self, barlist_event, status: str | None = None): 
-        bar_ = self.barlist[-1]
-        bar_.price_event = barlist_event.price_event 
-        bar_.volume_event = barlist_event.volume_event 
-        bar_.barlist_event = barlist_event.barlist_event 
+        bar_ = self.bar_builder.bars[-1]
+        mark = self.marks.setdefault(bar_.start, {})
+        mark['price_event'] = barlist_event.price_event 
+        mark['volume_event'] = barlist_event.volume_event 
+        mark['barlist_event'] = barlist_event.barlist_event 
 
         if status:
-            bar_.status = bar_.start.strftime('%H%M%S ') + status
\ No newline at end of file
+            mark['status'] = bar_.start.strftime('%H%M%S ') + status
+
+        first = self.barlist[0].start # marks are added in time order: drop the ones out of the window
+        while next(iter(self.marks)) < first:
+            del self.marks[next(iter(self.marks))]
+
+    @property
+    def marked_barlist(self) -> list[Bar]:
+        # barlist with the marks of this BarList, marked bars are copies
+        return [replace(b, **self.marks[b.start]) if b.start in self.marks else b for b in self.barlist]
+
+class BarEngine:
+    """
+    Bars of a code, shared by the strategies (agents) on the code in the process
+    - one RawBars per code, fed once per tick: the agents on a code get the same ticks (with the same time),
+      so a tick is taken from the feeder, or from any attached agent if newer than the last one taken
+    - feeder: the agent whose tick was taken last; a detached, reconnecting or stalled feeder is replaced
+      by the first agent delivering a newer tick, so the bars do not stop while another agent is receiving
+    - builders: {bar_delta: BarBuilder}, one per timeframe in use, all updated on each raw bar close
+    - strategies subscribe their BarList to the builder of their bar_delta
+      (a builder created later is built from the raw bars kept so far)
+    """
+    _engines: dict[str, "BarEngine"] = {}
+
+    def __init__(self, code: str):
+        self.code = code
+        self.raw_bars = RawBars()
+        self.builders: dict[int, BarBuilder] = {}
+        self.agents: list[str] = [] # attached agent ids
+        self.feeder: str | None = None
+        self.last_time: datetime | None = None # time of the last tick taken
+
+    @classmethod
+    def get(cls, code: str) -> "BarEngine":
+        engine = cls._engines.get(code)
+        if engine is None:
+            engine = cls._engines[code] = cls(code)
+        return engine
+
+    def __str__(self):
+        return f"[BarEngine] {self.code}, raw bars {len(self.raw_bars)}, timeframes {list(self.builders)}, agents {self.agents}, feeder {self.feeder}"
+
+    def attach(self, agent_id: str):
+        if agent_id not in self.agents:
+            self.agents.append(agent_id)
+
+    def detach(self, agent_id: str):
+        if agent_id in self.agents:
+            self.agents.remove(agent_id)
+        if self.feeder == agent_id:
+            self.feeder = None
+
+    def update(self, agent_id: str, price: int, quantity: int, t: datetime):
+        if agent_id not in self.agents:
+            return
+        last = self.last_time
+        if last is not None and (t < last or (t == last and agent_id != self.feeder)): # taken already (or stale)
+            return
+        self.feeder = agent_id
+        self.last_time = t
+        self.raw_bars.update(price, quantity, t)
+
+    def builder(self, bar_delta: int) -> BarBuilder:
+        bar_delta = max(bar_delta, RawBars.RAW_BAR_DELTA_SEC)
+        builder = self.builders.get(bar_delta)
+        if builder is None:
+            builder = self.builders[bar_delta] = BarBuilder(self.raw_bars)
+            builder.reset(bar_delta)
+        return builder
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from enum import StrEnum
 
-from .bar import Bar
+from .bar import Bar, BarList
 
 # -------------------------------------------------------------------------
 # Analysis classes
@@ -10,18 +10,30 @@ class AnalysisTarget(StrEnum):
     PRICE = 'close' # var name in Bar class
     VOLUME = 'volume'
 
-class BarListAnalysis: # analysis tools; gets list[Bar]
+class BarListAnalysis: # analysis tools; gets list[Bar] or BarList (rolling sums: O(1) regardless of the window size)
     @staticmethod
-    def get_last_to_avg(bars: list[Bar], attr: AnalysisTarget):
+    def get_last_to_avg(bars: list[Bar] | BarList, attr: AnalysisTarget):
+        if isinstance(bars, BarList):
+            avg_past = bars.mean(attr)
+            if not avg_past: return None
+            return bars.last(attr) / avg_past
+
         avg_past = sum(getattr(b, attr) for b in bars) / len(bars)
         if avg_past == 0: return None
         return getattr(bars[-1], attr) / avg_past
 
     @staticmethod
-    def get_shifted_trend(bars: list[Bar], attr: AnalysisTarget, shift=None):
+    def get_shifted_trend(bars: list[Bar] | BarList, attr: AnalysisTarget, shift=None):
         if shift is None:
             shift = max(1, len(bars) // 3)
 
+        if isinstance(bars, BarList):
+            early_avg = bars.mean(attr, stop=-shift)
+            late_avg = bars.mean(attr, start=shift)
+            if early_avg is None or late_avg is None or early_avg == 0:
+                return None
+            return late_avg / early_avg
+
         early = bars[:-shift]
         late  = bars[shift:]
 
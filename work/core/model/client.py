@@ -1,16 +1,19 @@
-import pickle
 import asyncio
 
-from ..base.settings import HOST
+from ..base.settings import HOST, wire_codec, use_unix_socket, tick_ring_poll_interval, dispatch_ack_interval, dispatch_ack_batch_size
 from ..comm.comm_interface import ClientRequest, ServerResponse, OM_Dispatch, Dispatch_ACK
+from ..comm.wire_codec import CODECS
+from ..comm.tick_ring import TickRingReader, TickRingWaiter
 
 class PersistentClient:
-    def __init__(self, id, logger, port, on_dispatch):
+    def __init__(self, id, logger, port, on_dispatch, unix_path=None):
         self.agent_id = id
         self.logger = logger
 
         self.host = HOST
         self.port = port
+        self.unix_path = unix_path if use_unix_socket and hasattr(asyncio, 'open_unix_connection') else None
+        self.codec = CODECS[wire_codec]
         self.reader: asyncio.StreamReader | None = None
         self.writer: asyncio.StreamWriter | None = None
 
@@ -21,23 +24,31 @@ class PersistentClient:
         self.pending_requests: dict[str, asyncio.Future] = {}
         self.on_dispatch = on_dispatch
 
+        # cumulative Dispatch_ACK state
+        self._ack_seq: int = 0 # last OM_Dispatch seq received
+        self._unacked: int = 0 # received but not yet acknowledged
+        self._ack_event: asyncio.Event = asyncio.Event()
+
     async def connect(self):
         """Connect and start the listener within the caller's TG."""
         if self.is_connected:
             return
         try: 
-            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            addr = await self._open_connection()
+            self.writer.write(bytes((self.codec.id, ))) # codec handshake
         except ConnectionRefusedError as e:
             self.logger.error(f"[Client] connection failed: {e}", extra={"owner": self.agent_id})
             return
-        self.logger.info(f"[Client] connected to {self.host}:{self.port}", extra={"owner": self.agent_id})
+        self.logger.info(f"[Client] connected to {addr}", extra={"owner": self.agent_id})
 
         try:
             # listener + dispatch + requests live inside this TG
             async with asyncio.TaskGroup() as tg:
                 self._tg = tg
                 self.connected.set()
+                ack_task = tg.create_task(self.ack_loop())
                 await self.listen_server()  # never returns until cancelled
+                ack_task.cancel()
         except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, OSError) as e:
             self.logger.warning(f"[Client] connection error {e}", extra={"owner": self.agent_id})
 
@@ -45,6 +56,7 @@ class PersistentClient:
         finally:
             self._tg = None
             self.connected.clear()
+            self._unacked = 0 # on resume, the server removes the dispatches up to last_seq
 
             # cancelling futures is necessary because pending / unfulfilled request
             # state must be handled at a higher (protocol/application) layer.
@@ -62,6 +74,17 @@ class PersistentClient:
                     pass # suppress windows errors
             self.logger.info("[Client] server connection closed", extra={"owner": self.agent_id})
 
+    async def _open_connection(self):
+        # unix socket first (if configured), TCP as fallback
+        if self.unix_path is not None:
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.unix_path)
+                return self.unix_path
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                self.logger.info(f"[Client] unix socket not available, falling back to TCP: {e}", extra={"owner": self.agent_id})
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return f"{self.host}:{self.port}"
+
     async def listen_server(self):
         """Main listener for server messages."""
         try:
@@ -69,7 +92,7 @@ class PersistentClient:
                 length_bytes = await self.reader.readexactly(4)
                 length = int.from_bytes(length_bytes, "big")
                 data = await self.reader.readexactly(length)
-                msg = pickle.loads(data)
+                msg = self.codec.decode(data)
 
                 # handle server_responses to client_requests
                 if isinstance(msg, ServerResponse):
@@ -80,9 +103,12 @@ class PersistentClient:
 
                 # handle order_manager-to-agent dispatch messages
                 elif isinstance(msg, OM_Dispatch):
-                    ack_bytes = pickle.dumps(Dispatch_ACK(id=msg.id, agent_id=self.agent_id))
-                    self.writer.write(len(ack_bytes).to_bytes(4, "big") + ack_bytes)
-                    await self.writer.drain()
+                    self._ack_seq = msg.seq
+                    self._unacked += 1
+                    if self._unacked >= dispatch_ack_batch_size:
+                        self._send_ack()
+                    else:
+                        self._ack_event.set()
                     msg = msg.data 
 
                 # dispatch via TG
@@ -96,6 +122,49 @@ class PersistentClient:
         except Exception as e:
             self.logger.error(f"[Client] unexpected error in listen_server: {e}", extra={"owner": self.agent_id}, exc_info=True)
 
+    def _send_ack(self):
+        # one cumulative ACK for all dispatches received so far (write is buffered, drained by ack_loop or requests)
+        if not self._unacked:
+            return
+        ack_bytes = self.codec.encode(Dispatch_ACK(seq=self._ack_seq, agent_id=self.agent_id))
+        self.writer.write(len(ack_bytes).to_bytes(4, "big") + ack_bytes)
+        self._unacked = 0
+
+    async def ack_loop(self):
+        try:
+            while True:
+                await self._ack_event.wait()
+                await asyncio.sleep(dispatch_ack_interval) # collects dispatches arriving in the meantime
+                self._ack_event.clear()
+                self._send_ack()
+                await self.writer.drain()
+        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, OSError) as e:
+            self.logger.warning(f"[Client] ACK not sent: {e}", extra={"owner": self.agent_id}) # listen_server ends with the connection
+
+    async def read_tick_ring(self, path, code, wake_path=None):
+        """Reads ticks from the shared tick ring (instead of the socket) and dispatches them as TransactionPrices."""
+        reader = TickRingReader(path)
+        waiter = TickRingWaiter(wake_path, code) if wake_path else None # woken by the server, polls without it
+        self.logger.info(f"[Client] reading ticks from {path}", extra={"owner": self.agent_id})
+        try:
+            if waiter is not None:
+                await waiter.open()
+            while True:
+                ticks, lost = reader.read()
+                if lost:
+                    self.logger.warning(f"[Client] {lost} ticks lost in the tick ring (total {reader.lost})", extra={"owner": self.agent_id})
+                for price, quantity, ask, bid, ts in ticks:
+                    await self.on_dispatch(TickRingReader.to_trp(code, price, quantity, ask, bid, ts))
+                if not ticks:
+                    if waiter is not None:
+                        await waiter.wait(reader.next_seq)
+                    else:
+                        await asyncio.sleep(tick_ring_poll_interval)
+        finally:
+            if waiter is not None:
+                waiter.close()
+            reader.close()
+
     # send_client_request will return server_response or None on failure
     async def send_client_request(self, client_request: ClientRequest, timeout: float = None) -> ServerResponse | None:
         """Send a request; short-lived task under the same TG."""
@@ -110,7 +179,7 @@ class PersistentClient:
 
             # Send request
             try:
-                req_bytes = pickle.dumps(client_request)
+                req_bytes = self.codec.encode(client_request)
                 msg = len(req_bytes).to_bytes(4, "big") + req_bytes
                 self.writer.write(msg)
                 await self.writer.drain()
@@ -124,4 +193,8 @@ class PersistentClient:
 
     @property
     def is_connected(self) -> bool:
-        return self.connected.is_set()
\ No newline at end of file
+        return self.connected.is_set()
+
+    @property
+    def last_seq(self) -> int: # last OM_Dispatch seq received (presented on session resume)
+        return self._ack_seq
\ No newline at end of file
@@ -0,0 +1,235 @@
+from collections import deque
+import math
+
+import numpy as np
+
+# ----------------------------------------------------------------------
+# bar indicators: batch (whole history) and streaming (one new bar) entry points
+# - batch functions take 1-D arrays, e.g., RawBars.view('close') (zero-copy) or arrays built from BarList bars
+#   and return a float array of the same length, nan until the indicator is defined
+# - streaming classes return the value for the new bar (nan until defined)
+# - batch and streaming:
+#   - windowed / cumulative ones (VWAP, volume z-score, realized volatility): exact int or sequential (cumsum) sums,
+#     mirrored by running sums in streaming, so results are identical
+#   - recursive ones (EMA, ATR, RSI): NOT bit for bit identical. batch solves the linear recurrence y[i] = a*y[i-1] + x[i]
+#     in blocks with numpy (see _recurrence), in another order of float operations than the streaming step,
+#     so values differ by float rounding: within BATCH_RTOL (relative), nan at the same bars
+#     (a python loop over the streaming step would be identical, at ~15x the batch cost)
+# ----------------------------------------------------------------------
+NAN = float('nan')
+BATCH_RTOL = 1e-12 # recursive indicators: batch vs streaming values
+
+class _Wilder:
+    # Wilder smoothing: the mean of the first n values, then avg = (avg*(n-1) + v)/n
+    def __init__(self, n: int):
+        self.n = n
+        self.count = 0
+        self.total = 0
+        self.avg = NAN
+
+    def update(self, v) -> float:
+        self.count += 1
+        if self.count < self.n:
+            self.total += v
+            return NAN
+        if self.count == self.n:
+            self.total += v
+            self.avg = self.total / self.n
+        else:
+            self.avg = (self.avg * (self.n - 1) + v) / self.n
+        return self.avg
+
+class EMA:
+    # seeded with the first value, alpha = 2/(span+1)
+    def __init__(self, span: int):
+        self.alpha = 2 / (span + 1)
+        self.value = NAN
+        self._started = False
+
+    def update(self, x) -> float:
+        if not self._started:
+            self._started = True
+            self.value = float(x)
+        else:
+            self.value = self.value + self.alpha * (x - self.value)
+        return self.value
+
+class VWAP:
+    # cumulative since creation (or reset), typical price (high + low + close)/3
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._pv = 0 # sum of (high + low + close) x volume
+        self._v = 0
+
+    def update(self, high: int, low: int, close: int, volume: int) -> float:
+        self._pv += (high + low + close) * volume
+        self._v += volume
+        return float(self._pv) / float(3 * self._v) if self._v else NAN
+
+class ATR:
+    # Wilder's average true range, defined from the n-th bar
+    def __init__(self, n: int = 14):
+        self._wilder = _Wilder(n)
+        self._prev_close = None
+
+    def update(self, high: int, low: int, close: int) -> float:
+        pc = self._prev_close
+        tr = high - low if pc is None else max(high - low, abs(high - pc), abs(low - pc))
+        self._prev_close = close
+        return self._wilder.update(tr)
+
+class RSI:
+    # Wilder's RSI, defined from the (n+1)-th bar (n changes)
+    def __init__(self, n: int = 14):
+        self._gain = _Wilder(n)
+        self._loss = _Wilder(n)
+        self._prev_close = None
+
+    def update(self, close: int) -> float:
+        if self._prev_close is None:
+            self._prev_close = close
+            return NAN
+        d = close - self._prev_close
+        self._prev_close = close
+        return _rsi_value(self._gain.update(max(d, 0)), self._loss.update(max(-d, 0)))
+
+def _rsi_value(avg_gain, avg_loss) -> float:
+    if avg_gain != avg_gain: # nan: not defined yet
+        return NAN
+    if avg_loss == 0:
+        return 50.0 if avg_gain == 0 else 100.0
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+class VolumeZScore:
+    # z-score of the volume within the last n bars (population std), nan if the std is 0
+    def __init__(self, n: int = 20):
+        self.n = n
+        self._window = deque()
+        self._s = 0
+        self._s2 = 0
+
+    def update(self, volume: int) -> float:
+        self._window.append(volume)
+        self._s += volume
+        self._s2 += volume * volume
+        if len(self._window) > self.n:
+            old = self._window.popleft()
+            self._s -= old
+            self._s2 -= old * old
+        if len(self._window) < self.n:
+            return NAN
+        mean = float(self._s) / self.n
+        var = float(self._s2) / self.n - mean * mean
+        return (volume - mean) / math.sqrt(var) if var > 0 else NAN
+
+class RealizedVol:
+    # sqrt of the sum of squared simple returns over the last n returns (per bar, not annualized)
+    def __init__(self, n: int = 20):
+        self.n = n
+        self._prev_close = None
+        self._cum = 0.0 # sequential sum of squared returns, the same as np.cumsum
+        self._cums = deque([0.0])
+
+    def update(self, close: int) -> float:
+        if self._prev_close is None:
+            self._prev_close = close
+            return NAN
+        r = float(close - self._prev_close) / float(self._prev_close)
+        self._prev_close = close
+        self._cum += r * r
+        self._cums.append(self._cum)
+        if len(self._cums) <= self.n:
+            return NAN
+        if len(self._cums) > self.n + 1:
+            self._cums.popleft()
+        return math.sqrt(max(self._cum - self._cums[0], 0.0))
+
+# ---- batch ----
+_BLOCK = 256
+
+def _recurrence(x: np.ndarray, a: float, y0: float) -> np.ndarray:
+    # y[i] = a*y[i-1] + x[i], y[-1] = y0, for 0 <= a < 1
+    # - in a block: y = P @ x + a^(i+1) * (y before the block), P[i, j] = a^(i-j) for j <= i (weights <= 1: no cancellation)
+    # - between blocks: the carry (last y of a block) in a loop over blocks only
+    n = len(x)
+    nb = -(-n // _BLOCK)
+    k = np.arange(_BLOCK)
+    powers = a ** np.maximum(k[:, None] - k[None, :], 0)
+    P = np.tril(powers)
+    xb = np.zeros((nb, _BLOCK))
+    xb.reshape(-1)[:n] = x
+    z = xb @ P.T # each block from 0
+    decay = a ** (k + 1)
+    carry = np.empty(nb)
+    c = y0
+    for b in range(nb):
+        carry[b] = c
+        c = z[b, -1] + decay[-1] * c
+    return (z + decay[None, :] * carry[:, None]).reshape(-1)[:n]
+
+def _wilder(v: np.ndarray, n: int) -> np.ndarray:
+    # the mean of the first n values, then avg = (avg*(n-1) + v)/n, i.e., avg = a*avg + v/n with a = (n-1)/n
+    out = np.full(len(v), NAN)
+    if len(v) < n:
+        return out
+    out[n-1] = v[:n].sum() / n
+    out[n:] = _recurrence(v[n:] / n, (n - 1) / n, out[n-1])
+    return out
+
+def ema(x, span: int) -> np.ndarray:
+    x = np.asarray(x, dtype=float)
+    if not len(x):
+        return np.empty(0)
+    alpha = 2 / (span + 1)
+    return np.concatenate(([x[0]], _recurrence(alpha * x[1:], 1 - alpha, x[0])))
+
+def vwap(high, low, close, volume) -> np.ndarray:
+    high, low, close, volume = (np.asarray(a, dtype=np.int64) for a in (high, low, close, volume))
+    pv = np.cumsum((high + low + close) * volume)
+    v3 = 3 * np.cumsum(volume)
+    return np.divide(pv, v3, out=np.full(len(pv), NAN), where=v3 > 0)
+
+def atr(high, low, close, n: int = 14) -> np.ndarray:
+    high, low, close = (np.asarray(a, dtype=np.int64) for a in (high, low, close))
+    if not len(close):
+        return np.empty(0)
+    tr = high - low
+    tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - close[:-1]), np.abs(low[1:] - close[:-1])))
+    return _wilder(tr, n)
+
+def rsi(close, n: int = 14) -> np.ndarray:
+    close = np.asarray(close, dtype=np.int64)
+    if not len(close):
+        return np.empty(0)
+    d = np.diff(close)
+    gain, loss = _wilder(np.maximum(d, 0), n), _wilder(np.maximum(-d, 0), n)
+    out = np.full(len(d), NAN)
+    flat = loss == 0 # _rsi_value: 50 if no change at all, 100 if no loss
+    out[flat] = np.where(gain[flat] == 0, 50.0, 100.0)
+    rs = ~flat & (loss == loss)
+    out[rs] = 100 - 100 / (1 + gain[rs] / loss[rs])
+    return np.concatenate(([NAN], out))
+
+def volume_zscore(volume, n: int = 20) -> np.ndarray:
+    volume = np.asarray(volume, dtype=np.int64)
+    out = np.full(len(volume), NAN)
+    if len(volume) < n:
+        return out
+    c1 = np.concatenate(([0], np.cumsum(volume)))
+    c2 = np.concatenate(([0], np.cumsum(volume * volume)))
+    mean = (c1[n:] - c1[:-n]) / n
+    var = (c2[n:] - c2[:-n]) / n - mean * mean
+    np.divide(volume[n-1:] - mean, np.sqrt(np.maximum(var, 0)), out=out[n-1:], where=var > 0)
+    return out
+
+def realized_vol(close, n: int = 20) -> np.ndarray:
+    close = np.asarray(close, dtype=np.int64)
+    out = np.full(len(close), NAN)
+    if len(close) <= n:
+        return out
+    r = np.diff(close) / close[:-1]
+    cums = np.concatenate(([0.0], np.cumsum(r * r)))
+    out[n:] = np.sqrt(np.maximum(cums[n:] - cums[:-n], 0.0))
+    return out
@@ -1,5 +1,5 @@
 import asyncio
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, MISSING
 import logging
 
 from .order import Order, CancelOrder
@@ -7,6 +7,50 @@ from ..kis.kis_tools import SIDE, MTYPE
 from ..kis.ws_data import TransactionNotice
 from ..comm.comm_interface import Sync
 
+@dataclass
+class RecordStats:
+    """
+    Executed order stats (체결된 사항), the same fields as in OrderBook
+    - used by the server to fold the orders of previous days into a sync summary
+    """
+    orderbook_holding_qty: int = 0
+    orderbook_holding_avg_price: float = 0
+    initial_holding_sold_qty: int = 0
+    cumul_buy_qty: int = 0
+    cumul_sell_qty: int = 0
+    net_cash_used: int = 0
+    cumul_cost: int = 0
+    total_cash_used: int = 0
+
+    def add(self, order: Order | CancelOrder):
+        if order.is_regular_order:
+            record_increase(self, order.side, order.processed, order.fee_+order.tax_, order.amount)
+
+# executed order portion stat update (체결된 사항에 대한 update) on OrderBook or RecordStats
+def record_increase(stats: "OrderBook | RecordStats", side: SIDE, delta_qty, delta_cost, delta_amount):
+    if delta_qty == 0: return
+    if side == SIDE.BUY:
+        pq = stats.orderbook_holding_qty # prev quantity, copy value
+        stats.orderbook_holding_qty += delta_qty
+        stats.orderbook_holding_avg_price = (pq*stats.orderbook_holding_avg_price+delta_amount)/stats.orderbook_holding_qty if stats.orderbook_holding_qty !=0 else 0
+        stats.cumul_buy_qty += delta_qty
+        stats.net_cash_used += delta_amount
+    else:
+        if stats.orderbook_holding_qty - delta_qty > 0:
+            stats.orderbook_holding_qty += -delta_qty
+        elif stats.orderbook_holding_qty - delta_qty == 0:
+            stats.orderbook_holding_qty = 0
+            stats.orderbook_holding_avg_price = 0
+        else:
+            stats.initial_holding_sold_qty += -(stats.orderbook_holding_qty - delta_qty)
+            stats.orderbook_holding_qty = 0
+            stats.orderbook_holding_avg_price = 0
+
+        stats.cumul_sell_qty += delta_qty
+        stats.net_cash_used += -delta_amount
+    stats.cumul_cost += delta_cost
+    stats.total_cash_used = stats.net_cash_used + stats.cumul_cost
+
 @dataclass
 class OrderBook: 
     """
@@ -15,6 +59,7 @@ class OrderBook:
     note: 
     - submitted: goes to incompleted orders already
     - accepted: reflected in pending quanity (at this level, strategy is notified)
+    - orders of previous days are not kept: synced as a summary of their stats (RecordStats)
     """
     agent_id: str 
     code: str
@@ -61,7 +106,7 @@ class OrderBook:
     # ----------------------------------------------------------------
 
     def __str__(self):
-        if not self._indexed_incompleted_orders and not self._indexed_completed_orders:
+        if not self._indexed_incompleted_orders and not self._indexed_completed_orders and not self.cumul_buy_qty and not self.cumul_sell_qty:
             return "[OrderBook] no records"
         _indent = '    '
         return (
@@ -98,43 +143,57 @@ class OrderBook:
         return "\n".join(sections)
 
     # ----------------------------------------------------------------------------------
-    # sync on initialization
+    # sync on initialization (or after a session that could not be resumed)
     # ----------------------------------------------------------------------------------
     async def process_sync(self, sync: Sync):
+        # full sync: the book is rebuilt from the summary of previous days and today's orders
+        # delta sync: only the orders changed since the last sync are applied on the current book
         async with self._lock:
             self.logger.info(f"[OrderBook] sync data received: {sync}", extra={"owner": self.agent_id})
-            
-            # sync has to be done when agent is initialized... 
-            self._check_if_start_from_empty()
 
-            # then overwrite with the server data
-            self._indexed_prev_incompleted_orders = sync.prev_incompleted_orders # before today
-            self._indexed_incompleted_orders = sync.incompleted_orders # today
-            self._indexed_completed_orders = sync.completed_orders
+            if not sync.delta:
+                self._reset()
+                for k, v in (sync.summary or {}).items():
+                    setattr(self, k, v)
+                # before today: already reflected in the summary
+                self._indexed_prev_incompleted_orders = sync.prev_incompleted_orders
 
             # _pending_trns_from_server_on_sync value assigned only here
             self._pending_trns_from_server_on_sync = sync.pending_trns
 
-            for _, v in self._indexed_completed_orders.items():
-                if v.is_regular_order:
-                    self._record_increase(v, v.processed, v.fee_+v.tax_, v.amount)
-
-            for _, v in self._indexed_prev_incompleted_orders.items():
-                if v.is_regular_order:
-                    self._record_increase(v, v.processed, v.fee_+v.tax_, v.amount)
-
-            for _, v in self._indexed_incompleted_orders.items():
-                if v.is_regular_order:
-                    self._record_increase(v, v.processed, v.fee_+v.tax_, v.amount)
-                    self._pending_increase(v, v.quantity-v.processed)
+            for orders in (sync.completed_orders, sync.incompleted_orders):
+                for _, v in orders.items():
+                    self._apply_synced_order(v)
             self.logger.info(f"[OrderBook] sync completed: {self}", extra={"owner": self.agent_id})
 
-    def _check_if_start_from_empty(self):
-        # checking representative ones
-        if self._indexed_incompleted_orders: self.logger.error(f"[OrderBook] parse_orders, initial state not empty - 1", extra={"owner": self.agent_id})
-        if self._indexed_completed_orders: self.logger.error(f"[OrderBook] parse_orders, initial state not empty - 2", extra={"owner": self.agent_id})
-        if self.orderbook_holding_qty != 0: self.logger.error(f"[OrderBook] key_stat is not zero - 1", extra={"owner": self.agent_id})
-        if self.total_cash_used != 0: self.logger.error(f"[OrderBook] key_stat is not zero - 2", extra={"owner": self.agent_id})
+    def _reset(self):
+        for f in fields(self):
+            if f.init and f.name not in ('agent_id', 'code', 'logger'):
+                setattr(self, f.name, f.default_factory() if f.default_factory is not MISSING else f.default)
+
+    # replaces the book's copy of the order (if any) with the server's, stats updated by the difference
+    # - pending qty of an order is counted once accepted, the same as in process_tr_notice
+    def _apply_synced_order(self, order: Order | CancelOrder):
+        prev = self._indexed_incompleted_orders.pop(order.order_no, None)
+        prev_incompleted = prev is not None
+        if prev is None:
+            prev = self._indexed_completed_orders.pop(order.order_no, None)
+        self._unhandled_trns.pop(order.order_no, None) # already reflected in the server's order
+
+        if order.is_regular_order:
+            if prev is not None:
+                if prev_incompleted and prev.accepted:
+                    self._pending_increase(prev, -(prev.quantity-prev.processed))
+                self._record_increase(order, order.processed-prev.processed, (order.fee_+order.tax_)-(prev.fee_+prev.tax_), order.amount-prev.amount)
+            else:
+                self._record_increase(order, order.processed, order.fee_+order.tax_, order.amount)
+            if not order.completed and order.accepted:
+                self._pending_increase(order, order.quantity-order.processed)
+
+        if order.completed:
+            self._indexed_completed_orders[order.order_no] = order
+        else:
+            self._indexed_incompleted_orders[order.order_no] = order
 
     # ----------------------------------------------------------------------------------
     # executed order portion stat update (체결된 사항에 대한 update)
@@ -151,28 +210,7 @@ class OrderBook:
             self.pending_sell_qty += delta_qty
 
     def _record_increase(self, updated_order: Order, delta_qty, delta_cost, delta_amount):
-        if delta_qty == 0: return
-        if updated_order.side == SIDE.BUY:
-            pq = self.orderbook_holding_qty # prev quantity, copy value
-            self.orderbook_holding_qty += delta_qty
-            self.orderbook_holding_avg_price = (pq*self.orderbook_holding_avg_price+delta_amount)/self.orderbook_holding_qty if self.orderbook_holding_qty !=0 else 0
-            self.cumul_buy_qty += delta_qty
-            self.net_cash_used += delta_amount
-        else:
-            if self.orderbook_holding_qty - delta_qty > 0:
-                self.orderbook_holding_qty += -delta_qty
-            elif self.orderbook_holding_qty - delta_qty == 0:
-                self.orderbook_holding_qty = 0
-                self.orderbook_holding_avg_price = 0
-            else:
-                self.initial_holding_sold_qty += -(self.orderbook_holding_qty - delta_qty)
-                self.orderbook_holding_qty = 0
-                self.orderbook_holding_avg_price = 0
-
-            self.cumul_sell_qty += delta_qty
-            self.net_cash_used += -delta_amount
-        self.cumul_cost += delta_cost
-        self.total_cash_used = self.net_cash_used + self.cumul_cost
+        record_increase(self, updated_order.side, delta_qty, delta_cost, delta_amount)
     
     # ----------------------------------------------------------------------------------
     # trn handling
@@ -4,7 +4,7 @@ import asyncio
 from .perf_metric import PerformanceMetric
 from .strategy_util import UpdateEvent
 from .order import Order, CancelOrder
-from .bar import RawBars, BarBuilder, BarList
+from .bar import BarBuilder, BarList, BarEngine
 from .barlist_analysis import BarListStatus
 from .dashboard import DashBoard
 from ..base.tools import excel_round
@@ -37,16 +37,17 @@ class StrategyBase(ABC):
         self.lazy_run: bool = True
 
         # Strategy - Agent communication channel (only used in StrategyBase and Agent - internal for both)
-        self._price_update_event: asyncio.Event = asyncio.Event()
-        self._trn_receive_event: asyncio.Event = asyncio.Event()
+        # - _notify() adds to the pending events and sets a single wakeup: one logic_run iteration per wakeup
+        self._pending_events: UpdateEvent = UpdateEvent(0)
+        self._wakeup: asyncio.Event = asyncio.Event()
 
         # BarList analysis
-        self._barlist_event_event: asyncio.Event = asyncio.Event()
         self.barlist_status: BarListStatus | None = None
 
-        self.raw_bars = RawBars() # default 1 sec, full history 
-        self.bar_builer = BarBuilder(raw_bars=self.raw_bars) # default 20 sec; adjust by reset()
-        self.barlist = BarList(bar_builder=self.bar_builer) # default 50 bars; adjust by reset() 
+        # bars come from the BarEngine of the code (shared with other agents on the code), attached by the agent
+        self.bar_engine: BarEngine | None = None
+        self.bar_delta: int = BarBuilder.BAR_BUILD_DELTA_SEC # default 20 sec; adjust by set_bar_delta()
+        self.barlist = BarList() # default 50 bars; adjust by reset() 
         self.barlist.on_barlist_update = self.on_barlist_update 
         
         # others
@@ -66,30 +67,21 @@ class StrategyBase(ABC):
         await self.on_update_shell(UpdateEvent.INITIATE)
 
         while True:
-            self._price_update_event.clear() # does not run on every price change
+            # events that arrived during the last on_update
+            self._pending_events &= ~UpdateEvent.PRICE_UPDATE # does not run on every price change
             if self.lazy_run: # if True, strategy does not run on every trn: only reacts to new trns
-                self._trn_receive_event.clear() 
+                self._pending_events &= ~UpdateEvent.TRN_RECEIVE
+            if not self._pending_events:
+                self._wakeup.clear()
+                await self._wakeup.wait()
 
-            tasks = {
-                asyncio.create_task(self._price_update_event.wait()): UpdateEvent.PRICE_UPDATE,
-                asyncio.create_task(self._trn_receive_event.wait()): UpdateEvent.TRN_RECEIVE,
-                asyncio.create_task(self._barlist_event_event.wait()): UpdateEvent.BARLIST_EVENT,
-            }
+            events, self._pending_events = self._pending_events, UpdateEvent(0)
+            await self.on_update_shell(events)
 
-            done, pending = await asyncio.wait(
-                tasks,
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-
-            for t in pending:
-                t.cancel()
+    def _notify(self, update_event: UpdateEvent):
+        self._pending_events |= update_event
+        self._wakeup.set()
 
-            event_type = tasks[done.pop()] # done and pending are sets, so use pop()
-            if event_type is UpdateEvent.BARLIST_EVENT:
-                self._barlist_event_event.clear()
-
-            await self.on_update_shell(event_type)
-    
     async def on_update_shell(self, update_event: UpdateEvent):
         if self._suspend_on_update: return
 
@@ -110,6 +102,21 @@ class StrategyBase(ABC):
             self.logger.error(f"[Strategy] on_update failed ({update_event.name}): {e}", extra={"owner": self.agent_id}, exc_info=True)
             raise asyncio.CancelledError
 
+    def attach_bar_engine(self, bar_engine: BarEngine):
+        self.bar_engine = bar_engine
+        self.bar_engine.attach(self.agent_id)
+        self.barlist.bind(self.bar_engine.builder(self.bar_delta))
+
+    def detach_bar_engine(self):
+        if self.bar_engine is not None:
+            self.bar_engine.detach(self.agent_id)
+            self.barlist.unbind()
+
+    def set_bar_delta(self, bar_delta: int):
+        self.bar_delta = bar_delta
+        if self.bar_engine is not None:
+            self.barlist.bind(self.bar_engine.builder(bar_delta))
+
     def check_barlist_event(self, **kwargs):
         self.barlist_status = BarListStatus(**kwargs)
 
@@ -126,10 +133,10 @@ class StrategyBase(ABC):
         # 2) call self.check_barlist_event(**kwargs)
         # 3) **kwargs should match with BarListStatus signature
         if self.dashboard: 
-            self.dashboard.send_bars(self.barlist.barlist)
+            self.dashboard.send_bars(self.barlist.marked_barlist)
 
         if self.barlist_status and self.barlist_status.barlist_event:
-            self._barlist_event_event.set()
+            self._notify(UpdateEvent.BARLIST_EVENT)
 
     @abstractmethod
     async def on_update(self, update_event: UpdateEvent):
@@ -138,7 +145,9 @@ class StrategyBase(ABC):
         this runs on events: initiate / price / trn / order_receive
         - important: this does run on every trn and order receipt event, but not on price (default, but can choose)
         - this is intended behavior as update only needs to be called once
-            * if two trns received almost same time (e.g., 011, 022), event/wait/clear mechanism may not trigger twice
+            * events pending at a wakeup are combined into one call: update_event is a bitmask (e.g., PRICE_UPDATE | TRN_RECEIVE)
+            * check with `in` (UpdateEvent.TRN_RECEIVE in update_event) rather than ==
+            * if two trns received almost same time (e.g., 011, 022), on_update may run once for both
             * on_update runs frequently anyway
         ----------------------------------------------------------------------------------------------------------------
         - strategy should be based on the snapshot(states) of the agent: pm 
@@ -272,4 +281,3 @@ class StrategyBase(ABC):
         return self.create_an_order(SIDE.SELL, MTYPE.LIMIT, quantity=quantity, price=price)
 
     # - may add middle too 
-
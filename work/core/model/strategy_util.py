@@ -1,6 +1,6 @@
-from enum import Enum, auto
+from enum import IntFlag, auto
 
-class UpdateEvent(Enum):   
+class UpdateEvent(IntFlag): # events pending at a wakeup are combined: e.g., PRICE_UPDATE | TRN_RECEIVE
     INITIATE = auto()
     PRICE_UPDATE = auto()
     TRN_RECEIVE = auto()
@@ -21,15 +21,16 @@ class VolumePurchase(StrategyBase):
         self.vl = kwargs.get('vl', 1.3)
         self.vs = kwargs.get('vs', 1.1)
 
-        self.bar_builer.reset(bar_delta=bar_delta)
+        if bar_delta is not None:
+            self.set_bar_delta(bar_delta)
         self.barlist.reset(num_bar=100) 
 
     def on_barlist_update(self):
-        p_lta = BarListAnalysis.get_last_to_avg(self.barlist.barlist, AnalysisTarget.PRICE)
-        p_st = BarListAnalysis.get_shifted_trend(self.barlist.barlist, AnalysisTarget.PRICE)
+        p_lta = BarListAnalysis.get_last_to_avg(self.barlist, AnalysisTarget.PRICE)
+        p_st = BarListAnalysis.get_shifted_trend(self.barlist, AnalysisTarget.PRICE)
 
-        v_lta = BarListAnalysis.get_last_to_avg(self.barlist.barlist, AnalysisTarget.VOLUME)
-        v_st = BarListAnalysis.get_shifted_trend(self.barlist.barlist, AnalysisTarget.VOLUME)
+        v_lta = BarListAnalysis.get_last_to_avg(self.barlist, AnalysisTarget.VOLUME)
+        v_st = BarListAnalysis.get_shifted_trend(self.barlist, AnalysisTarget.VOLUME)
 
         self.check_barlist_event(p_lta=p_lta, p_st=p_st, v_lta=v_lta, v_st=v_st, P_LTA_abs_pct=self.pl, P_ST_abs_pct=self.ps, V_LTA_th=self.vl, V_ST_th=self.vs)
         super().on_barlist_update()
@@ -38,12 +39,12 @@ class VolumePurchase(StrategyBase):
         if update_event != UpdateEvent.PRICE_UPDATE:
             self.logger.info(f"{self.code}-{update_event.name}", extra={"owner": self.agent_id})
         
-        if update_event == UpdateEvent.BARLIST_EVENT:
+        if UpdateEvent.BARLIST_EVENT in update_event:
             self.logger.info(self.barlist_status, extra={"owner": self.agent_id})
 
         if self.pm.pending_buy_qty > 0 or self.pm.pending_sell_qty > 0: return 
 
-        if update_event == UpdateEvent.BARLIST_EVENT:
+        if UpdateEvent.BARLIST_EVENT in update_event:
             if self.barlist_status.barlist_event == BarListEvent.BARLIST_BULL: 
                 self.logger.info(f"BUY 1", extra={"owner": self.agent_id})
                 sc = self.market_buy(quantity=1)